@@ -0,0 +1,79 @@
+#!/usr/bin/env bash
+
+# Creates parallel data for all 6 tag settings in both directions
+# (X -> EN and EN -> X) with a single pass over the dump, then binarizes
+# each corpus. Equivalent to running tag_ablation_create_data.sh followed
+# by tag_ablation_create_reverse_data.sh.
+
+set -euo pipefail
+
+# Get dataset parameters
+dump_tsv=$1
+n_workers=${2:-1}
+corpus_prefix=${3:-pn-tag-ablation}
+reverse_corpus_prefix=${corpus_prefix/pn-/pn-rev-}
+
+# Get max number of names
+max_names_per_lang_train=${4:-500000}
+max_names_per_lang_dev=${5:-5000}
+max_names_per_lang_test=${6:-5000}
+
+# Constants (change if needed)
+unicode_normalization="none"
+id_splits_random_seed=1917
+tag_conditions="none,script,lang,lang-type,lang-script,lang-type-script"
+
+# Binarize with fairseq-preprocess. Set to "no" to have prep_parallel_data.py
+# write the binarized data itself
+binarize_with_fairseq=${BINARIZE_WITH_FAIRSEQ:-yes}
+
+# Step 1: Prepare parallel data for every tag condition from one pass
+python scripts/prep_parallel_data.py \
+    --dump-file $dump_tsv \
+    --train-frac 0.8 \
+    --dev-frac 0.1 \
+    --test-frac 0.1 \
+    --normalization "$unicode_normalization" \
+    --output-folder data \
+    --filter-out-english \
+    --src-column label \
+    --tgt-column eng \
+    --wikidata-id-column "wikidata_id" \
+    --sampling-random-seed $id_splits_random_seed \
+    --max-names-per-lang-train $max_names_per_lang_train \
+    --max-names-per-lang-dev $max_names_per_lang_dev \
+    --max-names-per-lang-test $max_names_per_lang_test \
+    --workers $n_workers \
+    $([ "$binarize_with_fairseq" = "no" ] && echo "--binarized-output-folder data-bin")\
+    --tag-conditions $tag_conditions \
+    --corpus-prefix $corpus_prefix \
+    --reverse-corpus-prefix $reverse_corpus_prefix
+
+# Step 2: Binarize data (only needed with fairseq-preprocess)
+binarize () {
+    local folder=$1
+    local n_workers=$2
+
+    local bin_folder=data-bin/$(basename $(dirname $folder))/$(basename $folder)
+    mkdir -p $bin_folder
+    fairseq-preprocess \
+        --source-lang src --target-lang tgt \
+        --trainpref $folder/train \
+        --validpref $folder/dev \
+        --testpref $folder/test \
+        --destdir $bin_folder \
+        --workers $n_workers
+}
+
+if [ "$binarize_with_fairseq" = "yes" ]
+then
+    for prefix in $corpus_prefix $reverse_corpus_prefix
+    do
+        for tags in ${tag_conditions//,/ }
+        do
+            binarize data/${prefix}-${tags}/${unicode_normalization}_normalized_noeng $n_workers &
+        done
+    done
+
+    wait
+fi
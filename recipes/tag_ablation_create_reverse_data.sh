@@ -35,13 +35,21 @@ create_reverse_data () {
 
     bin_folder=data-bin/$(basename $(dirname $text_output_folder))/${unicode_normalization}_normalized_noeng
     mkdir -p $bin_folder
-    fairseq-preprocess \
-        --source-lang src --target-lang tgt \
-        --trainpref $text_output_folder/train \
-        --validpref $text_output_folder/dev \
-        --testpref $text_output_folder/test \
-        --destdir $bin_folder \
-        --workers $n_workers
+
+    if [ "${BINARIZE_WITH_FAIRSEQ:-yes}" = "yes" ]
+    then
+        fairseq-preprocess \
+            --source-lang src --target-lang tgt \
+            --trainpref $text_output_folder/train \
+            --validpref $text_output_folder/dev \
+            --testpref $text_output_folder/test \
+            --destdir $bin_folder \
+            --workers $n_workers
+    else
+        python scripts/binarize.py \
+            --input-folder $text_output_folder \
+            --output-folder $bin_folder
+    fi
 }
 
 for folder in ./data/pn-tag-ablation-{lang,script,none,lang-type,lang-script,lang-type-script}
@@ -0,0 +1,624 @@
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from multiprocessing.connection import Connection
+from typing import Callable, Dict, Iterator, List, Tuple
+
+import click
+import numpy as np
+import pandas as pd
+
+from evaluate import ExperimentResults
+from prep_parallel_data import (
+    TAG_CONDITIONS,
+    ParallelCorpusWriter,
+    add_split_column,
+    convert_dump_into_lines,
+    convert_dump_into_rows,
+    most_common_scripts,
+    parse_tag_condition,
+    segment_characters,
+    write_corpora,
+)
+from util import open_text, orjson_dump, read
+
+"""Benchmarks data prep and evaluation on synthetic ParaNames-like data
+
+`generate` writes a seeded synthetic dump, with a skewed mix of languages,
+scripts and entity types and script-dependent name lengths, and matching
+reference/hypothesis files. Both are written chunk by chunk, so any number
+of rows can be generated; benchmarking them needs enough memory to hold
+the dump in a DataFrame, as `prep_parallel_data.py` does.
+
+`run` times and memory-profiles the main steps of data prep and
+evaluation on such data and appends one JSON line per benchmark to a
+results file, tagged with the commit. `compare` reports the changes
+between two results files, e.g. those of two commits.
+"""
+
+# Letters of each script as (first code point, number of code points),
+# and the mean length of names written in it
+SCRIPTS = {
+    "Latin": (0x61, 26, 11),
+    "Cyrillic": (0x430, 32, 11),
+    "Greek": (0x3B1, 25, 11),
+    "Arabic": (0x627, 20, 8),
+    "Hebrew": (0x5D0, 27, 7),
+    "Devanagari": (0x915, 37, 8),
+    "Armenian": (0x561, 38, 10),
+    "Georgian": (0x10D0, 33, 10),
+    "Thai": (0xE01, 46, 9),
+    "Hangul": (0xAC00, 11172, 3),
+    "Katakana": (0x30A1, 90, 6),
+    "Han": (0x4E00, 20902, 3),
+}
+
+# Languages by decreasing number of names, which follows a Zipf law
+LANGUAGES = [
+    ("en", "Latin"),
+    ("de", "Latin"),
+    ("fr", "Latin"),
+    ("ru", "Cyrillic"),
+    ("es", "Latin"),
+    ("ar", "Arabic"),
+    ("ja", "Katakana"),
+    ("zh", "Han"),
+    ("uk", "Cyrillic"),
+    ("fa", "Arabic"),
+    ("nl", "Latin"),
+    ("he", "Hebrew"),
+    ("ko", "Hangul"),
+    ("el", "Greek"),
+    ("hi", "Devanagari"),
+    ("bg", "Cyrillic"),
+    ("hy", "Armenian"),
+    ("ka", "Georgian"),
+    ("ur", "Arabic"),
+    ("th", "Thai"),
+    ("sr", "Cyrillic"),
+    ("mr", "Devanagari"),
+]
+LANGUAGE_WEIGHTS = 1 / np.arange(1, len(LANGUAGES) + 1) ** 1.1
+LANGUAGE_CODES = np.array([lang for lang, _ in LANGUAGES])
+
+SCRIPT_TABLE = np.array(list(SCRIPTS.values()))
+LANGUAGE_SCRIPTS = np.array([list(SCRIPTS).index(script) for _, script in LANGUAGES])
+LATIN = list(SCRIPTS).index("Latin")
+
+ENTITY_TYPES = ["PER", "LOC", "ORG"]
+ENTITY_TYPE_WEIGHTS = [0.6, 0.3, 0.1]
+
+# Mean number of labels of an entity besides the first one
+MEAN_EXTRA_LABELS = 2
+MAX_NAME_LENGTH = 32
+SPACE_RATE = 0.08
+
+BENCHMARKS = [
+    "add_split_column",
+    "convert_dump_into_lines",
+    "most_common_icu_script",
+    "write_parallel_lines",
+    "ExperimentResults",
+]
+
+
+def random_name_codes(
+    rng: np.random.Generator, scripts: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Code points of one random name in each of `scripts`, given as indices
+    into `SCRIPTS`, padded with zeros to `MAX_NAME_LENGTH`, and the length
+    of each name"""
+
+    starts, sizes, mean_lengths = SCRIPT_TABLE[scripts].T
+    n = len(scripts)
+    positions = np.arange(MAX_NAME_LENGTH)
+    lengths = np.clip(rng.poisson(mean_lengths), 2, MAX_NAME_LENGTH)
+
+    codes = starts[:, None] + (
+        rng.random((n, MAX_NAME_LENGTH)) * sizes[:, None]
+    ).astype(np.int64)
+
+    # Some inner characters separate words, never two in a row
+    spaces = (
+        (rng.random((n, MAX_NAME_LENGTH)) < SPACE_RATE)
+        & (positions > 0)
+        & (positions < lengths[:, None] - 1)
+    )
+    spaces[:, 1:] &= ~spaces[:, :-1]
+    codes[spaces] = ord(" ")
+    codes[positions >= lengths[:, None]] = 0
+
+    return codes, lengths
+
+
+def as_strings(codes: np.ndarray) -> np.ndarray:
+    return codes.astype("<u4").view(f"<U{MAX_NAME_LENGTH}").ravel()
+
+
+def synthetic_dump_chunk(
+    rng: np.random.Generator, first_entity: int, n_entities: int
+) -> pd.DataFrame:
+    """Labels of `n_entities` entities in random languages, one row each,
+    with the columns of the ParaNames dump"""
+
+    n_labels = 1 + rng.poisson(MEAN_EXTRA_LABELS, n_entities)
+    entities = np.repeat(np.arange(n_entities), n_labels)
+    languages = rng.choice(
+        len(LANGUAGES), size=len(entities), p=LANGUAGE_WEIGHTS / LANGUAGE_WEIGHTS.sum()
+    )
+    eng_codes, _ = random_name_codes(rng, np.full(n_entities, LATIN))
+    label_codes, _ = random_name_codes(rng, LANGUAGE_SCRIPTS[languages])
+    eng = as_strings(eng_codes)[entities]
+    labels = as_strings(label_codes)
+
+    # English labels are the English names themselves
+    is_english = languages == 0
+    labels[is_english] = eng[is_english]
+
+    return pd.DataFrame(
+        {
+            "wikidata_id": [f"Q{first_entity + entity}" for entity in entities],
+            "eng": eng,
+            "label": labels,
+            "language": LANGUAGE_CODES[languages],
+            "type": rng.choice(ENTITY_TYPES, size=n_entities, p=ENTITY_TYPE_WEIGHTS)[
+                entities
+            ],
+        }
+    )
+
+
+def synthetic_dump(
+    n_rows: int, seed: int, chunk_size: int = 100000
+) -> Iterator[pd.DataFrame]:
+    """Streams `n_rows` rows of a synthetic dump, about `chunk_size` at a
+    time"""
+
+    rng = np.random.default_rng(seed)
+    first_entity = 0
+    n_left = n_rows
+
+    while n_left > 0:
+        n_entities = max(1, min(chunk_size, n_left) // (1 + MEAN_EXTRA_LABELS))
+        chunk = synthetic_dump_chunk(rng, first_entity, n_entities)
+        first_entity += n_entities
+        n_left -= len(chunk)
+
+        yield chunk.iloc[: len(chunk) + min(n_left, 0)]
+
+
+def write_synthetic_dump(dump_file: str, n_rows: int, seed: int) -> None:
+    os.makedirs(os.path.dirname(os.path.abspath(dump_file)), exist_ok=True)
+
+    with open_text(dump_file, "w") as f:
+        for ix, chunk in enumerate(synthetic_dump(n_rows, seed)):
+            chunk.to_csv(f, sep="\t", index=False, header=ix == 0)
+
+
+def write_synthetic_outputs(
+    prefix: str,
+    n_lines: int,
+    seed: int,
+    exact_match_rate: float = 0.3,
+    chunk_size: int = 100000,
+) -> None:
+    """Writes `{prefix}.{gold,hyps,source,languages}` like those of an
+    evaluation, where hypotheses are references with 1 to 3 wrong letters
+    except for `exact_match_rate` of them"""
+
+    os.makedirs(os.path.dirname(os.path.abspath(prefix)), exist_ok=True)
+    rng = np.random.default_rng(seed)
+    files = {
+        ext: open_text(f"{prefix}.{ext}", "w")
+        for ext in ["gold", "hyps", "source", "languages"]
+    }
+    weights = LANGUAGE_WEIGHTS[1:] / LANGUAGE_WEIGHTS[1:].sum()
+
+    for start in range(0, n_lines, chunk_size):
+        n = min(chunk_size, n_lines - start)
+        languages = rng.choice(len(LANGUAGES) - 1, size=n, p=weights) + 1
+        source_codes, _ = random_name_codes(rng, LANGUAGE_SCRIPTS[languages])
+        reference_codes, lengths = random_name_codes(rng, np.full(n, LATIN))
+        hypothesis_codes = reference_codes.copy()
+        n_errors = np.where(
+            rng.random(n) < exact_match_rate, 0, rng.integers(1, 4, size=n)
+        )
+
+        for error in range(3):
+            rows = np.flatnonzero(n_errors > error)
+            positions = (rng.random(len(rows)) * lengths[rows]).astype(np.int64)
+            hypothesis_codes[rows, positions] = rng.integers(
+                ord("a"), ord("z") + 1, size=len(rows)
+            )
+
+        language_codes = LANGUAGE_CODES[languages]
+        sources = [
+            f"<{lang}> {chars}"
+            for lang, chars in zip(
+                language_codes, segment_characters(as_strings(source_codes))
+            )
+        ]
+
+        for ext, lines in [
+            ("gold", segment_characters(as_strings(reference_codes))),
+            ("hyps", segment_characters(as_strings(hypothesis_codes))),
+            ("source", sources),
+            ("languages", language_codes),
+        ]:
+            files[ext].write("".join(f"{line}\n" for line in lines))
+
+    for f in files.values():
+        f.close()
+
+
+def synthetic_data_paths(work_dir: str, n_rows: int, seed: int) -> Tuple[str, str]:
+    """Generates the dump and outputs for `n_rows` in `work_dir` unless they
+    already exist, and returns the dump file and the outputs prefix"""
+
+    os.makedirs(work_dir, exist_ok=True)
+    dump_file = os.path.join(work_dir, f"dump.{n_rows}.{seed}.tsv")
+    outputs_prefix = os.path.join(work_dir, f"outputs.{n_rows}.{seed}")
+
+    if not os.path.exists(dump_file):
+        write_synthetic_dump(f"{dump_file}.tmp", n_rows, seed)
+        os.replace(f"{dump_file}.tmp", dump_file)
+
+    if not os.path.exists(f"{outputs_prefix}.languages"):
+        write_synthetic_outputs(outputs_prefix, n_rows, seed)
+
+    return dump_file, outputs_prefix
+
+
+def measure(func: Callable[[], object], repeats: int, profile_memory: bool) -> dict:
+    """Best and mean time of `repeats` calls, then the peak of memory
+    allocated by Python and numpy during one more call, which tracemalloc
+    slows down"""
+
+    timings = []
+
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+
+    measurements = {"seconds": min(timings), "mean_seconds": float(np.mean(timings))}
+
+    if profile_memory:
+        tracemalloc.start()
+        func()
+        measurements["peak_traced_mb"] = tracemalloc.get_traced_memory()[1] / 2**20
+        tracemalloc.stop()
+
+    return measurements
+
+
+def write_all_tag_conditions(output_rows: Dict[str, list], output_folder: str) -> None:
+    """Writes one corpus per tag condition, like `write_tag_conditions`"""
+
+    writers = []
+
+    for tags in TAG_CONDITIONS:
+        include_language_tag, include_script_tag, include_type_tag = (
+            parse_tag_condition(tags)
+        )
+        corpus_folder = os.path.join(output_folder, tags)
+        os.makedirs(corpus_folder, exist_ok=True)
+        writers.append(
+            ParallelCorpusWriter(
+                corpus_folder,
+                include_language_tag=include_language_tag,
+                include_script_tag=include_script_tag,
+                include_type_tag=include_type_tag,
+            )
+        )
+
+    try:
+        write_corpora(output_rows, writers)
+    finally:
+        for writer in writers:
+            writer.close()
+
+
+def read_split_dump(dump_file: str) -> pd.DataFrame:
+    """Reads a synthetic dump and splits it, as `prep_parallel_data.py` does
+    before conversion"""
+
+    dump, _ = add_split_column(
+        read(dump_file, "tsv"),
+        wikidata_id_column="wikidata_id",
+        split_column="split",
+        train_frac=0.8,
+        dev_frac=0.1,
+        test_frac=0.1,
+    )
+
+    return dump
+
+
+def benchmark_function(
+    name: str,
+    dump_file: str,
+    outputs_prefix: str,
+    output_folder: str,
+    workers: int,
+) -> Callable[[], object]:
+    """What benchmark `name` runs, with only its own inputs prepared
+    beforehand"""
+
+    if name == "ExperimentResults":
+        return lambda: ExperimentResults.from_paths(
+            references_path=f"{outputs_prefix}.gold",
+            hypotheses_path=f"{outputs_prefix}.hyps",
+            source_path=f"{outputs_prefix}.source",
+            languages_path=f"{outputs_prefix}.languages",
+            workers=workers,
+        )
+
+    dump = read_split_dump(dump_file)
+    dump_columns = dict(
+        language_column="language",
+        type_column="type",
+        src_column="label",
+        tgt_column="eng",
+        wikidata_id_column="wikidata_id",
+    )
+    max_names = dict(
+        max_names_per_lang_train=100000,
+        max_names_per_lang_dev=5000,
+        max_names_per_lang_test=5000,
+    )
+
+    if name == "add_split_column":
+        return lambda: add_split_column(
+            dump,
+            wikidata_id_column="wikidata_id",
+            split_column="split",
+            train_frac=0.8,
+            dev_frac=0.1,
+            test_frac=0.1,
+        )
+    elif name == "convert_dump_into_lines":
+        return lambda: convert_dump_into_lines(
+            dump, **dump_columns, **max_names, workers=workers
+        )
+    elif name == "most_common_icu_script":
+        labels = pd.unique(dump["label"]).tolist()
+
+        return lambda: most_common_scripts(labels)
+    else:
+        output_rows, _ = convert_dump_into_rows(dump, **dump_columns, **max_names)
+
+        return lambda: write_all_tag_conditions(output_rows, output_folder)
+
+
+def max_rss_mb(who: int = resource.RUSAGE_SELF) -> float:
+    """Peak resident set size, which `ru_maxrss` gives in bytes on macOS and
+    in KiB elsewhere"""
+
+    max_rss = resource.getrusage(who).ru_maxrss
+
+    return max_rss / 2**20 if sys.platform == "darwin" else max_rss / 2**10
+
+
+def measure_benchmark(
+    name: str,
+    dump_file: str,
+    outputs_prefix: str,
+    output_folder: str,
+    workers: int,
+    repeats: int,
+    profile_memory: bool,
+    connection: Connection,
+) -> None:
+    """Runs in a fresh process per benchmark, since the peak RSS of a process
+    never goes down. Sends back the measurements along with the peak RSS
+    after preparing the inputs and after running, and that of the pool
+    workers."""
+
+    func = benchmark_function(name, dump_file, outputs_prefix, output_folder, workers)
+    setup_max_rss_mb = max_rss_mb()
+    measurements = measure(func, repeats, profile_memory)
+    connection.send(
+        {
+            **measurements,
+            "setup_max_rss_mb": setup_max_rss_mb,
+            "max_rss_mb": max_rss_mb(),
+            "max_worker_rss_mb": max_rss_mb(resource.RUSAGE_CHILDREN),
+        }
+    )
+
+
+def run_benchmark(name: str, *args) -> dict:
+    """Measures benchmark `name` in its own process, see `measure_benchmark`"""
+
+    context = multiprocessing.get_context("spawn")
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(
+        target=measure_benchmark, args=(name, *args, sender), name=name
+    )
+    process.start()
+    sender.close()
+
+    try:
+        measurements = receiver.recv()
+    except EOFError:
+        measurements = None
+
+    process.join()
+
+    if measurements is None:
+        raise click.ClickException(
+            f"Benchmark {name} failed with exit code {process.exitcode}"
+        )
+
+    return measurements
+
+
+def current_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def latest_results(results_file: str) -> pd.DataFrame:
+    """Last result of each benchmark and size in a results file"""
+
+    results = read(results_file, "jsonl")
+
+    return results.groupby(["benchmark", "n_rows"], sort=True).last()
+
+
+@click.group()
+def main():
+    """Synthetic benchmarks of data prep and evaluation"""
+
+
+@main.command()
+@click.option("--n-rows", type=int, default=100000)
+@click.option("--seed", type=int, default=1917)
+@click.option("--dump-file", required=True, help="Compressed if it ends in .gz/.zst")
+@click.option(
+    "--outputs-prefix",
+    default="",
+    help="Also write {prefix}.{gold,hyps,source,languages} with as many lines",
+)
+def generate(n_rows: int, seed: int, dump_file: str, outputs_prefix: str):
+    """Writes a synthetic dump, and optionally evaluation outputs"""
+
+    write_synthetic_dump(dump_file, n_rows, seed)
+
+    if outputs_prefix:
+        write_synthetic_outputs(outputs_prefix, n_rows, seed)
+
+
+@main.command()
+@click.option(
+    "--n-rows", type=int, multiple=True, default=[100000], help="Can be repeated"
+)
+@click.option("--seed", type=int, default=1917)
+@click.option(
+    "--benchmarks",
+    default=",".join(BENCHMARKS),
+    help=f"Comma-separated subset of {','.join(BENCHMARKS)}",
+)
+@click.option("--repeats", type=int, default=3)
+@click.option("--workers", type=int, default=1)
+@click.option("--no-memory", is_flag=True, help="Skip the tracemalloc run")
+@click.option(
+    "--work-dir",
+    default="",
+    help="Keeps the generated data here for later runs instead of a temporary folder",
+)
+@click.option("--results-file", default="benchmark_results.jsonl")
+def run(
+    n_rows: List[int],
+    seed: int,
+    benchmarks: str,
+    repeats: int,
+    workers: int,
+    no_memory: bool,
+    work_dir: str,
+    results_file: str,
+):
+    """Times and memory-profiles each benchmark at each size and appends the
+    results to --results-file as JSON lines"""
+
+    selected = [name.strip() for name in benchmarks.split(",")]
+    unknown = set(selected) - set(BENCHMARKS)
+
+    if unknown:
+        raise click.UsageError(f"Unknown benchmarks: {unknown}")
+
+    commit = current_commit()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for n in n_rows:
+            dump_file, outputs_prefix = synthetic_data_paths(
+                work_dir or tmp_dir, n, seed
+            )
+
+            for name in selected:
+                result = {
+                    "benchmark": name,
+                    "n_rows": n,
+                    "seed": seed,
+                    "workers": workers,
+                    "repeats": repeats,
+                    **run_benchmark(
+                        name,
+                        dump_file,
+                        outputs_prefix,
+                        os.path.join(tmp_dir, "corpora"),
+                        workers,
+                        repeats,
+                        not no_memory,
+                    ),
+                    "commit": commit,
+                    "python": platform.python_version(),
+                    "timestamp": datetime.now(timezone.utc).isoformat(),
+                }
+                print(f"{name}\t{n}\t{result['seconds']:.3f}s")
+
+                with open(results_file, "a", encoding="utf-8") as f:
+                    f.write(f"{orjson_dump(result)}\n")
+
+
+@main.command()
+@click.option("--baseline", required=True, help="Results file of the baseline")
+@click.option("--candidate", required=True, help="Results file to compare")
+@click.option(
+    "--threshold",
+    type=float,
+    default=1.1,
+    help="Fail if a benchmark takes this many times longer or more memory",
+)
+def compare(baseline: str, candidate: str, threshold: float):
+    """Compares the latest results of each benchmark and size in two results
+    files"""
+
+    columns = ["seconds", "peak_traced_mb"]
+    # Results of runs with --no-memory have no peak_traced_mb
+    comparison = (
+        latest_results(baseline)
+        .reindex(columns=columns)
+        .join(
+            latest_results(candidate).reindex(columns=columns),
+            lsuffix="_baseline",
+            rsuffix="_candidate",
+            how="inner",
+        )
+    )
+
+    for column in columns:
+        comparison[f"{column}_ratio"] = (
+            comparison[f"{column}_candidate"] / comparison[f"{column}_baseline"]
+        )
+
+    print(comparison.round(3).to_csv(sep="\t"))
+
+    regressions = comparison[
+        (comparison[[f"{column}_ratio" for column in columns]] >= threshold).any(axis=1)
+    ]
+
+    if not regressions.empty:
+        raise click.ClickException(
+            f"{len(regressions)} benchmarks regressed by {threshold}x or more"
+        )
+
+
+if __name__ == "__main__":
+    main()
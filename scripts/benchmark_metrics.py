@@ -0,0 +1,119 @@
+import random
+import time
+from typing import Callable, List, Tuple
+
+import click
+import jiwer
+import numpy as np
+
+from evaluate import edit_statistics, pair_f1
+
+"""Benchmarks the edit distance based metrics of evaluate.py
+
+Compares the pairwise path (`jiwer.wer` for CER, then `pair_f1` and string
+comparisons pair by pair) against `edit_statistics`, which shares one
+character-level distance between F1 and accuracy and computes distances in
+batches, on synthetic space-separated names. Also checks that both give
+exactly the same scores.
+"""
+
+ALPHABETS = [
+    "abcdefghijklmnopqrstuvwxyz",
+    "αβγδεζηθικλμνξοπρστυφχψω",
+    "абвгдежзийклмнопрстуфхцчшщъыьэюя",
+    "ابتثجحخدذرزسشصضطظعغفقكلمنهوي",
+    "אבגדהוזחטיכלמנסעפצקרשת",
+]
+
+
+def synthetic_pairs(
+    n_pairs: int, exact_match_rate: float, seed: int
+) -> Tuple[List[str], List[str]]:
+    """Space-separated reference names and noisy hypotheses"""
+
+    rng = random.Random(seed)
+    references = []
+    hypotheses = []
+
+    for _ in range(n_pairs):
+        alphabet = rng.choice(ALPHABETS)
+        reference = [rng.choice(alphabet) for _ in range(rng.randint(2, 20))]
+        hypothesis = list(reference)
+
+        if rng.random() > exact_match_rate:
+            for _ in range(rng.randint(1, 4)):
+                ix = rng.randrange(len(hypothesis) + 1)
+                op = rng.choice(["sub", "ins", "del"])
+
+                if op == "ins" or not hypothesis:
+                    hypothesis.insert(ix, rng.choice(alphabet))
+                elif op == "sub":
+                    hypothesis[min(ix, len(hypothesis) - 1)] = rng.choice(alphabet)
+                else:
+                    del hypothesis[min(ix, len(hypothesis) - 1)]
+
+        references.append(" ".join(reference))
+        hypotheses.append(" ".join(hypothesis))
+
+    return references, hypotheses
+
+
+def pairwise_scores(
+    references: List[str], hypotheses: List[str]
+) -> Tuple[float, float, float]:
+    character_error_rate = jiwer.wer(references, hypotheses)
+    word_acc = np.mean([int(r == h) for r, h in zip(references, hypotheses)])
+    mean_f1 = np.mean([pair_f1(r, h) for r, h in zip(references, hypotheses)])
+
+    return character_error_rate, word_acc, mean_f1
+
+
+def batched_scores(
+    references: List[str], hypotheses: List[str]
+) -> Tuple[float, float, float]:
+    errors, reference_lengths, exact_matches, f1 = edit_statistics(
+        references, hypotheses
+    )
+    character_error_rate = float(errors.sum()) / float(reference_lengths.sum())
+
+    return character_error_rate, np.mean(exact_matches), np.mean(f1)
+
+
+def best_time(
+    func: Callable, references: List[str], hypotheses: List[str], repeats: int
+) -> Tuple[float, Tuple[float, float, float]]:
+    timings = []
+
+    for _ in range(repeats):
+        start = time.perf_counter()
+        scores = func(references, hypotheses)
+        timings.append(time.perf_counter() - start)
+
+    return min(timings), scores
+
+
+@click.command()
+@click.option("--n-pairs", type=int, default=500000)
+@click.option("--exact-match-rate", type=float, default=0.3)
+@click.option("--repeats", type=int, default=3)
+@click.option("--seed", type=int, default=1917)
+def main(n_pairs: int, exact_match_rate: float, repeats: int, seed: int):
+    references, hypotheses = synthetic_pairs(n_pairs, exact_match_rate, seed)
+
+    pairwise_time, pairwise = best_time(
+        pairwise_scores, references, hypotheses, repeats
+    )
+    batched_time, batched = best_time(batched_scores, references, hypotheses, repeats)
+
+    for name, expected, actual in zip(["CER", "Accuracy", "F1"], pairwise, batched):
+        if expected != actual:
+            raise ValueError(f"{name} differs: {expected} (pairwise) != {actual}")
+
+    print(f"Pairs\t{n_pairs}")
+    print(f"Pairwise\t{pairwise_time:.3f}s")
+    print(f"Batched\t{batched_time:.3f}s")
+    print(f"Speedup\t{pairwise_time / batched_time:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
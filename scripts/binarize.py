@@ -0,0 +1,30 @@
+#!/usr/bin/env python
+
+import os
+
+import click
+
+from util.binarize import binarize_corpus
+
+
+@click.command()
+@click.option(
+    "--input-folder",
+    type=click.Path(file_okay=False, dir_okay=True, exists=True),
+    help="Folder with {train,dev,test}.{src,tgt}, optionally gzip/zstd compressed",
+)
+@click.option(
+    "--output-folder",
+    type=click.Path(file_okay=False, dir_okay=True),
+    help="Folder to write fairseq binarized data to",
+)
+def main(input_folder: str, output_folder: str) -> None:
+    """Drop-in replacement for `fairseq-preprocess --source-lang src
+    --target-lang tgt` with default settings."""
+
+    os.makedirs(output_folder, exist_ok=True)
+    binarize_corpus(input_folder, output_folder)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,44 @@
+import csv
+import glob
+import hashlib
+import json
+import math
+import os
+import re
 import sys
 from collections import defaultdict
-from typing import Dict, List, Optional, Set, TextIO, Tuple
+from functools import partial
+from typing import (
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    TextIO,
+    Tuple,
+)
 
 import attr
 import click
 import editdistance
-import jiwer
 import numpy as np
 import pandas as pd
+import pyarrow as pa
 import sacrebleu
+from sacrebleu.metrics import BLEU
+from sacrebleu.metrics.bleu import MAX_NGRAM_ORDER
 from tqdm import tqdm
 
-from util import read as read_df
+from util import (
+    chunks,
+    file_content_hash,
+    iter_records,
+    parallel_map,
+    prune_cache,
+)
 
 """Evaluate 2.0
 
@@ -28,12 +55,305 @@ is computed using Levenshtein distance.
 All scores are normalized to lie in the range [0, 1].
 """
 
+MULTIPLE_SPACES = re.compile(r"\s\s+")
+
+# Experiment folders are named {corpus}-seed{seed}
+EXPERIMENT_SEED = re.compile(r"^(.*)-seed(\d+)$")
+
+# Field holding the text in each kind of fairseq-generate line: source,
+# target (reference) and hypothesis, which comes after its score
+FAIRSEQ_GENERATE_COLUMNS = {"T": 1, "H": 2, "S": 1}
+
+# Language of sources without a `<lang>` tag when no languages file is given,
+# e.g. with the none and script-only tag conditions
+UNKNOWN_LANGUAGE = "unknown"
+
+# Bump to invalidate cached results when the metrics change
+RESULT_CACHE_VERSION = 1
+
+# Hypothesis and reference lengths, then n-gram matches and totals
+N_BLEU_STATISTICS = 2 + 2 * MAX_NGRAM_ORDER
+
 
 def read_text(path: str) -> TextIO:
     return open(path, encoding="utf-8")
 
 
-@attr.s(kw_only=True)  # kw_only ensures we are explicit
+def records_from_paths(
+    references_path: str,
+    hypotheses_path: str,
+    source_path: str,
+    languages_path: str,
+) -> Iterator[Tuple[str, str, str, str]]:
+    """Streams (hypothesis, reference, source, language) from aligned files"""
+
+    with read_text(hypotheses_path) as hyp, read_text(
+        references_path
+    ) as ref, read_text(source_path) as src, read_text(languages_path) as langs:
+        for hyp_line, ref_line, src_line, langs_line in zip(hyp, ref, src, langs):
+            yield (
+                hyp_line.strip(),
+                ref_line.strip(),
+                src_line.strip(),
+                langs_line.strip(),
+            )
+
+
+def records_from_combined_tsv(
+    combined_tsv_path: str,
+) -> Iterator[Tuple[str, str, str, str]]:
+    """Streams (hypothesis, reference, source, language) from a combined TSV
+    file, as plain strings like `records_from_paths`"""
+
+    return iter_records(
+        combined_tsv_path,
+        io_format="tsv",
+        columns=["hyp", "ref", "src", "language"],
+        column_names=["ref", "hyp", "src", "language"],
+        as_tuples=True,
+        na_values=[],
+        quoting=csv.QUOTE_NONE,
+    )
+
+
+def read_fairseq_generate(generate_path: str) -> Tuple[List[str], List[str], List[str]]:
+    """Reads the references, hypotheses and sources of `fairseq-generate`
+    output (`-` for stdin) in one pass, ordered by sentence id.
+
+    Only the first, i.e. best, hypothesis of each sentence is kept.
+    """
+
+    lines = {kind: ([], []) for kind in FAIRSEQ_GENERATE_COLUMNS}
+    generate_file = sys.stdin if generate_path == "-" else read_text(generate_path)
+
+    with generate_file:
+        for line in generate_file:
+            kind, _, rest = line.partition("-")
+
+            if kind not in lines or not rest[:1].isdigit():
+                continue
+
+            fields = rest.rstrip("\n").split("\t")
+            ids, texts = lines[kind]
+            ids.append(int(fields[0]))
+            texts.append(fields[FAIRSEQ_GENERATE_COLUMNS[kind]])
+
+    columns = []
+    sentence_ids = None
+
+    for kind, (ids, texts) in lines.items():
+        # Stable sort, so that the first of several hypotheses comes first
+        ids = np.array(ids, dtype=np.int64)
+        order = np.argsort(ids, kind="stable")
+        sorted_ids, first = np.unique(ids[order], return_index=True)
+
+        if sentence_ids is None:
+            sentence_ids = sorted_ids
+        elif not np.array_equal(sentence_ids, sorted_ids):
+            raise ValueError(f"{generate_path}: {kind}- lines have other sentence ids")
+
+        columns.append([texts[ix] for ix in order[first]])
+
+    references, hypotheses, sources = columns
+
+    return references, hypotheses, sources
+
+
+def source_language(source: str) -> Optional[str]:
+    """Language of a source line from its leading `<lang>` tag, or `None` if
+    the source has no tag"""
+
+    tag = source.split(" ", 1)[0]
+
+    if not (tag.startswith("<") and tag.endswith(">")):
+        return None
+
+    return tag[1:-1]
+
+
+def write_lines(path: str, lines: Iterable[str]) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        for line in lines:
+            f.write(f"{line}\n")
+
+
+def records_from_fairseq_generate(
+    generate_path: str,
+    languages_path: str = "",
+    split_output_prefix: str = "",
+) -> Iterator[Tuple[str, str, str, str]]:
+    """Streams (hypothesis, reference, source, language) from the output of
+    `fairseq-generate`, like `records_from_paths` does from the files that
+    used to be extracted from it with grep and sort.
+
+    Languages are read from `languages_path` if given, otherwise from the
+    tag of each source. With a `split_output_prefix`, also writes those
+    `{prefix}.{gold,hyps,source,languages}` files and the TSV files pasting
+    them together.
+    """
+
+    references, hypotheses, sources = read_fairseq_generate(generate_path)
+
+    if languages_path:
+        with read_text(languages_path) as langs:
+            languages = [line.rstrip("\n") for line in langs]
+
+        if len(languages) != len(sources):
+            raise ValueError(
+                f"{languages_path} has {len(languages)} lines "
+                f"for {len(sources)} outputs"
+            )
+    else:
+        languages = [source_language(source) for source in sources]
+        n_untagged = languages.count(None)
+
+        if n_untagged:
+            print(
+                f"Warning: {n_untagged} of {len(sources)} sources have no language "
+                f"tag, scoring them as language '{UNKNOWN_LANGUAGE}'. "
+                "Pass a languages file to score them by language.",
+                file=sys.stderr,
+            )
+            languages = [
+                UNKNOWN_LANGUAGE if lang is None else lang for lang in languages
+            ]
+
+    if split_output_prefix:
+        for ext, lines in [
+            ("gold", references),
+            ("hyps", hypotheses),
+            ("source", sources),
+            ("languages", languages),
+        ]:
+            write_lines(f"{split_output_prefix}.{ext}", lines)
+
+        write_lines(
+            f"{split_output_prefix}_with_source.tsv",
+            map("\t".join, zip(references, hypotheses, sources)),
+        )
+        write_lines(
+            f"{split_output_prefix}_with_source_and_langs.tsv",
+            map("\t".join, zip(references, hypotheses, sources, languages)),
+        )
+
+    for hyp, ref, src, lang in zip(hypotheses, references, sources, languages):
+        yield hyp.strip(), ref.strip(), src.strip(), lang.strip()
+
+
+def group_indices(languages: Iterable[str]) -> Dict[str, List[int]]:
+    """Indices of each language, in order of first appearance"""
+
+    indices_by_language = defaultdict(list)
+
+    for ix, language in enumerate(languages):
+        indices_by_language[language].append(ix)
+
+    return indices_by_language
+
+
+def corpus_bleu_metric() -> BLEU:
+    """Same settings as `sacrebleu.corpus_bleu(..., force=True)`"""
+    return BLEU(force=True)
+
+
+def bleu_statistics(references: Sequence[str], hypotheses: Sequence[str]) -> np.ndarray:
+    """BLEU sufficient statistics of each output, laid out as (hypothesis
+    length, reference length, n-gram matches, n-gram totals)"""
+
+    metric = corpus_bleu_metric()
+    statistics = np.zeros((len(hypotheses), N_BLEU_STATISTICS), dtype=np.int64)
+
+    for ix, (hyp, ref) in enumerate(zip(hypotheses, references)):
+        score = metric.corpus_score([hyp], [[ref]])
+        statistics[ix] = [score.sys_len, score.ref_len, *score.counts, *score.totals]
+
+    return statistics
+
+
+def wer_tokens(line: str) -> List[str]:
+    """Splits `line` into tokens the same way as jiwer's default WER
+    transformation, so that edit distances match `jiwer.wer`."""
+    line = MULTIPLE_SPACES.sub(" ", line).strip()
+
+    return [token for token in line.split(" ") if token]
+
+
+def pair_f1(src: str, tgt: str) -> float:
+    """F1 of a single pair, from the longest common subsequence. Same as
+    `f1_scores` for one pair."""
+    lcs = 0.5 * ((len(src) + len(tgt)) - editdistance.eval(src, tgt))
+    rec = lcs / len(tgt) if tgt else 0
+    prec = lcs / len(src) if src else 0
+
+    try:
+        return 2 * ((rec * prec) / (rec + prec))
+    except ZeroDivisionError:
+        return 0
+
+
+def edit_distances(sources: Sequence, targets: Sequence) -> np.ndarray:
+    """Levenshtein distances between aligned sequences of strings or token
+    lists. Computed in one batched call to rapidfuzz if it is installed (it
+    comes with jiwer), or pair by pair with editdistance otherwise."""
+
+    try:
+        from rapidfuzz.distance import Levenshtein
+        from rapidfuzz.process import cpdist
+    except ImportError:
+        return np.array(
+            [editdistance.eval(s, t) for s, t in zip(sources, targets)],
+            dtype=np.int64,
+        )
+
+    return cpdist(sources, targets, scorer=Levenshtein.distance).astype(np.int64)
+
+
+def f1_scores(
+    distances: np.ndarray, source_lengths: np.ndarray, target_lengths: np.ndarray
+) -> np.ndarray:
+    """Vectorized `pair_f1` given the character edit distances and lengths"""
+
+    lcs = 0.5 * ((source_lengths + target_lengths) - distances)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rec = np.where(target_lengths > 0, lcs / target_lengths, 0.0)
+        prec = np.where(source_lengths > 0, lcs / source_lengths, 0.0)
+
+        return np.where(rec + prec > 0, 2 * ((rec * prec) / (rec + prec)), 0.0)
+
+
+def edit_statistics(
+    references: Sequence[str], hypotheses: Sequence[str]
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Edit distance based statistics of each (reference, hypothesis) pair:
+    token errors and number of reference tokens for CER, exact matches for
+    accuracy, and F1.
+
+    F1 and exact matches share one character-level distance. CER needs a
+    separate token-level distance, as in `jiwer.wer`: the names are
+    space-separated characters, and whitespace is normalized before
+    tokenizing.
+    """
+
+    reference_tokens = [wer_tokens(reference) for reference in references]
+    hypothesis_tokens = [wer_tokens(hypothesis) for hypothesis in hypotheses]
+    errors = edit_distances(reference_tokens, hypothesis_tokens)
+    reference_lengths = np.array(
+        [len(tokens) for tokens in reference_tokens], dtype=np.int64
+    )
+
+    distances = edit_distances(references, hypotheses)
+    exact_matches = (distances == 0).astype(np.int64)
+    f1 = f1_scores(
+        distances,
+        np.array([len(reference) for reference in references], dtype=np.int64),
+        np.array([len(hypothesis) for hypothesis in hypotheses], dtype=np.int64),
+    )
+
+    return errors, reference_lengths, exact_matches, f1
+
+
+@attr.s(kw_only=True, slots=True, frozen=True)  # kw_only ensures we are explicit
 class TransliterationOutput:
     """Represents a single transliteration output, consisting of a
     source language and line, reference transliteration and a model hypothesis.
@@ -45,6 +365,167 @@ class TransliterationOutput:
     source: str = attr.ib(default="")
 
 
+@attr.s(kw_only=True, frozen=True)
+class TransliterationOutputs:
+    """Column-wise collection of transliteration outputs.
+
+    Languages are stored as codes into `language_names`, which lists them
+    in order of first appearance, and the strings as Arrow string columns.
+    Indexing and iterating give `TransliterationOutput` views.
+    """
+
+    language_codes: np.ndarray = attr.ib()
+    language_names: List[str] = attr.ib()
+    references: pa.ChunkedArray = attr.ib()
+    hypotheses: pa.ChunkedArray = attr.ib()
+    sources: pa.ChunkedArray = attr.ib()
+
+    @classmethod
+    def from_records(
+        cls, records: Iterable[Tuple[str, str, str, str]], chunk_size: int = 100000
+    ) -> "TransliterationOutputs":
+        """Builds the columns from (hypothesis, reference, source, language)
+        records, `chunk_size` records at a time"""
+
+        language_codes = [np.empty(0, dtype=np.int32)]
+        language_names = []
+        codes_by_name = {}
+        hypotheses, references, sources = [], [], []
+
+        for chunk in chunks(records, chunk_size):
+            chunk_hypotheses, chunk_references, chunk_sources, languages = zip(*chunk)
+            hypotheses.append(pa.array(chunk_hypotheses, type=pa.string()))
+            references.append(pa.array(chunk_references, type=pa.string()))
+            sources.append(pa.array(chunk_sources, type=pa.string()))
+
+            codes = np.empty(len(languages), dtype=np.int32)
+
+            for ix, language in enumerate(languages):
+                if language not in codes_by_name:
+                    codes_by_name[language] = len(language_names)
+                    language_names.append(language)
+
+                codes[ix] = codes_by_name[language]
+
+            language_codes.append(codes)
+
+        return cls(
+            language_codes=np.concatenate(language_codes),
+            language_names=language_names,
+            references=pa.chunked_array(references, type=pa.string()),
+            hypotheses=pa.chunked_array(hypotheses, type=pa.string()),
+            sources=pa.chunked_array(sources, type=pa.string()),
+        )
+
+    @classmethod
+    def from_outputs(
+        cls, system_outputs: Iterable[TransliterationOutput]
+    ) -> "TransliterationOutputs":
+        return cls.from_records(
+            (o.hypothesis, o.reference, o.source, o.language) for o in system_outputs
+        )
+
+    def __len__(self) -> int:
+        return len(self.language_codes)
+
+    def __getitem__(self, ix: int) -> TransliterationOutput:
+        return TransliterationOutput(
+            language=self.language_names[self.language_codes[ix]],
+            reference=self.references[ix].as_py(),
+            hypothesis=self.hypotheses[ix].as_py(),
+            source=self.sources[ix].as_py(),
+        )
+
+    def __iter__(self) -> Iterator[TransliterationOutput]:
+        for start in range(0, len(self), 10000):
+            stop = start + 10000
+
+            for code, reference, hypothesis, source in zip(
+                self.language_codes[start:stop].tolist(),
+                self.references[start:stop].to_pylist(),
+                self.hypotheses[start:stop].to_pylist(),
+                self.sources[start:stop].to_pylist(),
+            ):
+                yield TransliterationOutput(
+                    language=self.language_names[code],
+                    reference=reference,
+                    hypothesis=hypothesis,
+                    source=source,
+                )
+
+    def pairs(self, chunk_size: int = 10000) -> Iterator[Tuple[List[str], List[str]]]:
+        """Yields the references and hypotheses, `chunk_size` at a time"""
+
+        for start in range(0, len(self), chunk_size):
+            yield (
+                self.references[start : start + chunk_size].to_pylist(),
+                self.hypotheses[start : start + chunk_size].to_pylist(),
+            )
+
+    def take(self, indices: np.ndarray) -> "TransliterationOutputs":
+        """Outputs at `indices`, sharing `language_names`"""
+
+        arrow_indices = pa.array(indices, type=pa.int64())
+
+        return TransliterationOutputs(
+            language_codes=self.language_codes[indices],
+            language_names=self.language_names,
+            references=self.references.take(arrow_indices),
+            hypotheses=self.hypotheses.take(arrow_indices),
+            sources=self.sources.take(arrow_indices),
+        )
+
+    def with_hypotheses(self, hypotheses: List[str]) -> "TransliterationOutputs":
+        """Same outputs with other `hypotheses`, sharing all other columns"""
+
+        if len(hypotheses) != len(self):
+            raise ValueError(
+                f"Expected {len(self)} hypotheses but got {len(hypotheses)}"
+            )
+
+        return attr.evolve(
+            self, hypotheses=pa.chunked_array([pa.array(hypotheses, type=pa.string())])
+        )
+
+    def same_test_set(self, other: "TransliterationOutputs") -> bool:
+        """Whether `other` has the same references and languages"""
+
+        return (
+            self.language_names == other.language_names
+            and np.array_equal(self.language_codes, other.language_codes)
+            and self.references.equals(other.references)
+        )
+
+    def unique_languages(self) -> List[str]:
+        return [self.language_names[code] for code in np.unique(self.language_codes)]
+
+    def group_by_language(self) -> Dict[str, np.ndarray]:
+        """Indices of the outputs of each language, from one stable sort of
+        the language codes"""
+
+        order = np.argsort(self.language_codes, kind="stable")
+        counts = np.bincount(self.language_codes, minlength=len(self.language_names))
+        groups = np.split(order, np.cumsum(counts)[:-1])
+
+        return {
+            language: indices
+            for language, indices in zip(self.language_names, groups)
+            if len(indices)
+        }
+
+
+def as_columns(
+    system_outputs: Iterable[TransliterationOutput],
+) -> TransliterationOutputs:
+    """Converter for `system_outputs` in the results classes, which also
+    accept a list of `TransliterationOutput`"""
+
+    if isinstance(system_outputs, TransliterationOutputs):
+        return system_outputs
+
+    return TransliterationOutputs.from_outputs(system_outputs)
+
+
 @attr.s(kw_only=True)
 class TransliterationMetrics:
     """Score container for a collection of transliteration results.
@@ -91,26 +572,165 @@ BLEU\t{bleu:.4f}\n\n""".format(
 
 
 @attr.s(kw_only=True)
-class TransliterationResults:
-    system_outputs: List[TransliterationOutput] = attr.ib(factory=list)
-    metrics: TransliterationMetrics = attr.ib(factory=TransliterationMetrics)
+class SentenceStatistics:
+    """Per-sentence statistics of a list of transliteration outputs, from
+    which all metrics are aggregated. Computed once, then shared by the
+    global and the per-language results.
+
+    Contains, for each output,
+    - the token-level edit distance and number of reference tokens (CER)
+    - whether the hypothesis matches the reference exactly (accuracy)
+    - the F1 score
+    - the sacrebleu n-gram match statistics (BLEU)
+    """
 
-    def __attrs_post_init__(self) -> None:
-        self.metrics = self.compute_metrics()
+    errors: np.ndarray = attr.ib()
+    reference_lengths: np.ndarray = attr.ib()
+    exact_matches: np.ndarray = attr.ib()
+    f1: np.ndarray = attr.ib()
+    bleu: np.ndarray = attr.ib()
 
-    def compute_metrics(self) -> TransliterationMetrics:
-        unique_languages = set([o.language for o in self.system_outputs])
+    @classmethod
+    def from_outputs(
+        cls,
+        system_outputs: Iterable[TransliterationOutput],
+        workers: int = 1,
+        chunk_size: int = 10000,
+    ) -> "SentenceStatistics":
+        """Statistics of `system_outputs`, computed `chunk_size` outputs at a
+        time, by `workers` processes if `workers` is more than 1."""
+
+        system_outputs = as_columns(system_outputs)
+
+        if not len(system_outputs):
+            return cls.from_pairs([], [])
+
+        parts = parallel_map(
+            pair_statistics,
+            system_outputs.pairs(chunk_size),
+            chunk_size=1,
+            workers=workers,
+            description="Scoring",
+            total=math.ceil(len(system_outputs) / chunk_size),
+            max_pending=2 * workers,
+        )
 
-        if len(unique_languages) > 1:
-            language = "global"
-        else:
-            language = list(unique_languages)[0]
+        return cls.concatenate(list(parts))
+
+    @classmethod
+    def from_pairs(
+        cls, references: Sequence[str], hypotheses: Sequence[str]
+    ) -> "SentenceStatistics":
+        errors, reference_lengths, exact_matches, f1 = edit_statistics(
+            references, hypotheses
+        )
+
+        return cls(
+            errors=errors,
+            reference_lengths=reference_lengths,
+            exact_matches=exact_matches,
+            f1=f1,
+            bleu=bleu_statistics(references, hypotheses),
+        )
+
+    @classmethod
+    def concatenate(cls, parts: List["SentenceStatistics"]) -> "SentenceStatistics":
+        return cls(
+            errors=np.concatenate([part.errors for part in parts]),
+            reference_lengths=np.concatenate(
+                [part.reference_lengths for part in parts]
+            ),
+            exact_matches=np.concatenate([part.exact_matches for part in parts]),
+            f1=np.concatenate([part.f1 for part in parts]),
+            bleu=np.concatenate([part.bleu for part in parts]),
+        )
+
+    def take(self, indices: List[int]) -> "SentenceStatistics":
+        """Statistics of the outputs at `indices`"""
 
-        character_error_rate = self.character_error_rate(self.system_outputs)
-        word_acc = 100 * self.word_accuracy(self.system_outputs)
+        return SentenceStatistics(
+            errors=self.errors[indices],
+            reference_lengths=self.reference_lengths[indices],
+            exact_matches=self.exact_matches[indices],
+            f1=self.f1[indices],
+            bleu=self.bleu[indices],
+        )
+
+    def sum(self) -> "SufficientStatistics":
+        # np.sum adds up F1 the same way as np.mean
+        return SufficientStatistics(
+            n_outputs=len(self.errors),
+            errors=int(self.errors.sum()),
+            reference_lengths=int(self.reference_lengths.sum()),
+            exact_matches=int(self.exact_matches.sum()),
+            f1=float(np.sum(self.f1)),
+            bleu=self.bleu.sum(axis=0),
+        )
+
+
+@attr.s(kw_only=True)
+class SufficientStatistics:
+    """Sums of `SentenceStatistics` over a collection of outputs, which is
+    all it takes to compute the metrics. Partial sums can be merged, so
+    outputs can be scored in chunks with constant memory."""
+
+    n_outputs: int = attr.ib(default=0)
+    errors: int = attr.ib(default=0)
+    reference_lengths: int = attr.ib(default=0)
+    exact_matches: int = attr.ib(default=0)
+    f1: float = attr.ib(default=0.0)
+    bleu: np.ndarray = attr.ib(
+        factory=lambda: np.zeros(N_BLEU_STATISTICS, dtype=np.int64)
+    )
+
+    def merge(self, other: "SufficientStatistics") -> "SufficientStatistics":
+        """Adds the statistics of `other` to these, in place"""
+
+        self.n_outputs += other.n_outputs
+        self.errors += other.errors
+        self.reference_lengths += other.reference_lengths
+        self.exact_matches += other.exact_matches
+        self.f1 += other.f1
+        self.bleu = self.bleu + other.bleu
+
+        return self
+
+    def character_error_rate(self) -> float:
+        # Same as `jiwer.wer` on the concatenated outputs, which returns
+        # the number of insertions if all references are empty
+        if self.reference_lengths == 0:
+            return self.errors
+
+        return float(self.errors) / float(self.reference_lengths)
+
+    def word_accuracy(self) -> float:
+        return self.exact_matches / self.n_outputs
+
+    def mean_f1(self) -> float:
+        return self.f1 / self.n_outputs
+
+    def bleu_score(self) -> float:
+        metric = corpus_bleu_metric()
+        sys_len, ref_len, *ngram_statistics = self.bleu.tolist()
+        bleu = BLEU.compute_bleu(
+            correct=ngram_statistics[:MAX_NGRAM_ORDER],
+            total=ngram_statistics[MAX_NGRAM_ORDER:],
+            sys_len=sys_len,
+            ref_len=ref_len,
+            smooth_method=metric.smooth_method,
+            smooth_value=metric.smooth_value,
+            effective_order=metric.effective_order,
+            max_ngram_order=MAX_NGRAM_ORDER,
+        )
+
+        return bleu.score / 100.0  # divide to normalize
+
+    def metrics(self, language: str) -> TransliterationMetrics:
+        character_error_rate = self.character_error_rate()
+        word_acc = 100 * self.word_accuracy()
         word_err = 100 - word_acc
-        bleu = 100 * self.bleu(self.system_outputs)
-        mean_f1 = 100 * self.mean_f1(self.system_outputs)
+        bleu = 100 * self.bleu_score()
+        mean_f1 = 100 * self.mean_f1()
 
         metrics = TransliterationMetrics(
             character_error_rate=character_error_rate,
@@ -123,54 +743,43 @@ class TransliterationResults:
 
         return metrics
 
-    def character_error_rate(
-        self, system_outputs: List[TransliterationOutput]
-    ) -> float:
-        # The names are strings of space-separated characters.
-        # Thus, to get CER on the original string, we compute WER
-        # on the space-separated tokens.
-        CER = jiwer.wer(
-            [o.reference for o in system_outputs],
-            [o.hypothesis for o in system_outputs],
-        )
 
-        return CER
+def pair_statistics(pairs: Tuple[List[str], List[str]]) -> SentenceStatistics:
+    """Worker for `SentenceStatistics.from_outputs`"""
+    references, hypotheses = pairs
 
-    def word_accuracy(self, system_outputs: List[TransliterationOutput]) -> float:
-        return np.mean([int(o.reference == o.hypothesis) for o in system_outputs])
+    return SentenceStatistics.from_pairs(references, hypotheses)
 
-    def bleu(self, system_outputs: List[TransliterationOutput]) -> float:
-        hypotheses = [o.hypothesis for o in system_outputs]
-        references = [[o.reference for o in system_outputs]]
-        bleu = sacrebleu.corpus_bleu(hypotheses, references, force=True)
 
-        return bleu.score / 100.0  # divide to normalize
+@attr.s(kw_only=True)
+class TransliterationResults:
+    system_outputs: TransliterationOutputs = attr.ib(factory=list, converter=as_columns)
+    metrics: TransliterationMetrics = attr.ib(factory=TransliterationMetrics)
+    statistics: Optional[SentenceStatistics] = attr.ib(default=None)
+
+    def __attrs_post_init__(self) -> None:
+        self.metrics = self.compute_metrics()
 
-    def mean_f1(self, system_outputs: List[TransliterationOutput]) -> float:
-        return np.mean([self.f1(o.reference, o.hypothesis) for o in system_outputs])
+    def compute_metrics(self) -> TransliterationMetrics:
+        unique_languages = self.system_outputs.unique_languages()
 
-    def f1(self, src: str, tgt: str) -> float:
-        def lcs(src: str, tgt: str) -> float:
-            lcs = 0.5 * ((len(src) + len(tgt)) - editdistance.eval(src, tgt))
+        if len(unique_languages) > 1:
+            language = "global"
+        else:
+            language = list(unique_languages)[0]
 
-            return lcs
+        if self.statistics is None:
+            self.statistics = SentenceStatistics.from_outputs(self.system_outputs)
 
-        try:
-            rec = lcs(src, tgt) / len(tgt)
-        except ZeroDivisionError:
-            rec = 0
-        prec = lcs(src, tgt) / len(src)
-        try:
-            return 2 * ((rec * prec) / (rec + prec))
-        except ZeroDivisionError:
-            return 0
+        return self.statistics.sum().metrics(language)
 
 
 @attr.s(kw_only=True)
 class ExperimentResults:
-    system_outputs: List[TransliterationOutput] = attr.ib(factory=list)
+    system_outputs: TransliterationOutputs = attr.ib(factory=list, converter=as_columns)
     languages: Set[str] = attr.ib(factory=set)
     grouped: bool = attr.ib(default=True)
+    workers: int = attr.ib(default=1)
     metrics_dict: Dict[str, TransliterationResults] = attr.ib(factory=dict)
 
     def __attrs_post_init__(self) -> None:
@@ -179,14 +788,26 @@ class ExperimentResults:
     def compute_metrics_dict(self) -> Dict[str, TransliterationResults]:
         metrics = {}
 
+        # Per-sentence statistics are computed once and aggregated both
+        # globally and for each language
+        statistics = SentenceStatistics.from_outputs(
+            self.system_outputs, workers=self.workers
+        )
+
         # first compute global metrics
-        metrics["global"] = TransliterationResults(system_outputs=self.system_outputs)
+        metrics["global"] = TransliterationResults(
+            system_outputs=self.system_outputs, statistics=statistics
+        )
 
-        # then compute one for each lang
+        # then compute one for each lang, grouping the outputs in one pass
+        indices_by_language = self.system_outputs.group_by_language()
 
         for lang in tqdm(self.languages, total=len(self.languages)):
-            filtered_outputs = [o for o in self.system_outputs if o.language == lang]
-            metrics[lang] = TransliterationResults(system_outputs=filtered_outputs)
+            indices = indices_by_language[lang]
+            metrics[lang] = TransliterationResults(
+                system_outputs=self.system_outputs.take(indices),
+                statistics=statistics.take(indices),
+            )
 
         return metrics
 
@@ -197,66 +818,31 @@ class ExperimentResults:
         hypotheses_path: str,
         source_path: str,
         languages_path: str,
-    ) -> Tuple[List[TransliterationOutput], Set[str]]:
-        with read_text(hypotheses_path) as hyp, read_text(
-            references_path
-        ) as ref, read_text(source_path) as src, read_text(languages_path) as langs:
-            languages = set()
-            system_outputs = []
-
-            for hyp_line, ref_line, src_line, langs_line in zip(hyp, ref, src, langs):
-                # grab hypothesis lines
-                hypothesis = hyp_line.strip()
-                reference = ref_line.strip()
-                source = src_line.strip()
-                language = langs_line.strip()
-                languages.add(language)
-                system_outputs.append(
-                    TransliterationOutput(
-                        language=language,
-                        reference=reference,
-                        hypothesis=hypothesis,
-                        source=source,
-                    )
-                )
+    ) -> Tuple[TransliterationOutputs, Set[str]]:
+        records = records_from_paths(
+            references_path=references_path,
+            hypotheses_path=hypotheses_path,
+            source_path=source_path,
+            languages_path=languages_path,
+        )
 
-            return system_outputs, languages
+        return cls.outputs_from_records(records)
 
     @classmethod
     def outputs_from_combined_tsv(
         cls, combined_tsv_path: str
-    ) -> Tuple[List[TransliterationOutput], Set[str]]:
-        combined_tsv = read_df(
-            combined_tsv_path,
-            io_format="tsv",
-            column_names=["ref", "hyp", "src", "language"],
-            quoting=3,
-        ).astype(str)
+    ) -> Tuple[TransliterationOutputs, Set[str]]:
+        return cls.outputs_from_records(
+            tqdm(records_from_combined_tsv(combined_tsv_path))
+        )
 
-        languages = set()
-        system_outputs = []
-
-        for hypothesis, reference, source, language in tqdm(
-            zip(
-                combined_tsv.hyp,
-                combined_tsv.ref,
-                combined_tsv.src,
-                combined_tsv.language,
-            ),
-            total=combined_tsv.shape[0],
-        ):
-            # grab hypothesis lines
-            languages.add(language)
-            system_outputs.append(
-                TransliterationOutput(
-                    language=language,
-                    reference=reference,
-                    hypothesis=hypothesis,
-                    source=source,
-                )
-            )
+    @classmethod
+    def outputs_from_records(
+        cls, records: Iterable[Tuple[str, str, str, str]]
+    ) -> Tuple[TransliterationOutputs, Set[str]]:
+        system_outputs = TransliterationOutputs.from_records(records)
 
-        return system_outputs, languages
+        return system_outputs, set(system_outputs.language_names)
 
     @classmethod
     def from_paths(
@@ -266,6 +852,7 @@ class ExperimentResults:
         source_path: str,
         languages_path: str,
         grouped: bool = True,
+        workers: int = 1,
     ):
         system_outputs, languages = cls.outputs_from_paths(
             references_path=references_path,
@@ -275,7 +862,10 @@ class ExperimentResults:
         )
 
         return ExperimentResults(
-            system_outputs=system_outputs, grouped=grouped, languages=languages
+            system_outputs=system_outputs,
+            grouped=grouped,
+            languages=languages,
+            workers=workers,
         )
 
     @classmethod
@@ -283,80 +873,818 @@ class ExperimentResults:
         cls,
         tsv_path: str,
         grouped: bool = True,
+        workers: int = 1,
     ):
         system_outputs, languages = cls.outputs_from_combined_tsv(tsv_path)
 
         return ExperimentResults(
-            system_outputs=system_outputs, grouped=grouped, languages=languages
+            system_outputs=system_outputs,
+            grouped=grouped,
+            languages=languages,
+            workers=workers,
         )
 
+    @classmethod
+    def from_records(
+        cls,
+        records: Iterable[Tuple[str, str, str, str]],
+        grouped: bool = True,
+        workers: int = 1,
+    ):
+        system_outputs, languages = cls.outputs_from_records(records)
+
+        return ExperimentResults(
+            system_outputs=system_outputs,
+            grouped=grouped,
+            languages=languages,
+            workers=workers,
+        )
+
+    def metrics(self, language: str) -> TransliterationMetrics:
+        return self.metrics_dict[language].metrics
+
     def as_data_frame(self):
         _languages = self.languages | set(["global"])
 
-        rows = [attr.asdict(self.metrics_dict[lang].metrics) for lang in _languages]
-        out = (
-            pd.DataFrame(rows)
-            .drop(columns=["rounding", "word_err", "bleu"])
-            .rename(
-                columns={
-                    "character_error_rate": "CER",
-                    "word_acc": "Accuracy",
-                    "mean_f1": "F1",
-                    "language": "Language",
-                }
-            )
-            .round(3)
+        return metrics_data_frame([self.metrics(lang) for lang in _languages])
+
+
+@attr.s(kw_only=True)
+class StreamingExperimentResults:
+    """Constant-memory counterpart to `ExperimentResults`. Reads the outputs
+    chunk by chunk and only keeps `SufficientStatistics` for each language.
+
+    Scores are the same as with `ExperimentResults`, except that F1 is summed
+    in a different order, which can change the mean in the last bits.
+    """
+
+    languages: Set[str] = attr.ib(factory=set)
+    statistics: Dict[str, SufficientStatistics] = attr.ib(factory=dict)
+
+    @classmethod
+    def from_records(
+        cls,
+        records: Iterable[Tuple[str, str, str, str]],
+        workers: int = 1,
+        chunk_size: int = 10000,
+    ) -> "StreamingExperimentResults":
+        languages = set()
+        statistics = {}
+
+        # Each item is a whole chunk, so at most 2 chunks per worker are
+        # held in memory at a time
+        for chunk_statistics in parallel_map(
+            language_statistics,
+            chunks(records, chunk_size),
+            chunk_size=1,
+            workers=workers,
+            description="Scoring",
+            max_pending=2 * workers,
+        ):
+            for language, language_sums in chunk_statistics.items():
+                languages.add(language)
+
+                if language in statistics:
+                    statistics[language].merge(language_sums)
+                else:
+                    statistics[language] = language_sums
+
+        return cls(languages=languages, statistics=statistics)
+
+    @classmethod
+    def from_paths(
+        cls,
+        references_path: str,
+        hypotheses_path: str,
+        source_path: str,
+        languages_path: str,
+        workers: int = 1,
+    ) -> "StreamingExperimentResults":
+        records = records_from_paths(
+            references_path=references_path,
+            hypotheses_path=hypotheses_path,
+            source_path=source_path,
+            languages_path=languages_path,
         )
 
-        return out
+        return cls.from_records(records, workers=workers)
+
+    @classmethod
+    def from_tsv(cls, tsv_path: str, workers: int = 1) -> "StreamingExperimentResults":
+        return cls.from_records(records_from_combined_tsv(tsv_path), workers=workers)
+
+    def metrics(self, language: str) -> TransliterationMetrics:
+        if language != "global":
+            return self.statistics[language].metrics(language)
+
+        total = SufficientStatistics()
+
+        for language_sums in self.statistics.values():
+            total.merge(language_sums)
+
+        # Like `TransliterationResults`, only call it global if there
+        # are several languages
+        if len(self.languages) == 1:
+            language = next(iter(self.languages))
+
+        return total.metrics(language)
+
+    def as_data_frame(self):
+        _languages = self.languages | set(["global"])
+
+        return metrics_data_frame([self.metrics(lang) for lang in _languages])
+
+
+def language_statistics(
+    records: Sequence[Tuple[str, str, str, str]],
+) -> Dict[str, SufficientStatistics]:
+    """Worker for `StreamingExperimentResults`: sums the statistics of a
+    chunk of records for each language"""
+
+    hypotheses, references, _, languages = zip(*records)
+    statistics = SentenceStatistics.from_pairs(references, hypotheses)
+
+    return {
+        language: statistics.take(indices).sum()
+        for language, indices in group_indices(languages).items()
+    }
+
+
+def metrics_data_frame(metrics: List[TransliterationMetrics]) -> pd.DataFrame:
+    rows = [attr.asdict(m) for m in metrics]
+    out = (
+        pd.DataFrame(rows)
+        .drop(columns=["rounding", "word_err", "bleu"])
+        .rename(
+            columns={
+                "character_error_rate": "CER",
+                "word_acc": "Accuracy",
+                "mean_f1": "F1",
+                "language": "Language",
+            }
+        )
+        .round(3)
+    )
+
+    return out
+
+
+@attr.s(kw_only=True)
+class CachedExperimentResults:
+    """Metrics of an experiment stored in the result cache, which can be
+    written out like those of `ExperimentResults`.
+
+    Each entry is a JSON file in the cache folder named after the key from
+    `result_cache_key`. Reading an entry touches it, so that `prune_cache`
+    evicts the least recently used ones.
+
+    Languages and metrics are kept in the order the original results list
+    them in, so that the scores are written out exactly the same.
+    """
+
+    languages: List[str] = attr.ib(factory=list)
+    metrics_dict: Dict[str, TransliterationMetrics] = attr.ib(factory=dict)
+
+    @classmethod
+    def from_results(cls, results: ExperimentResults) -> "CachedExperimentResults":
+        return cls(
+            languages=list(results.languages),
+            metrics_dict={
+                lang: results.metrics(lang)
+                for lang in results.languages | set(["global"])
+            },
+        )
+
+    @classmethod
+    def load(cls, cache_dir: str, key: str) -> Optional["CachedExperimentResults"]:
+        cache_file = os.path.join(cache_dir, f"{key}.json")
+
+        try:
+            with read_text(cache_file) as f:
+                entry = json.load(f)
+
+            os.utime(cache_file)
+        except FileNotFoundError:
+            return None
+
+        return cls(
+            languages=entry["languages"],
+            metrics_dict={
+                lang: TransliterationMetrics(**metrics)
+                for lang, metrics in entry["metrics"].items()
+            },
+        )
+
+    def save(self, cache_dir: str, key: str) -> None:
+        os.makedirs(cache_dir, exist_ok=True)
+        cache_file = os.path.join(cache_dir, f"{key}.json")
+        tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+        entry = {
+            "languages": self.languages,
+            "metrics": {
+                lang: attr.asdict(metrics)
+                for lang, metrics in self.metrics_dict.items()
+            },
+        }
+
+        # Written aside and moved in place, so that evaluations running in
+        # parallel never read a partial entry
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False)
+
+        os.replace(tmp_file, cache_file)
+
+    def metrics(self, language: str) -> TransliterationMetrics:
+        return self.metrics_dict[language]
+
+    def as_data_frame(self):
+        return metrics_data_frame(list(self.metrics_dict.values()))
+
+
+def result_cache_key(input_paths: List[str], **config) -> str:
+    """Hex digest of the contents of the files the metrics are computed from
+    and of anything else that changes them"""
+
+    key = json.dumps(
+        {
+            "version": RESULT_CACHE_VERSION,
+            "sacrebleu": sacrebleu.__version__,
+            "inputs": [file_content_hash(path) for path in input_paths],
+            "config": config,
+        },
+        sort_keys=True,
+    )
+
+    return hashlib.blake2b(key.encode("utf-8"), digest_size=16).hexdigest()
+
 
+def score_with_cache(
+    score: Callable[[], ExperimentResults],
+    input_paths: List[str],
+    cache_dir: str,
+    max_cache_bytes: int,
+    **config,
+) -> ExperimentResults:
+    """Returns the cached results for the contents of `input_paths` and
+    `config`, or calls `score` and caches what it returns. Without a
+    `cache_dir`, or when reading from stdin, just calls `score`."""
 
-@click.command()
+    if not cache_dir or "-" in input_paths:
+        return score()
+
+    key = result_cache_key(input_paths, **config)
+    results = CachedExperimentResults.load(cache_dir, key)
+
+    if results is None:
+        results = score()
+        CachedExperimentResults.from_results(results).save(cache_dir, key)
+        prune_cache(cache_dir, max_cache_bytes, pattern="*.json")
+
+    return results
+
+
+def write_text_scores(results: ExperimentResults, score_output_path: str) -> None:
+    """Writes the metrics of each language, then global ones, in the format
+    of the `.eval.score` files"""
+
+    with (
+        open(score_output_path, "w", encoding="utf-8")
+        if score_output_path
+        else sys.stdout
+    ) as score_out_file:
+        for lang in results.languages:
+            score_out_file.write(f"{lang}:\n")
+            score_out_file.write(results.metrics(lang).format())
+
+        # finally write out global
+        score_out_file.write("global:\n")
+        score_out_file.write(results.metrics("global").format())
+
+
+def write_tsv_scores(results: ExperimentResults, score_output_path: str) -> None:
+    results.as_data_frame().to_csv(score_output_path, index=False, sep="\t")
+
+
+def write_json_scores(results: ExperimentResults, score_output_path: str) -> None:
+    """Writes all metrics of each language, then global ones, as one JSON
+    object keyed by language"""
+
+    scores = {}
+
+    for lang in [*results.languages, "global"]:
+        metrics = results.metrics(lang)
+        scores[lang] = {
+            "Accuracy": metrics.word_acc,
+            "F1": metrics.mean_f1,
+            "CER": metrics.character_error_rate,
+            "WER": metrics.word_err,
+            "BLEU": metrics.bleu,
+        }
+
+    with open(score_output_path, "w", encoding="utf-8") as score_out_file:
+        json.dump(scores, score_out_file, indent=2, ensure_ascii=False)
+        score_out_file.write("\n")
+
+
+# Resampled sentences per bootstrap batch, which bounds the size of the
+# index and count matrices
+BOOTSTRAP_BATCH_CELLS = 10_000_000
+
+# Metrics compared by `paired_bootstrap`
+BOOTSTRAP_METRICS = ["Accuracy", "CER", "F1"]
+
+
+def bootstrap_metrics(
+    n_outputs: int, sums: np.ndarray, n_systems: int
+) -> Dict[str, np.ndarray]:
+    """Accuracy, CER and mean F1 from sums of the `paired_bootstrap`
+    columns, with the same scaling as `SufficientStatistics.metrics`"""
+
+    sums = sums.reshape(*sums.shape[:-1], n_systems, 4)
+    exact_matches, errors, reference_lengths, f1 = np.moveaxis(sums, -1, 0)
+
+    return {
+        "Accuracy": 100 * (exact_matches / n_outputs),
+        "CER": errors / np.maximum(reference_lengths, 1),
+        "F1": 100 * (f1 / n_outputs),
+    }
+
+
+def paired_bootstrap(
+    statistics: List[SentenceStatistics],
+    n_samples: int = 1000,
+    random_seed: int = 1917,
+) -> Tuple[Dict[str, np.ndarray], Dict[str, np.ndarray]]:
+    """Paired bootstrap resampling of the per-sentence statistics of
+    several systems on the same sentences.
+
+    Each resample draws sentence indices with replacement, shared by all
+    systems. A batch of index rows is turned into sentence counts with one
+    bincount, so every resample is scored with a matrix product instead
+    of re-scoring strings.
+
+    Returns the metrics of the full test set, with shape (n_systems,), and
+    of each resample, with shape (n_samples, n_systems).
+    """
+
+    n_outputs = len(statistics[0].errors)
+    n_systems = len(statistics)
+    columns = np.column_stack(
+        [
+            column
+            for s in statistics
+            for column in (s.exact_matches, s.errors, s.reference_lengths, s.f1)
+        ]
+    ).astype(np.float64)
+
+    rng = np.random.default_rng(random_seed)
+    index_dtype = np.int32 if n_outputs < 2**31 else np.int64
+    batch_size = max(1, BOOTSTRAP_BATCH_CELLS // max(n_outputs, 1))
+    sums = np.empty((n_samples, columns.shape[1]))
+
+    for start in range(0, n_samples, batch_size):
+        stop = min(start + batch_size, n_samples)
+        indices = rng.integers(
+            0, n_outputs, size=(stop - start, n_outputs), dtype=index_dtype
+        )
+        offsets = np.arange(stop - start, dtype=np.int64)[:, np.newaxis] * n_outputs
+        counts = np.bincount(
+            (indices + offsets).ravel(), minlength=(stop - start) * n_outputs
+        ).reshape(stop - start, n_outputs)
+        sums[start:stop] = counts.astype(np.float64) @ columns
+
+    return (
+        bootstrap_metrics(n_outputs, columns.sum(axis=0), n_systems),
+        bootstrap_metrics(n_outputs, sums, n_systems),
+    )
+
+
+def compare_systems(
+    names: List[str],
+    statistics: List[SentenceStatistics],
+    groups: Dict[str, np.ndarray],
+    n_samples: int = 1000,
+    random_seed: int = 1917,
+) -> pd.DataFrame:
+    """Paired bootstrap comparison of every system against the first one,
+    globally and for each language in `groups`.
+
+    Reports the 95% confidence interval of the difference and its p-value,
+    computed like sacrebleu's paired bootstrap test: the share of resampled
+    differences that are at least as far from their mean as the observed
+    difference is from zero.
+    """
+
+    rows = []
+    subsets = {"global": None, **groups}
+
+    for language, indices in tqdm(subsets.items(), total=len(subsets)):
+        if indices is not None:
+            subset = [s.take(indices) for s in statistics]
+        else:
+            subset = statistics
+
+        observed, resampled = paired_bootstrap(
+            subset, n_samples=n_samples, random_seed=random_seed
+        )
+
+        for metric in BOOTSTRAP_METRICS:
+            for ix in range(1, len(names)):
+                difference = observed[metric][ix] - observed[metric][0]
+                differences = resampled[metric][:, ix] - resampled[metric][:, 0]
+                extreme = np.abs(differences - differences.mean()) >= abs(difference)
+                ci_low, ci_high = np.percentile(differences, [2.5, 97.5])
+
+                rows.append(
+                    {
+                        "Language": language,
+                        "Metric": metric,
+                        "Baseline": names[0],
+                        "System": names[ix],
+                        "BaselineScore": observed[metric][0],
+                        "SystemScore": observed[metric][ix],
+                        "Difference": difference,
+                        "CILow": ci_low,
+                        "CIHigh": ci_high,
+                        "PValue": (extreme.sum() + 1) / (n_samples + 1),
+                    }
+                )
+
+    return pd.DataFrame(rows).round(4)
+
+
+@click.group(invoke_without_command=True)
 @click.option("--references-path", "--gold-path", "--ref", "--gold", default="")
 @click.option("--hypotheses-path", "--hyp", default="")
 @click.option("--source-path", "--src", default="")
 @click.option("--languages-path", "--langs", default="")
 @click.option("--combined-tsv-path", "--tsv", default="")
+@click.option(
+    "--fairseq-generate-path",
+    "--generate",
+    default="",
+    help="Output of fairseq-generate to score, or - for stdin",
+)
+@click.option(
+    "--split-output-prefix",
+    default="",
+    help="With --generate, also write {prefix}.{gold,hyps,source,languages}",
+)
 @click.option("--score-output-path", "--score", default="/dev/stdout")
 @click.option("--output-as-tsv", is_flag=True)
 @click.option("--output-as-json", is_flag=True)
+@click.option("--tsv-output-path", default="", help="Also write TSV scores here")
+@click.option("--json-output-path", default="", help="Also write JSON scores here")
+@click.option("--workers", type=int, default=1)
+@click.option(
+    "--streaming",
+    is_flag=True,
+    help="Score line by line in constant memory instead of loading all outputs",
+)
+@click.option(
+    "--cache-dir",
+    default="",
+    help="Reuse the scores of unchanged outputs from this folder",
+)
+@click.option("--no-cache", is_flag=True, help="Ignore --cache-dir")
+@click.option("--cache-size-mb", type=int, default=64)
+@click.pass_context
 def main(
+    ctx: click.Context,
     references_path: str,
     hypotheses_path: str,
     source_path: str,
     languages_path: str,
     combined_tsv_path: str,
+    fairseq_generate_path: str,
+    split_output_prefix: str,
     score_output_path: str,
     output_as_tsv: bool,
     output_as_json: bool,
+    tsv_output_path: str,
+    json_output_path: str,
+    workers: int,
+    streaming: bool,
+    cache_dir: str,
+    no_cache: bool,
+    cache_size_mb: int,
 ):
+    """Scores one experiment, unless a command is given"""
+
+    if ctx.invoked_subcommand is not None:
+        return
+
+    results_class = StreamingExperimentResults if streaming else ExperimentResults
+
     if combined_tsv_path:
-        results = ExperimentResults.from_tsv(tsv_path=combined_tsv_path)
+        input_paths = [combined_tsv_path]
+        score = partial(
+            results_class.from_tsv, tsv_path=combined_tsv_path, workers=workers
+        )
+    elif fairseq_generate_path:
+        input_paths = [fairseq_generate_path, languages_path]
+        records = records_from_fairseq_generate(
+            fairseq_generate_path,
+            languages_path=languages_path,
+            split_output_prefix=split_output_prefix,
+        )
+        score = partial(results_class.from_records, records, workers=workers)
     else:
-        results = ExperimentResults.from_paths(
+        input_paths = [references_path, hypotheses_path, languages_path]
+        score = partial(
+            results_class.from_paths,
             references_path=references_path,
             hypotheses_path=hypotheses_path,
             source_path=source_path,
             languages_path=languages_path,
+            workers=workers,
         )
 
+    results = score_with_cache(
+        score,
+        [path for path in input_paths if path],
+        cache_dir="" if no_cache else cache_dir,
+        max_cache_bytes=cache_size_mb << 20,
+        streaming=streaming,
+    )
+
+    # The split files are written while reading the records, which a cache
+    # hit skips
+    if fairseq_generate_path and split_output_prefix:
+        for _ in records:
+            pass
+
+    # Metrics are computed once above, for any number of output formats
     if output_as_tsv:
-        result_df = results.as_data_frame()
-        result_df.to_csv(score_output_path, index=False, sep="\t")
+        write_tsv_scores(results, score_output_path)
+    elif output_as_json:
+        write_json_scores(results, score_output_path)
     else:
-        with (
-            open(score_output_path, "w", encoding="utf-8")
-
-            if score_output_path
-            else sys.stdout
-        ) as score_out_file:
-            for lang in results.languages:
-                score_out_file.write(f"{lang}:\n")
-                score_out_file.write(results.metrics_dict.get(lang).metrics.format())
-
-            # finally write out global
-            score_out_file.write("global:\n")
-            score_out_file.write(results.metrics_dict.get("global").metrics.format())
+        write_text_scores(results, score_output_path)
+
+    if tsv_output_path:
+        write_tsv_scores(results, tsv_output_path)
+
+    if json_output_path:
+        write_json_scores(results, json_output_path)
+
+
+@main.command()
+@click.option("--references-path", "--gold-path", "--ref", "--gold", default="")
+@click.option("--hypotheses-path", "--hyp", multiple=True)
+@click.option("--source-path", "--src", default="")
+@click.option("--languages-path", "--langs", default="")
+@click.option("--combined-tsv-path", "--tsv", multiple=True)
+@click.option(
+    "--name", "names", multiple=True, help="Experiment names (default: their paths)"
+)
+@click.option("--score-output-path", "--score", default="/dev/stdout")
+@click.option("--n-samples", type=int, default=1000)
+@click.option("--random-seed", type=int, default=1917)
+@click.option("--workers", type=int, default=1)
+def compare(
+    references_path: str,
+    hypotheses_path: Tuple[str, ...],
+    source_path: str,
+    languages_path: str,
+    combined_tsv_path: Tuple[str, ...],
+    names: Tuple[str, ...],
+    score_output_path: str,
+    n_samples: int,
+    random_seed: int,
+    workers: int,
+):
+    """Paired bootstrap test of two or more experiments on the same test set,
+    against the first one. Give one --tsv per experiment, or one --hyp per
+    experiment with shared --ref, --src and --langs."""
+
+    paths = combined_tsv_path or hypotheses_path
+
+    if len(paths) < 2:
+        raise click.UsageError("Give at least two --tsv or --hyp paths")
+
+    if names and len(names) != len(paths):
+        raise click.UsageError("Give one --name per experiment")
+
+    all_outputs = []
+
+    for path in paths:
+        if combined_tsv_path:
+            outputs, _ = ExperimentResults.outputs_from_combined_tsv(path)
+        else:
+            outputs, _ = ExperimentResults.outputs_from_paths(
+                references_path=references_path,
+                hypotheses_path=path,
+                source_path=source_path,
+                languages_path=languages_path,
+            )
+
+        if all_outputs and not all_outputs[0].same_test_set(outputs):
+            raise click.UsageError(f"{path} is not on the same test set as {paths[0]}")
+
+        all_outputs.append(outputs)
+
+    statistics = [
+        SentenceStatistics.from_outputs(outputs, workers=workers)
+        for outputs in all_outputs
+    ]
+    comparison = compare_systems(
+        names=list(names or paths),
+        statistics=statistics,
+        groups=all_outputs[0].group_by_language(),
+        n_samples=n_samples,
+        random_seed=random_seed,
+    )
+    comparison.to_csv(score_output_path, index=False, sep="\t")
+
+
+def score_experiment(
+    eval_folder: str,
+    mode: str,
+    shared_outputs: TransliterationOutputs,
+    workers: int = 1,
+) -> ExperimentResults:
+    """Scores `{eval_folder}/{mode}.hyps` against outputs read from the same
+    gold, source and language files"""
+
+    with read_text(os.path.join(eval_folder, f"{mode}.hyps")) as hyps:
+        hypotheses = [line.strip() for line in hyps]
+
+    if len(hypotheses) == len(shared_outputs):
+        system_outputs = shared_outputs.with_hypotheses(hypotheses)
+    else:
+        # Let the aligned files be cut to the shortest, as usual
+        system_outputs, _ = ExperimentResults.outputs_from_paths(
+            references_path=os.path.join(eval_folder, f"{mode}.gold"),
+            hypotheses_path=os.path.join(eval_folder, f"{mode}.hyps"),
+            source_path=os.path.join(eval_folder, f"{mode}.source"),
+            languages_path=os.path.join(eval_folder, f"{mode}.languages"),
+        )
+
+    return ExperimentResults(
+        system_outputs=system_outputs,
+        languages=set(system_outputs.language_names),
+        workers=workers,
+    )
+
+
+def score_experiment_metrics(
+    eval_folder: str,
+    mode: str,
+    shared_outputs: TransliterationOutputs,
+    workers: int = 1,
+) -> CachedExperimentResults:
+    """`score_experiment` keeping only the metrics, which is all that needs
+    to be sent back from a process pool"""
+
+    return CachedExperimentResults.from_results(
+        score_experiment(eval_folder, mode, shared_outputs, workers)
+    )
+
+
+@main.command()
+@click.option("--experiments-folder", default="experiments")
+@click.option(
+    "--glob",
+    "experiment_glob",
+    default="*",
+    help="Experiment folders to evaluate, e.g. 'pn-17lang-*-seed*'",
+)
+@click.option("--eval-name", default="transformer")
+@click.option("--mode", default="dev")
+@click.option("--aggregate-output-path", default="/dev/stdout")
+@click.option("--workers", type=int, default=1)
+@click.option(
+    "--cache-dir",
+    default="",
+    help="Reuse the scores of unchanged outputs from this folder",
+)
+@click.option("--no-cache", is_flag=True, help="Ignore --cache-dir")
+@click.option("--cache-size-mb", type=int, default=64)
+def batch(
+    experiments_folder: str,
+    experiment_glob: str,
+    eval_name: str,
+    mode: str,
+    aggregate_output_path: str,
+    workers: int,
+    cache_dir: str,
+    no_cache: bool,
+    cache_size_mb: int,
+):
+    """Evaluates `{experiments_folder}/{glob}/{eval_name}/{mode}.hyps` of all
+    matching experiments in one process. Each distinct set of gold, source
+    and language files is read once and shared by all experiments that
+    have it, e.g. all seeds of a corpus.
+
+    With `workers > 1`, the experiments of a test set that miss the cache
+    are scored in parallel, one per process, or in chunks on all workers if
+    there is only one.
+
+    Writes the usual `{mode}.eval.score` and `{mode}_eval_results.tsv` of
+    each experiment, and one table of all experiments and languages to
+    --aggregate-output-path."""
+
+    eval_folders = [
+        os.path.join(folder, eval_name)
+        for folder in sorted(
+            glob.glob(os.path.join(experiments_folder, experiment_glob))
+        )
+        if os.path.exists(os.path.join(folder, eval_name, f"{mode}.hyps"))
+    ]
+
+    if not eval_folders:
+        raise click.UsageError(f"No {eval_name}/{mode}.hyps found for the glob")
+
+    # Experiments that share their gold, source and language files
+    test_sets = defaultdict(list)
+
+    for eval_folder in eval_folders:
+        test_set = tuple(
+            file_content_hash(os.path.join(eval_folder, f"{mode}.{ext}"))
+            for ext in ["gold", "source", "languages"]
+        )
+        test_sets[test_set].append(eval_folder)
+
+    if no_cache:
+        cache_dir = ""
+
+    tables = []
+
+    for folders in test_sets.values():
+        shared_outputs, languages = ExperimentResults.outputs_from_paths(
+            references_path=os.path.join(folders[0], f"{mode}.gold"),
+            hypotheses_path=os.path.join(folders[0], f"{mode}.hyps"),
+            source_path=os.path.join(folders[0], f"{mode}.source"),
+            languages_path=os.path.join(folders[0], f"{mode}.languages"),
+        )
+
+        # Cache lookups and writes stay in this process
+        results_by_folder = {}
+        cache_keys = {}
+
+        if cache_dir:
+            for eval_folder in folders:
+                cache_keys[eval_folder] = result_cache_key(
+                    [
+                        os.path.join(eval_folder, f"{mode}.{ext}")
+                        for ext in ["gold", "hyps", "languages"]
+                    ],
+                    streaming=False,
+                )
+                cached = CachedExperimentResults.load(
+                    cache_dir, cache_keys[eval_folder]
+                )
+
+                if cached is not None:
+                    results_by_folder[eval_folder] = cached
+
+        misses = [folder for folder in folders if folder not in results_by_folder]
+        folder_workers = max(1, min(workers, len(misses)))
+        scored = list(
+            parallel_map(
+                partial(
+                    score_experiment_metrics,
+                    mode=mode,
+                    shared_outputs=shared_outputs,
+                    workers=workers if folder_workers == 1 else 1,
+                ),
+                misses,
+                chunk_size=1,
+                workers=folder_workers,
+                description="Evaluating",
+            )
+        )
+
+        for eval_folder, results in zip(misses, scored):
+            if cache_dir:
+                results.save(cache_dir, cache_keys[eval_folder])
+
+            results_by_folder[eval_folder] = results
+
+        if cache_dir and misses:
+            prune_cache(cache_dir, cache_size_mb << 20, pattern="*.json")
+
+        for eval_folder in folders:
+            results = results_by_folder[eval_folder]
+            write_text_scores(results, os.path.join(eval_folder, f"{mode}.eval.score"))
+            write_tsv_scores(
+                results, os.path.join(eval_folder, f"{mode}_eval_results.tsv")
+            )
+
+            experiment_name = os.path.basename(os.path.dirname(eval_folder))
+            match = EXPERIMENT_SEED.match(experiment_name)
+            table = results.as_data_frame()
+            table.insert(0, "Experiment", experiment_name)
+            table.insert(1, "Corpus", match.group(1) if match else experiment_name)
+            table.insert(2, "Seed", int(match.group(2)) if match else None)
+            table.insert(3, "Language", table.pop("Language"))
+            tables.append(table)
+
+    aggregate = pd.concat(tables, ignore_index=True).sort_values(
+        ["Corpus", "Seed", "Language"], kind="stable"
+    )
+    aggregate.to_csv(aggregate_output_path, index=False, sep="\t")
 
 
 if __name__ == "__main__":
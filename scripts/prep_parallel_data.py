@@ -1,18 +1,45 @@
 #!/usr/bin/env python
 
 from collections import defaultdict, Counter
-from typing import List, Tuple, Callable, Iterable, DefaultDict, Optional, Dict, Union
+from typing import (
+    List,
+    Sequence,
+    Set,
+    Tuple,
+    Callable,
+    Iterable,
+    Iterator,
+    DefaultDict,
+    Optional,
+    Dict,
+    TextIO,
+    Union,
+)
+from functools import partial
 from itertools import product
 import math
 import os
 
 from util.script import UnicodeAnalyzer
-from util import read, orjson_dump
+from util import (
+    read,
+    orjson_dump,
+    chunks,
+    parallel_map,
+    open_text,
+    find_text_file,
+    remove_other_compressions,
+    COMPRESSION_SUFFIXES,
+)
+from util.binarize import binarize_corpus
+from swap_src_tgt import swap_line
 from rich.progress import track
+from pandas.api.types import union_categoricals
 import pandas as pd
 import numpy as np
 import unicodedata
 import click
+import orjson
 
 
 def get_splits(
@@ -23,54 +50,1074 @@ def get_splits(
     random_seed: int = 1917,
 ) -> Iterable[str]:
 
-    # Set seed
-    np.random.seed(random_seed)
+    # Set seed
+    np.random.seed(random_seed)
+
+    splits = np.array(["train", "dev", "test"])
+    fractions = np.array([train_frac, dev_frac, test_frac])
+
+    return np.random.choice(a=splits, p=fractions, size=num_samples)
+
+
+def get_hash_splits(
+    wikidata_ids: Iterable[str],
+    train_frac: float,
+    dev_frac: float,
+    test_frac: float,
+    random_seed: int = 1917,
+) -> np.ndarray:
+    """Assigns each ID a split code (0=train, 1=dev, 2=test) from a seeded
+    hash of the ID, so the assignment does not depend on row order."""
+
+    # Seed the hash by using it as the 16-byte SipHash key
+    hash_key = f"{random_seed:016d}"[-16:]
+    hashes = pd.util.hash_array(
+        np.asarray(wikidata_ids, dtype=object), hash_key=hash_key, categorize=False
+    )
+
+    # Top 53 bits of the hash as a uniform number in [0, 1)
+    uniform = (hashes >> np.uint64(11)).astype(np.float64) / 2**53
+    thresholds = np.cumsum([train_frac, dev_frac, test_frac])
+    thresholds /= thresholds[-1]
+
+    return np.searchsorted(thresholds[:-1], uniform, side="right").astype(np.int8)
+
+
+def add_hash_split_column(
+    dump: pd.DataFrame,
+    wikidata_id_column: str,
+    split_column: str,
+    train_frac: float,
+    dev_frac: float,
+    test_frac: float,
+    random_seed: int = 1917,
+) -> Tuple[pd.DataFrame, Dict[str, str]]:
+    """Order-independent alternative to `add_split_column`.
+
+    IDs are factorized once and hashed with `get_hash_splits`, so the same
+    ID always lands in the same split across dump versions and chunks.
+    """
+
+    id_codes, unique_wikidata_ids = pd.factorize(dump[wikidata_id_column])
+    split_codes = get_hash_splits(
+        unique_wikidata_ids,
+        train_frac=train_frac,
+        dev_frac=dev_frac,
+        test_frac=test_frac,
+        random_seed=random_seed,
+    )
+
+    splits = pd.Categorical.from_codes(
+        split_codes, categories=["train", "dev", "test"], ordered=True
+    )
+    dump[split_column] = splits[id_codes]
+    id_to_split = dict(zip(unique_wikidata_ids, splits.astype(str)))
+
+    return dump, id_to_split
+
+
+def add_split_column(
+    dump: pd.DataFrame,
+    wikidata_id_column: str,
+    split_column: str,
+    train_frac: float,
+    dev_frac: float,
+    test_frac: float,
+    random_seed: int = 1917,
+) -> Tuple[pd.DataFrame, Dict[str, str]]:
+
+    unique_wikidata_ids = Counter(
+        track(
+            sequence=dump[wikidata_id_column],
+            description="Counting Wikidata IDs before splitting...",
+            total=dump.shape[0],
+        )
+    )
+    n_unique_ids = len(unique_wikidata_ids)
+
+    id_to_split = {
+        wid: split
+        for wid, split in track(
+            zip(
+                unique_wikidata_ids,
+                get_splits(
+                    num_samples=n_unique_ids,
+                    train_frac=train_frac,
+                    dev_frac=dev_frac,
+                    test_frac=test_frac,
+                    random_seed=random_seed,
+                ),
+            ),
+            description="Splitting unique Wikidata IDs...",
+            total=n_unique_ids,
+        )
+    }
+
+    dump[split_column] = pd.Categorical(
+        [id_to_split[wid] for wid in dump[wikidata_id_column]],
+        categories=["train", "dev", "test"],
+        ordered=True,
+    )
+
+    return dump, id_to_split
+
+
+def add_split_column_chunked(
+    chunks: Iterable[pd.DataFrame],
+    wikidata_id_column: str,
+    split_column: str,
+    train_frac: float,
+    dev_frac: float,
+    test_frac: float,
+    id_to_split: Dict[str, str],
+    random_seed: int = 1917,
+    split_mode: str = "random",
+) -> Iterator[pd.DataFrame]:
+    """Chunked counterpart to `add_split_column`.
+
+    New Wikidata IDs are drawn from the same random stream in first-seen
+    order, so the assignment is identical to `add_split_column` on the
+    full dump. `id_to_split` is filled in place as chunks are consumed.
+    With `split_mode="hash"`, each chunk goes through `add_hash_split_column`.
+    """
+
+    np.random.seed(random_seed)
+
+    splits = np.array(["train", "dev", "test"])
+    fractions = np.array([train_frac, dev_frac, test_frac])
+
+    for chunk in chunks:
+        if split_mode == "hash":
+            chunk, chunk_id_to_split = add_hash_split_column(
+                chunk,
+                wikidata_id_column=wikidata_id_column,
+                split_column=split_column,
+                train_frac=train_frac,
+                dev_frac=dev_frac,
+                test_frac=test_frac,
+                random_seed=random_seed,
+            )
+            id_to_split.update(chunk_id_to_split)
+
+            yield chunk
+
+            continue
+
+        new_ids = [
+            wid
+            for wid in dict.fromkeys(chunk[wikidata_id_column])
+            if wid not in id_to_split
+        ]
+        id_to_split.update(
+            zip(new_ids, np.random.choice(a=splits, p=fractions, size=len(new_ids)))
+        )
+        chunk[split_column] = pd.Categorical(
+            [id_to_split[wid] for wid in chunk[wikidata_id_column]],
+            categories=["train", "dev", "test"],
+            ordered=True,
+        )
+
+        yield chunk
+
+
+def filter_dump(
+    dump: pd.DataFrame,
+    language_column: str,
+    tgt_column: str,
+    wikidata_id_column: str,
+    filter_out_english: bool = True,
+) -> pd.DataFrame:
+
+    # Make sure an English side exists
+    eng_column = tgt_column
+    dump = dump[
+        (dump[eng_column].str.len() > 0)
+        & (dump[eng_column] != dump[wikidata_id_column])
+    ]
+
+    # Filter out English on the source side
+
+    if filter_out_english:
+        dump = dump[
+            ~(
+                (dump[language_column] == "en")
+                | (dump[language_column].str.startswith("en-"))
+            )
+        ]
+
+    return dump
+
+
+def concat_chunks(
+    chunks: Iterable[pd.DataFrame], categorical_columns: Iterable[str]
+) -> pd.DataFrame:
+    """Concatenates chunks, unioning the categories of categorical columns
+    so that they do not fall back to `object` dtype."""
+
+    chunks = list(chunks)
+    categorical_columns = [
+        col for col in categorical_columns if col in chunks[0].columns
+    ]
+
+    for col in categorical_columns:
+        categories = union_categoricals(
+            [chunk[col] for chunk in chunks], ignore_order=True
+        ).categories
+
+        for chunk in chunks:
+            chunk[col] = chunk[col].cat.set_categories(categories)
+
+    return pd.concat(chunks, ignore_index=True)
+
+
+def get_sampling_priorities(
+    dump: pd.DataFrame, columns: List[str], random_seed: int = 12345
+) -> np.ndarray:
+    """Seeded random priority of each row from a hash of its contents, so a
+    row gets the same priority whatever chunk or position it is in."""
+
+    # Seed the hash by using it as the 16-byte SipHash key
+    return pd.util.hash_pandas_object(
+        dump[columns], index=False, hash_key=f"{random_seed:016d}"[-16:]
+    ).to_numpy()
+
+
+def sample_by_priority(
+    dump: pd.DataFrame,
+    priorities: np.ndarray,
+    language_column: str,
+    split_column: str,
+    max_names_thresholds: Dict[str, Union[int, float]],
+) -> Tuple[pd.DataFrame, np.ndarray]:
+    """Priority sampling: keeps the rows with the lowest priority in each
+    (language, split), up to its cap, in order of priority.
+
+    Only the kept rows are copied, and sampling the union of two samples
+    gives the same result as sampling all of their rows at once, so the
+    dump can be sampled chunk by chunk.
+    """
+
+    order = np.argsort(priorities, kind="stable")
+    rank = (
+        pd.Series(np.zeros(len(order), dtype=np.int8))
+        .groupby(
+            [
+                dump[language_column].to_numpy()[order],
+                dump[split_column].to_numpy()[order],
+            ],
+            observed=True,
+            sort=False,
+            dropna=False,
+        )
+        .cumcount()
+        .to_numpy()
+    )
+    thresholds = (
+        dump[split_column].iloc[order].astype(str).map(max_names_thresholds).to_numpy()
+    )
+    kept = order[rank < thresholds]
+
+    return dump.iloc[kept], priorities[kept]
+
+
+def read_dump_low_memory(
+    dump_file: str,
+    language_column: str,
+    type_column: str,
+    src_column: str,
+    tgt_column: str,
+    wikidata_id_column: str,
+    split_column: str,
+    train_frac: float,
+    dev_frac: float,
+    test_frac: float,
+    chunksize: int,
+    filter_out_english: bool = True,
+    random_seed: int = 1917,
+    split_mode: str = "random",
+    cache_dir: Optional[str] = None,
+    max_names_thresholds: Optional[Dict[str, Union[int, float]]] = None,
+) -> Tuple[pd.DataFrame, Dict[str, str], Optional[DefaultDict[str, Counter]]]:
+    """Reads the dump `chunksize` rows at a time, keeping only the columns
+    that `convert_dump_into_lines` needs.
+
+    Each chunk is split and filtered before being kept, and the language,
+    type and split columns are stored as categoricals.
+
+    With `max_names_thresholds`, only a running priority sample of each
+    (language, split) is kept (see `sample_by_priority`), so the kept rows
+    grow with the caps rather than with the dump. The number of names per
+    language and split before sampling is then returned as well.
+
+    Without it, as needed for shuffle sampling, every filtered row is kept
+    and the chunks are concatenated at the end, so `chunksize` only bounds
+    the memory used for parsing. In both cases, the split of every Wikidata
+    ID is kept in memory as well.
+    """
+
+    columns = list(
+        dict.fromkeys(
+            [language_column, type_column, src_column, tgt_column, wikidata_id_column]
+        )
+    )
+    categorical_columns = [language_column, type_column, split_column]
+
+    chunks = read(
+        dump_file,
+        "tsv",
+        chunksize=chunksize,
+        usecols=columns,
+        dtype={language_column: "category", type_column: "category"},
+        cache_dir=cache_dir,
+    )
+
+    id_to_split: Dict[str, str] = {}
+    filtered_chunks = (
+        filter_dump(
+            chunk,
+            language_column=language_column,
+            tgt_column=tgt_column,
+            wikidata_id_column=wikidata_id_column,
+            filter_out_english=filter_out_english,
+        )
+        for chunk in track(
+            add_split_column_chunked(
+                chunks,
+                wikidata_id_column=wikidata_id_column,
+                split_column=split_column,
+                train_frac=train_frac,
+                dev_frac=dev_frac,
+                test_frac=test_frac,
+                id_to_split=id_to_split,
+                random_seed=random_seed,
+                split_mode=split_mode,
+            ),
+            description="Reading dump in chunks...",
+        )
+    )
+
+    if max_names_thresholds is None:
+        dump = concat_chunks(filtered_chunks, categorical_columns=categorical_columns)
+        print(
+            f"Holding {len(dump)} filtered rows of dump in memory "
+            f"({dump.memory_usage(deep=True).sum() / 2**20:.0f} MiB)"
+        )
+
+        return dump, id_to_split, None
+
+    orig_n_names_per_lang = defaultdict(Counter)
+    dump, priorities = None, None
+
+    for chunk in filtered_chunks:
+        for lang, split_counts in count_names_per_lang(
+            chunk, language_column=language_column, split_column=split_column
+        ).items():
+            orig_n_names_per_lang[lang].update(split_counts)
+
+        chunk_priorities = get_sampling_priorities(chunk, columns)
+
+        if dump is not None:
+            chunk = concat_chunks([dump, chunk], categorical_columns=categorical_columns)
+            chunk_priorities = np.concatenate([priorities, chunk_priorities])
+
+        dump, priorities = sample_by_priority(
+            chunk,
+            chunk_priorities,
+            language_column=language_column,
+            split_column=split_column,
+            max_names_thresholds=max_names_thresholds,
+        )
+
+    return dump.reset_index(drop=True), id_to_split, orig_n_names_per_lang
+
+
+# (language, type, script, character-segmented src, character-segmented tgt,
+#  Wikidata ID)
+ParallelRow = Tuple[str, str, str, str, str, str]
+
+TAG_CONDITIONS = ["none", "script", "lang", "lang-type", "lang-script", "lang-type-script"]
+
+
+def parse_tag_condition(tags: str) -> Tuple[bool, bool, bool]:
+    """Maps a tag condition such as `lang-type-script` to
+    (include_language_tag, include_script_tag, include_type_tag)."""
+
+    return "lang" in tags, "script" in tags, "type" in tags
+
+
+def format_parallel_line(
+    row: ParallelRow,
+    include_language_tag: bool = True,
+    include_script_tag: bool = True,
+    include_type_tag: bool = True,
+    swap: bool = False,
+) -> Tuple[str, str, str]:
+    """Turns a row into a (language, source line, target line) tuple.
+
+    With `swap`, the line is reversed with `swap_src_tgt.swap_line`, so that
+    the output is the same as running `swap_src_tgt.py` on the forward corpus.
+    """
+
+    lang, conll_type, script, src_chars, tgt_chars, _ = row
+    src_tokens = []
+
+    if include_language_tag:
+        src_tokens.append(f"<{lang}>")
+
+    if include_script_tag:
+        src_tokens.append(f"<{script}>")
+
+    if include_type_tag:
+        src_tokens.append(f"<{conll_type}>")
+
+    src_tokens.append(src_chars)
+    src_line = " ".join(src_tokens)
+
+    if swap:
+        src_line, tgt_chars = swap_line((src_line, tgt_chars))
+
+    return lang, src_line, tgt_chars
+
+
+class ParallelCorpusWriter:
+    """Streams rows of one corpus to `{split}.{languages,src,tgt,ids}` files
+    in `output_folder`, formatting them on the way instead of keeping the
+    lines in memory. The `.ids` files hold the Wikidata ID of every line,
+    which `update_corpus_incrementally` uses to patch the corpus later.
+
+    With `compression` ("gzip" or "zstd"), the files are compressed.
+    """
+
+    extensions = ["languages", "src", "tgt", "ids"]
+
+    def __init__(
+        self,
+        output_folder: str,
+        include_language_tag: bool = True,
+        include_script_tag: bool = True,
+        include_type_tag: bool = True,
+        swap: bool = False,
+        compression: str = "none",
+    ) -> None:
+        self.output_folder = output_folder
+        self.include_language_tag = include_language_tag
+        self.include_script_tag = include_script_tag
+        self.include_type_tag = include_type_tag
+        self.swap = swap
+        self.suffix = COMPRESSION_SUFFIXES[compression]
+        self.files: Dict[str, List[TextIO]] = {}
+        self.n_lines = Counter()
+
+    def open_split(self, split: str) -> List[TextIO]:
+        if split not in self.files:
+            files = []
+
+            for ext in self.extensions:
+                path = f"{self.output_folder}/{split}.{ext}"
+                remove_other_compressions(path, self.suffix)
+                files.append(open_text(f"{path}{self.suffix}", "w"))
+
+            self.files[split] = files
+
+        return self.files[split]
+
+    def write_rows(self, split: str, rows: Iterable[ParallelRow]) -> None:
+        lines = [
+            (
+                *format_parallel_line(
+                    row,
+                    include_language_tag=self.include_language_tag,
+                    include_script_tag=self.include_script_tag,
+                    include_type_tag=self.include_type_tag,
+                    swap=self.swap,
+                ),
+                row[-1],
+            )
+            for row in rows
+        ]
+
+        for f, column in zip(self.open_split(split), zip(*lines)):
+            f.write("".join(f"{value}\n" for value in column))
+
+        self.n_lines[split] += len(lines)
+
+    def close(self) -> None:
+        for files in self.files.values():
+            for f in files:
+                f.close()
+
+    def __enter__(self) -> "ParallelCorpusWriter":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def write_corpora(
+    output_rows: Dict[str, List[ParallelRow]],
+    writers: List[ParallelCorpusWriter],
+    chunk_size: int = 10000,
+) -> None:
+    """Writes the rows to all corpora in a single pass, `chunk_size` rows
+    at a time."""
+
+    for split, rows in output_rows.items():
+        for chunk in track(
+            chunks(rows, chunk_size),
+            description=f"Writing {split} lines to disk...",
+            total=math.ceil(len(rows) / chunk_size),
+        ):
+            for writer in writers:
+                writer.write_rows(split, chunk)
+
+
+def segment_characters(words: Sequence[str]) -> List[str]:
+    """Separates the characters of each word with spaces, e.g. `K y i v`"""
+    return pd.Series([str(word) for word in words], dtype=object).str.join(" ").tolist()
+
+
+def most_common_scripts(words: Sequence[str]) -> List[str]:
+    """Most common ICU script of each word, ignoring punctuation and numbers"""
+    ua = UnicodeAnalyzer(strip=True, ignore_punctuation=True, ignore_numbers=True)
+
+    return [ua.most_common_icu_script(word) for word in words]
+
+
+def apply_to_batch(
+    func: Callable[[Sequence[str]], List[str]], batch: Sequence[str]
+) -> List[Optional[str]]:
+    """Applies `func` to a whole batch. If that fails, retries word by word
+    so that only the words that fail get `None`."""
+
+    try:
+        return func(batch)
+    except Exception:
+        results = []
+
+        for word in batch:
+            try:
+                results.extend(func([word]))
+            except Exception:
+                results.append(None)
+
+        return results
+
+
+def map_unique(
+    func: Callable[[Sequence[str]], List[str]],
+    values: pd.Series,
+    description: str,
+    workers: int = 1,
+    chunk_size: int = 10000,
+) -> np.ndarray:
+    """Applies `func` to each distinct value only once, `chunk_size` values
+    at a time on `workers` processes, and broadcasts the results back.
+    Values that `func` fails on map to `None`."""
+
+    codes, uniques = pd.factorize(values.to_numpy(dtype=object), use_na_sentinel=False)
+    output = np.empty(len(uniques), dtype=object)
+    output[:] = list(
+        parallel_map(
+            partial(apply_to_batch, func),
+            uniques,
+            chunk_size=chunk_size,
+            workers=workers,
+            batched=True,
+            description=description,
+        )
+    )
+
+    return output[codes]
+
+
+def select_rows(
+    languages: pd.Series,
+    splits: pd.Series,
+    failed: np.ndarray,
+    max_names_thresholds: Dict[str, Union[int, float]],
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Applies the per-(language, split) caps to the rows in order.
+
+    Same as visiting the rows one by one, skipping rows of a (language,
+    split) that has reached its cap and not counting failed rows. Returns
+    boolean masks of the kept rows, the failed rows reached before the cap
+    and the rows skipped because of the cap.
+    """
+
+    ok = pd.Series(~failed)
+    n_kept_before = (
+        ok.groupby(
+            [languages.to_numpy(), splits.to_numpy()],
+            observed=True,
+            sort=False,
+            dropna=False,
+        )
+        .cumsum()
+        .to_numpy()
+        - ok.to_numpy()
+    )
+    thresholds = splits.astype(str).map(max_names_thresholds).to_numpy()
+    below_cap = n_kept_before < thresholds
+
+    return ~failed & below_cap, failed & below_cap, ~below_cap
+
+
+def segment_dump(
+    dump: pd.DataFrame,
+    language_column: str,
+    type_column: str,
+    src_column: str,
+    tgt_column: str,
+    wikidata_id_column: str,
+    detect_script: bool = True,
+    reverse: bool = False,
+    workers: int = 1,
+) -> Tuple[List[ParallelRow], np.ndarray]:
+    """Turns each row of the dump into a `ParallelRow`, working on whole
+    columns and segmenting each distinct name only once.
+
+    Also returns a boolean mask of the rows that failed.
+    """
+
+    src_chars = map_unique(
+        segment_characters,
+        dump[src_column],
+        description="Segmenting source names...",
+        workers=workers,
+    )
+    tgt_chars = map_unique(
+        segment_characters,
+        dump[tgt_column],
+        description="Segmenting target names...",
+        workers=workers,
+    )
+
+    if detect_script:
+        scripts = map_unique(
+            most_common_scripts,
+            dump[tgt_column if reverse else src_column],
+            description="Detecting scripts...",
+            workers=workers,
+        )
+    else:
+        scripts = np.full(dump.shape[0], "", dtype=object)
+
+    failed = pd.isnull(src_chars) | pd.isnull(tgt_chars) | pd.isnull(scripts)
+    rows = list(
+        zip(
+            dump[language_column],
+            dump[type_column],
+            scripts,
+            src_chars,
+            tgt_chars,
+            dump[wikidata_id_column],
+        )
+    )
+
+    return rows, failed
+
+
+def get_max_names_thresholds(
+    max_names_per_lang_train: Optional[Union[int, float]] = None,
+    max_names_per_lang_dev: Optional[Union[int, float]] = None,
+    max_names_per_lang_test: Optional[Union[int, float]] = None,
+) -> Dict[str, Union[int, float]]:
+
+    if not max_names_per_lang_train:
+        max_names_per_lang_train = math.inf
+    if not max_names_per_lang_dev:
+        max_names_per_lang_dev = math.inf
+    if not max_names_per_lang_test:
+        max_names_per_lang_test = math.inf
+
+    print(f"Max number of names per language (train): {max_names_per_lang_train}")
+    print(f"Max number of names per language (dev): {max_names_per_lang_dev}")
+    print(f"Max number of names per language (test): {max_names_per_lang_test}")
+
+    return {
+        "train": max_names_per_lang_train,
+        "dev": max_names_per_lang_dev,
+        "test": max_names_per_lang_test,
+    }
+
+
+def count_names_per_lang(
+    dump: pd.DataFrame, language_column: str, split_column: str
+) -> DefaultDict[str, Counter]:
+    n_names_per_lang = defaultdict(Counter)
+    for lang, split in zip(dump[language_column], dump[split_column]):
+        n_names_per_lang[lang][split] += 1
+
+    return n_names_per_lang
+
+
+def compute_stats(
+    orig_n_names_per_lang: Dict[str, Counter], n_names_per_lang: Dict[str, Counter]
+) -> pd.DataFrame:
+    stats = pd.DataFrame(
+        [
+            {
+                "language": lang,
+                "orig_count": orig_split_count,
+                "new_count": n_names_per_lang[lang][split],
+                "split": split,
+            }
+            for lang, ctr in orig_n_names_per_lang.items()
+            for split, orig_split_count in ctr.items()
+        ]
+    ).set_index(["split", "language"])
+    total_orig = stats.orig_count.groupby(level=0).sum()
+    total_new = stats.new_count.groupby(level=0).sum()
+    stats["orig_frac"] = (stats.orig_count / total_orig).round(3)
+    stats["new_frac"] = (stats.new_count / total_new).round(3)
+    stats.sort_values("orig_count", ascending=False, inplace=True)
+    stats.sort_index(axis=0, inplace=True)
+
+    stats = stats[["orig_count", "orig_frac", "new_count", "new_frac"]]
+
+    return stats
+
+
+def convert_dump_into_rows(
+    dump: pd.DataFrame,
+    language_column: str,
+    type_column: str,
+    src_column: str,
+    tgt_column: str,
+    wikidata_id_column: str,
+    split_column: str = "split",
+    filter_out_english: bool = True,
+    detect_script: bool = True,
+    reverse: bool = False,
+    max_names_per_lang_train: Optional[Union[int, float]] = None,
+    max_names_per_lang_dev: Optional[Union[int, float]] = None,
+    max_names_per_lang_test: Optional[Union[int, float]] = None,
+    workers: int = 1,
+    sampling_mode: str = "shuffle",
+    orig_n_names_per_lang: Optional[Dict[str, Counter]] = None,
+) -> Tuple[DefaultDict[str, List[ParallelRow]], pd.DataFrame]:
+    """Filters, shuffles and caps the dump, returning one tag-agnostic row
+    per kept name so that any tag condition can be formatted from it.
+
+    With `sampling_mode="priority"`, the rows of each (language, split) are
+    picked with `sample_by_priority` instead of shuffling the whole dump.
+    Pass `orig_n_names_per_lang` if the dump has already been sampled, so
+    that the stats reflect the full dump. With `workers > 1`, names are
+    segmented by a process pool.
+    """
+
+    max_names_thresholds = get_max_names_thresholds(
+        max_names_per_lang_train=max_names_per_lang_train,
+        max_names_per_lang_dev=max_names_per_lang_dev,
+        max_names_per_lang_test=max_names_per_lang_test,
+    )
+
+    dump = filter_dump(
+        dump,
+        language_column=language_column,
+        tgt_column=tgt_column,
+        wikidata_id_column=wikidata_id_column,
+        filter_out_english=filter_out_english,
+    )
+
+    if orig_n_names_per_lang is None:
+        orig_n_names_per_lang = count_names_per_lang(
+            dump, language_column=language_column, split_column=split_column
+        )
+
+    if sampling_mode == "priority":
+        print("Sampling rows of dump by priority...")
+        dump, _ = sample_by_priority(
+            dump,
+            get_sampling_priorities(
+                dump,
+                list(
+                    dict.fromkeys(
+                        [
+                            language_column,
+                            type_column,
+                            src_column,
+                            tgt_column,
+                            wikidata_id_column,
+                        ]
+                    )
+                ),
+            ),
+            language_column=language_column,
+            split_column=split_column,
+            max_names_thresholds=max_names_thresholds,
+        )
+    else:
+        # Shuffle rows
+        print("Shuffling rows of dump...")
+        dump = dump.sample(frac=1, random_state=12345)
+
+    if detect_script:
+        # Build the lookup table once so forked workers can share it
+        UnicodeAnalyzer.icu_script_table()
+
+    failed = np.zeros(dump.shape[0], dtype=bool)
+    segmented = np.zeros(dump.shape[0], dtype=bool)
+    segmented_rows: List[Optional[ParallelRow]] = [None] * dump.shape[0]
+
+    # Rows that fail free up their slot under the cap, so the selection is
+    # redone until all selected rows convert. Rows only ever enter the
+    # selection or fail, so each round only segments the newly selected rows.
+    while True:
+        kept, failed_before_cap, capped = select_rows(
+            dump[language_column], dump[split_column], failed, max_names_thresholds
+        )
+        new = kept & ~segmented
+        new_positions = np.flatnonzero(new)
+        new_rows, new_rows_failed = segment_dump(
+            dump[new],
+            language_column=language_column,
+            type_column=type_column,
+            src_column=src_column,
+            tgt_column=tgt_column,
+            wikidata_id_column=wikidata_id_column,
+            detect_script=detect_script,
+            reverse=reverse,
+            workers=workers,
+        )
+        segmented[new] = True
+
+        for position, row in zip(new_positions, new_rows):
+            segmented_rows[position] = row
+
+        if not new_rows_failed.any():
+            break
+
+        failed[new_positions[new_rows_failed]] = True
+
+    rows = [segmented_rows[position] for position in np.flatnonzero(kept)]
+
+    for lang, src, tgt in zip(
+        dump[language_column][failed_before_cap],
+        dump[src_column][failed_before_cap],
+        dump[tgt_column][failed_before_cap],
+    ):
+        print(f"Error processing row: {(lang, src, tgt)}, skipping...")
+
+    for lang in dict.fromkeys(dump[language_column][capped]):
+        print(f"Max. number of names reached for {lang}. Skipping...")
+
+    dump = dump[kept]
+    output_rows = defaultdict(list)
+
+    for split, row in zip(dump[split_column], rows):
+        output_rows[split].append(row)
+
+    n_names_per_lang = count_names_per_lang(
+        dump, language_column=language_column, split_column=split_column
+    )
+
+    stats = compute_stats(orig_n_names_per_lang, n_names_per_lang)
+
+    return output_rows, stats
+
+
+def format_lines(
+    output_rows: Dict[str, List[ParallelRow]],
+    include_language_tag: bool = True,
+    include_script_tag: bool = True,
+    include_type_tag: bool = True,
+    swap: bool = False,
+) -> DefaultDict[str, List[Tuple[str, str, str]]]:
+    output_lines = defaultdict(list)
+
+    for split, rows in output_rows.items():
+        output_lines[split] = [
+            format_parallel_line(
+                row,
+                include_language_tag=include_language_tag,
+                include_script_tag=include_script_tag,
+                include_type_tag=include_type_tag,
+                swap=swap,
+            )
+            for row in rows
+        ]
+
+    return output_lines
+
+
+def convert_dump_into_lines(
+    dump: pd.DataFrame,
+    language_column: str,
+    type_column: str,
+    src_column: str,
+    tgt_column: str,
+    wikidata_id_column: str,
+    split_column: str = "split",
+    filter_out_english: bool = True,
+    include_language_tag: bool = True,
+    include_script_tag: bool = True,
+    include_type_tag: bool = True,
+    reverse: bool = False,
+    max_names_per_lang_train: Optional[Union[int, float]] = None,
+    max_names_per_lang_dev: Optional[Union[int, float]] = None,
+    max_names_per_lang_test: Optional[Union[int, float]] = None,
+    workers: int = 1,
+    sampling_mode: str = "shuffle",
+) -> Tuple[DefaultDict[str, List[Tuple[str, str, str]]], pd.DataFrame]:
+
+    output_rows, stats = convert_dump_into_rows(
+        dump,
+        language_column,
+        type_column,
+        src_column,
+        tgt_column,
+        wikidata_id_column,
+        split_column=split_column,
+        filter_out_english=filter_out_english,
+        detect_script=include_script_tag,
+        reverse=reverse,
+        max_names_per_lang_train=max_names_per_lang_train,
+        max_names_per_lang_dev=max_names_per_lang_dev,
+        max_names_per_lang_test=max_names_per_lang_test,
+        workers=workers,
+        sampling_mode=sampling_mode,
+    )
+
+    output_lines = format_lines(
+        output_rows,
+        include_language_tag=include_language_tag,
+        include_script_tag=include_script_tag,
+        include_type_tag=include_type_tag,
+    )
+
+    return output_lines, stats
+
+
+def resolve_output_folder(
+    output_folder: str, normalization: str, filter_out_english: bool
+) -> str:
+    output_folder = f"{output_folder}/{normalization.lower()}_normalized"
+
+    if filter_out_english:
+        output_folder = f"{output_folder}_noeng"
+
+    if not os.path.exists(output_folder):
+        print(f"Folder {output_folder} not found. Creating...")
+        os.makedirs(output_folder)
+
+    return output_folder
+
+
+def write_tag_conditions(
+    output_rows: Dict[str, List[ParallelRow]],
+    tag_conditions: List[str],
+    output_folder: str,
+    corpus_prefix: str,
+    normalization: str,
+    filter_out_english: bool,
+    reverse_corpus_prefix: Optional[str] = None,
+    binarized_output_folder: Optional[str] = None,
+    compression: str = "none",
+) -> List[str]:
+    """Writes one corpus per tag condition (and optionally its reverse,
+    with English on the source side) from a single pass over the rows.
+
+    If `binarized_output_folder` is given, each corpus is also binarized
+    under it, using the same folder structure as `output_folder`.
+
+    Returns the list of corpus folders that were written.
+    """
+
+    directions = [(corpus_prefix, False)]
+
+    if reverse_corpus_prefix:
+        directions.append((reverse_corpus_prefix, True))
+
+    corpus_folders = []
+    writers = []
+
+    for tags, (prefix, swap) in product(tag_conditions, directions):
+        include_language_tag, include_script_tag, include_type_tag = (
+            parse_tag_condition(tags)
+        )
+        corpus_folder = resolve_output_folder(
+            f"{output_folder}/{prefix}-{tags}",
+            normalization=normalization,
+            filter_out_english=filter_out_english,
+        )
+        print(f"Writing corpus: {corpus_folder}")
+        corpus_folders.append(corpus_folder)
+        writers.append(
+            ParallelCorpusWriter(
+                corpus_folder,
+                include_language_tag=include_language_tag,
+                include_script_tag=include_script_tag,
+                include_type_tag=include_type_tag,
+                swap=swap,
+                compression=compression,
+            )
+        )
+
+    try:
+        write_corpora(output_rows, writers)
+    finally:
+        for writer in writers:
+            writer.close()
 
-    splits = np.array(["train", "dev", "test"])
-    fractions = np.array([train_frac, dev_frac, test_frac])
+    if binarized_output_folder:
+        for corpus_folder, (tags, (prefix, _)) in zip(
+            corpus_folders, product(tag_conditions, directions)
+        ):
+            binarize_corpus(
+                corpus_folder,
+                resolve_output_folder(
+                    f"{binarized_output_folder}/{prefix}-{tags}",
+                    normalization=normalization,
+                    filter_out_english=filter_out_english,
+                ),
+            )
 
-    return np.random.choice(a=splits, p=fractions, size=num_samples)
+    return corpus_folders
 
 
-def add_split_column(
+def add_split_column_incremental(
     dump: pd.DataFrame,
     wikidata_id_column: str,
     split_column: str,
+    previous_id_to_split: Dict[str, str],
     train_frac: float,
     dev_frac: float,
     test_frac: float,
     random_seed: int = 1917,
+    split_mode: str = "random",
 ) -> Tuple[pd.DataFrame, Dict[str, str]]:
+    """Keeps every previously seen Wikidata ID in its split and only assigns
+    splits to new IDs. Removed IDs are kept in the mapping so that they land
+    in the same split if they come back."""
 
-    unique_wikidata_ids = Counter(
-        track(
-            sequence=dump[wikidata_id_column],
-            description="Counting Wikidata IDs before splitting...",
-            total=dump.shape[0],
-        )
-    )
-    n_unique_ids = len(unique_wikidata_ids)
+    id_to_split = dict(previous_id_to_split)
+    unique_wikidata_ids = pd.unique(dump[wikidata_id_column])
+    new_ids = [wid for wid in unique_wikidata_ids if wid not in id_to_split]
 
-    id_to_split = {
-        wid: split
-        for wid, split in track(
-            zip(
-                unique_wikidata_ids,
-                get_splits(
-                    num_samples=n_unique_ids,
-                    train_frac=train_frac,
-                    dev_frac=dev_frac,
-                    test_frac=test_frac,
-                    random_seed=random_seed,
-                ),
-            ),
-            description="Splitting unique Wikidata IDs...",
-            total=n_unique_ids,
+    if split_mode == "hash":
+        new_splits = np.array(["train", "dev", "test"])[
+            get_hash_splits(
+                new_ids,
+                train_frac=train_frac,
+                dev_frac=dev_frac,
+                test_frac=test_frac,
+                random_seed=random_seed,
+            )
+        ]
+    else:
+        new_splits = get_splits(
+            num_samples=len(new_ids),
+            train_frac=train_frac,
+            dev_frac=dev_frac,
+            test_frac=test_frac,
+            random_seed=random_seed,
         )
-    }
+
+    id_to_split.update(zip(new_ids, new_splits.tolist()))
 
     dump[split_column] = pd.Categorical(
-        [id_to_split[wid] for wid in dump[wikidata_id_column]],
+        dump[wikidata_id_column].map(id_to_split),
         categories=["train", "dev", "test"],
         ordered=True,
     )
@@ -78,23 +1125,141 @@ def add_split_column(
     return dump, id_to_split
 
 
-def write_parallel_lines(
-    lines: List[Tuple[str, str, str]], src_path: str, tgt_path: str, langs_path: str
-) -> None:
-    n_lines = len(lines)
-    with open(langs_path, "w") as f_langs, open(
-        src_path, "w", encoding="utf-8"
-    ) as f_src, open(tgt_path, "w", encoding="utf-8") as f_tgt:
-        for lang, src_line, tgt_line in track(
-            lines, description="Writing lines to disk...", total=n_lines
+def fingerprint_wikidata_ids(
+    dump: pd.DataFrame, wikidata_id_column: str, columns: List[str]
+) -> pd.Series:
+    """Hashes the rows of every Wikidata ID into one order-independent
+    fingerprint (sum of row hashes modulo 2**64)."""
+
+    row_hashes = pd.util.hash_pandas_object(
+        dump[columns].astype(str), index=False
+    ).to_numpy()
+    id_codes, unique_wikidata_ids = pd.factorize(dump[wikidata_id_column])
+    fingerprints = np.zeros(len(unique_wikidata_ids), dtype=np.uint64)
+    np.add.at(fingerprints, id_codes, row_hashes)
+
+    return pd.Series(fingerprints, index=unique_wikidata_ids)
+
+
+def diff_wikidata_ids(
+    previous_dump: pd.DataFrame,
+    dump: pd.DataFrame,
+    wikidata_id_column: str,
+    columns: List[str],
+) -> Tuple[Set[str], Set[str], Set[str]]:
+    """Returns the (added, removed, changed) Wikidata IDs between two dumps."""
+
+    previous_fingerprints = fingerprint_wikidata_ids(
+        previous_dump, wikidata_id_column=wikidata_id_column, columns=columns
+    )
+    fingerprints = fingerprint_wikidata_ids(
+        dump, wikidata_id_column=wikidata_id_column, columns=columns
+    )
+
+    added = set(fingerprints.index.difference(previous_fingerprints.index))
+    removed = set(previous_fingerprints.index.difference(fingerprints.index))
+    common = fingerprints.index.intersection(previous_fingerprints.index)
+    changed = set(
+        common[
+            fingerprints.loc[common].to_numpy()
+            != previous_fingerprints.loc[common].to_numpy()
+        ]
+    )
+
+    return added, removed, changed
+
+
+def patch_corpus(
+    previous_folder: str,
+    output_folder: str,
+    dirty_ids: Set[str],
+    output_lines: Dict[str, List[Tuple[str, str, str]]],
+    output_ids: Dict[str, List[str]],
+    max_names_thresholds: Dict[str, Union[int, float]],
+    compression: str = "none",
+    dirty_groups: Optional[Set[Tuple[str, str]]] = None,
+) -> DefaultDict[str, Counter]:
+    """Copies the previous corpus minus the lines of `dirty_ids` and of the
+    (language, split) pairs in `dirty_groups`, then appends the new lines
+    while respecting the per-language caps.
+
+    Files are written next to their destination and moved into place at the
+    end, so `output_folder` may be the same as `previous_folder`. The
+    previous corpus may be compressed differently than `compression`.
+
+    Returns the number of names per language and split in the patched corpus.
+    """
+
+    n_names_per_lang = defaultdict(Counter)
+    dirty_groups = dirty_groups or set()
+    extensions = ParallelCorpusWriter.extensions
+    suffix = COMPRESSION_SUFFIXES[compression]
+
+    for split in ["train", "dev", "test"]:
+        previous_paths = [
+            find_text_file(f"{previous_folder}/{split}.{ext}") for ext in extensions
+        ]
+        paths = [f"{output_folder}/{split}.{ext}" for ext in extensions]
+
+        if os.path.exists(previous_paths[0]) and not os.path.exists(
+            previous_paths[-1]
         ):
-            f_langs.write(f"{lang}\n")
-            f_src.write(f"{src_line}\n")
-            f_tgt.write(f"{tgt_line}\n")
+            raise ValueError(
+                f"{previous_paths[-1]} not found. Incremental mode needs the "
+                "Wikidata IDs of the previous corpus, so rebuild it once first."
+            )
 
+        with open_text(f"{paths[0]}.tmp{suffix}", "w") as f_langs, open_text(
+            f"{paths[1]}.tmp{suffix}", "w"
+        ) as f_src, open_text(f"{paths[2]}.tmp{suffix}", "w") as f_tgt, open_text(
+            f"{paths[3]}.tmp{suffix}", "w"
+        ) as f_ids:
+            if os.path.exists(previous_paths[0]):
+                with open_text(previous_paths[0]) as langs, open_text(
+                    previous_paths[1]
+                ) as src, open_text(previous_paths[2]) as tgt, open_text(
+                    previous_paths[3]
+                ) as ids:
+                    for lang, src_line, tgt_line, wikidata_id in zip(
+                        langs, src, tgt, ids
+                    ):
+                        if (
+                            wikidata_id.rstrip("\n") in dirty_ids
+                            or (lang.rstrip("\n"), split) in dirty_groups
+                        ):
+                            continue
 
-def convert_dump_into_lines(
+                        f_langs.write(lang)
+                        f_src.write(src_line)
+                        f_tgt.write(tgt_line)
+                        f_ids.write(wikidata_id)
+                        n_names_per_lang[lang.rstrip("\n")][split] += 1
+
+            for (lang, src_line, tgt_line), wikidata_id in zip(
+                output_lines.get(split, []), output_ids.get(split, [])
+            ):
+                if n_names_per_lang[lang][split] >= max_names_thresholds[split]:
+                    continue
+
+                f_langs.write(f"{lang}\n")
+                f_src.write(f"{src_line}\n")
+                f_tgt.write(f"{tgt_line}\n")
+                f_ids.write(f"{wikidata_id}\n")
+                n_names_per_lang[lang][split] += 1
+
+        for path in paths:
+            remove_other_compressions(path, suffix)
+            os.replace(f"{path}.tmp{suffix}", f"{path}{suffix}")
+
+    return n_names_per_lang
+
+
+def update_corpus_incrementally(
     dump: pd.DataFrame,
+    previous_dump: pd.DataFrame,
+    previous_id_to_split: Dict[str, str],
+    previous_folder: str,
+    output_folder: str,
     language_column: str,
     type_column: str,
     src_column: str,
@@ -106,123 +1271,129 @@ def convert_dump_into_lines(
     include_script_tag: bool = True,
     include_type_tag: bool = True,
     reverse: bool = False,
+    train_frac: float = 0.8,
+    dev_frac: float = 0.1,
+    test_frac: float = 0.1,
+    random_seed: int = 1917,
+    split_mode: str = "random",
     max_names_per_lang_train: Optional[Union[int, float]] = None,
     max_names_per_lang_dev: Optional[Union[int, float]] = None,
     max_names_per_lang_test: Optional[Union[int, float]] = None,
-) -> Tuple[DefaultDict[str, List[Tuple[str, str, str]]], pd.DataFrame]:
-
-    output_lines = defaultdict(list)
-    ua = UnicodeAnalyzer(strip=True, ignore_punctuation=True, ignore_numbers=True)
-
-    if not max_names_per_lang_train:
-        max_names_per_lang_train = math.inf
-    if not max_names_per_lang_dev:
-        max_names_per_lang_dev = math.inf
-    if not max_names_per_lang_test:
-        max_names_per_lang_test = math.inf
-
-    max_names_thresholds = {
-        "train": max_names_per_lang_train,
-        "dev": max_names_per_lang_dev,
-        "test": max_names_per_lang_test,
-    }
-
-    print(f"Max number of names per language (train): {max_names_per_lang_train}")
-    print(f"Max number of names per language (dev): {max_names_per_lang_dev}")
-    print(f"Max number of names per language (test): {max_names_per_lang_test}")
-
-    # Make sure an English side exists
-    eng_column = tgt_column
-    dump = dump[
-        (dump[eng_column].str.len() > 0)
-        & (dump[eng_column] != dump[wikidata_id_column])
-    ]
+    workers: int = 1,
+    compression: str = "none",
+    sampling_mode: str = "shuffle",
+) -> Tuple[Dict[str, str], pd.DataFrame]:
+    """Updates a corpus built from `previous_dump` to match `dump`.
 
+    Existing Wikidata IDs keep their splits and only IDs that were added,
+    removed or changed are converted again. Their lines are patched into the
+    previous corpus, see `patch_corpus`. Under a cap, the kept names of a
+    (language, split) depend on all of its rows, so capped pairs with such
+    an ID are converted again in full. With hash splits and priority
+    sampling, the result is then the same as a full rebuild up to line order.
 
-    # Filter out English on the source side
-
-    if filter_out_english:
-        dump = dump[
-            ~(
-                (dump[language_column] == "en")
-                | (dump[language_column].str.startswith("en-"))
-            )
-        ]
-
-    orig_n_names_per_lang = defaultdict(Counter)
-    for lang, split in zip(dump[language_column], dump[split_column]):
-        orig_n_names_per_lang[lang][split] += 1
+    Returns the updated Wikidata ID splits and parallel data statistics.
+    """
 
-    n_names_per_lang = defaultdict(Counter)
-    skipped = set()
+    dump, id_to_split = add_split_column_incremental(
+        dump,
+        wikidata_id_column=wikidata_id_column,
+        split_column=split_column,
+        previous_id_to_split=previous_id_to_split,
+        train_frac=train_frac,
+        dev_frac=dev_frac,
+        test_frac=test_frac,
+        random_seed=random_seed,
+        split_mode=split_mode,
+    )
 
-    # Shuffle rows
-    print("Shuffling rows of dump...")
-    dump = dump.sample(frac=1, random_state=12345)
+    added, removed, changed = diff_wikidata_ids(
+        previous_dump,
+        dump,
+        wikidata_id_column=wikidata_id_column,
+        columns=list(dict.fromkeys([language_column, type_column, src_column, tgt_column])),
+    )
+    print(
+        f"Wikidata IDs added: {len(added)}, removed: {len(removed)}, "
+        f"changed: {len(changed)}"
+    )
 
-    for lang, conll_type, src, tgt, split in track(
-        zip(
-            dump[language_column],
-            dump[type_column],
-            dump[src_column],
-            dump[tgt_column],
-            dump[split_column],
+    max_names_thresholds = get_max_names_thresholds(
+        max_names_per_lang_train=max_names_per_lang_train,
+        max_names_per_lang_dev=max_names_per_lang_dev,
+        max_names_per_lang_test=max_names_per_lang_test,
+    )
+    orig_n_names_per_lang = count_names_per_lang(
+        filter_dump(
+            dump,
+            language_column=language_column,
+            tgt_column=tgt_column,
+            wikidata_id_column=wikidata_id_column,
+            filter_out_english=filter_out_english,
         ),
-        total=dump.shape[0],
-        description="Converting to lines...",
-    ):
-        if n_names_per_lang[lang][split] >= max_names_thresholds[split]:
-            if lang not in skipped:
-                print(f"Max. number of names reached for {lang}. Skipping...")
-            skipped.add(lang)
-
-            continue
-
-        try:
-
-            src_tokens = []
-
-            if include_language_tag:
-                src_tokens.append(f"<{lang}>")
-
-            if include_script_tag:
-                script = ua.most_common_icu_script(src if not reverse else tgt)
-                src_tokens.append(f"<{script}>")
+        language_column=language_column,
+        split_column=split_column,
+    )
 
-            if include_type_tag:
-                src_tokens.append(f"<{conll_type}>")
+    dirty_ids = added | removed | changed
+    dirty_groups = set()
 
-            src_tokens.append(" ".join(c for c in str(src)))
-            src_line = " ".join(src_tokens)
-            tgt_line = " ".join(c for c in str(tgt))
-            output_lines[split].append((lang, src_line, tgt_line))
-            n_names_per_lang[lang][split] += 1
+    for df in [previous_dump, dump]:
+        dirty_rows = df[df[wikidata_id_column].isin(dirty_ids)]
+        dirty_groups.update(
+            (lang, split)
+            for lang, split in zip(
+                dirty_rows[language_column],
+                dirty_rows[wikidata_id_column].map(id_to_split),
+            )
+            if max_names_thresholds[split] < math.inf
+        )
 
-        except:
-            print(f"Error processing row: {(lang, src, tgt)}, skipping...")
+    in_dirty_group = pd.MultiIndex.from_arrays(
+        [dump[language_column], dump[split_column].astype(str)]
+    ).isin(list(dirty_groups))
+    new_dump = dump[dump[wikidata_id_column].isin(added | changed) | in_dirty_group]
+    output_rows = {}
 
-    stats = pd.DataFrame(
-        [
-            {
-                "language": lang,
-                "orig_count": orig_split_count,
-                "new_count": n_names_per_lang[lang][split],
-                "split": split,
-            }
-            for lang, ctr in orig_n_names_per_lang.items()
-            for split, orig_split_count in ctr.items()
-        ]
-    ).set_index(["split", "language"])
-    total_orig = stats.orig_count.groupby(level=0).sum()
-    total_new = stats.new_count.groupby(level=0).sum()
-    stats["orig_frac"] = (stats.orig_count / total_orig).round(3)
-    stats["new_frac"] = (stats.new_count / total_new).round(3)
-    stats.sort_values("orig_count", ascending=False, inplace=True)
-    stats.sort_index(axis=0, inplace=True)
+    if new_dump.shape[0] > 0:
+        output_rows, _ = convert_dump_into_rows(
+            new_dump,
+            language_column,
+            type_column,
+            src_column,
+            tgt_column,
+            wikidata_id_column,
+            split_column=split_column,
+            filter_out_english=filter_out_english,
+            detect_script=include_script_tag,
+            reverse=reverse,
+            max_names_per_lang_train=max_names_per_lang_train,
+            max_names_per_lang_dev=max_names_per_lang_dev,
+            max_names_per_lang_test=max_names_per_lang_test,
+            workers=workers,
+            sampling_mode=sampling_mode,
+        )
+    output_lines = format_lines(
+        output_rows,
+        include_language_tag=include_language_tag,
+        include_script_tag=include_script_tag,
+        include_type_tag=include_type_tag,
+    )
+    output_ids = {split: [row[-1] for row in rows] for split, rows in output_rows.items()}
 
-    stats = stats[["orig_count", "orig_frac", "new_count", "new_frac"]]
+    n_names_per_lang = patch_corpus(
+        previous_folder,
+        output_folder,
+        dirty_ids=dirty_ids,
+        output_lines=output_lines,
+        output_ids=output_ids,
+        max_names_thresholds=max_names_thresholds,
+        compression=compression,
+        dirty_groups=dirty_groups,
+    )
+    stats = compute_stats(orig_n_names_per_lang, n_names_per_lang)
 
-    return output_lines, stats
+    return id_to_split, stats
 
 
 @click.command()
@@ -258,9 +1429,89 @@ def convert_dump_into_lines(
 @click.option("--dev-frac", default=0.1, type=float)
 @click.option("--test-frac", default=0.1, type=float)
 @click.option("--sampling-random-seed", type=int, default=1917)
+@click.option(
+    "--split-mode",
+    type=click.Choice(["random", "hash"]),
+    default="random",
+    help="hash: assign splits from a seeded hash of each Wikidata ID",
+)
+@click.option(
+    "--sampling-mode",
+    type=click.Choice(["shuffle", "priority"]),
+    default="shuffle",
+    help=(
+        "priority: pick the capped names per language with seeded priority "
+        "sampling instead of shuffling the whole dump (streams with --chunksize)"
+    ),
+)
 @click.option("--max-names-per-lang-train", type=int, default=100000)
 @click.option("--max-names-per-lang-dev", type=int, default=5000)
 @click.option("--max-names-per-lang-test", type=int, default=5000)
+@click.option(
+    "--chunksize",
+    type=int,
+    default=None,
+    help=(
+        "Low-memory mode: parse the dump this many rows at a time. With "
+        "--sampling-mode shuffle, all filtered rows are still held in memory"
+    ),
+)
+@click.option(
+    "--cache-dir",
+    default="",
+    help="Cache the parsed dump here and memory-map it on later runs",
+)
+@click.option(
+    "--workers",
+    type=int,
+    default=1,
+    help="Number of processes used to convert the dump into lines",
+)
+@click.option(
+    "--tag-conditions",
+    default="",
+    help=(
+        "Comma-separated tag conditions (e.g. none,script,lang-type-script). "
+        "Writes one corpus per condition from a single pass over the dump, "
+        "ignoring the --include-*-tag flags."
+    ),
+)
+@click.option(
+    "--corpus-prefix",
+    default="pn-tag-ablation",
+    help="Corpus name prefix when using --tag-conditions",
+)
+@click.option(
+    "--reverse-corpus-prefix",
+    default="",
+    help="If set with --tag-conditions, also write English-source corpora here",
+)
+@click.option(
+    "--compression",
+    type=click.Choice(list(COMPRESSION_SUFFIXES)),
+    default="none",
+    help="Compress the text corpus (fairseq-preprocess needs uncompressed files)",
+)
+@click.option(
+    "--binarized-output-folder",
+    default="",
+    help="Also write fairseq binarized data here, e.g. data-bin/corpus_name",
+)
+@click.option(
+    "--previous-dump-file",
+    default="",
+    help="Incremental mode: dump that the previous corpus was built from",
+)
+@click.option(
+    "--previous-output-folder",
+    default="",
+    help="Incremental mode: folder with the previous {train,dev,test}.* files",
+)
+@click.option(
+    "--previous-wikidata-id-splits-file",
+    default="",
+    help="Defaults to wikidata_id_splits.json in --previous-output-folder",
+)
 def main(
     dump_file: str,
     wikidata_id_splits_file: str,
@@ -282,9 +1533,22 @@ def main(
     dev_frac: float = 0.1,
     test_frac: float = 0.1,
     sampling_random_seed: int = 1917,
+    split_mode: str = "random",
+    sampling_mode: str = "shuffle",
     max_names_per_lang_train: int = 100000,
     max_names_per_lang_dev: int = 5000,
     max_names_per_lang_test: int = 5000,
+    chunksize: Optional[int] = None,
+    cache_dir: str = "",
+    workers: int = 1,
+    tag_conditions: str = "",
+    corpus_prefix: str = "pn-tag-ablation",
+    reverse_corpus_prefix: str = "",
+    compression: str = "none",
+    binarized_output_folder: str = "",
+    previous_dump_file: str = "",
+    previous_output_folder: str = "",
+    previous_wikidata_id_splits_file: str = "",
 ) -> None:
     def unicode_normalize(word: str) -> str:
         if normalization == "none":
@@ -292,18 +1556,174 @@ def main(
         else:
             return unicodedata.normalize(normalization, word)
 
-    dump = read(dump_file, "tsv")
-    dump, wikidata_id_splits = add_split_column(
-        dump,
-        wikidata_id_column=wikidata_id_column,
-        split_column=split_column,
-        train_frac=train_frac,
-        dev_frac=dev_frac,
-        test_frac=test_frac,
-        random_seed=sampling_random_seed,
-    )
+    if not output_folder:
+        output_folder = "data"
+        print(f'Parameter "output folder" not found. Defaulting to {output_folder}')
+
+    if previous_dump_file:
+        if tag_conditions:
+            raise ValueError("Incremental mode does not support --tag-conditions")
+
+        if not previous_output_folder:
+            raise ValueError("Incremental mode needs --previous-output-folder")
+
+        if not previous_wikidata_id_splits_file:
+            previous_wikidata_id_splits_file = (
+                f"{previous_output_folder}/wikidata_id_splits.json"
+            )
+
+        with open(previous_wikidata_id_splits_file, "rb") as f_splits:
+            previous_wikidata_id_splits = orjson.loads(f_splits.read())
+
+        output_folder = resolve_output_folder(
+            output_folder,
+            normalization=normalization,
+            filter_out_english=filter_out_english,
+        )
+        wikidata_id_splits, stats_df = update_corpus_incrementally(
+            read(dump_file, "tsv", cache_dir=cache_dir),
+            read(previous_dump_file, "tsv", cache_dir=cache_dir),
+            previous_id_to_split=previous_wikidata_id_splits,
+            previous_folder=previous_output_folder,
+            output_folder=output_folder,
+            language_column=language_column,
+            type_column=type_column,
+            src_column=src_column,
+            tgt_column=tgt_column,
+            wikidata_id_column=wikidata_id_column,
+            split_column=split_column,
+            filter_out_english=filter_out_english,
+            include_language_tag=include_language_tag,
+            include_script_tag=include_script_tag,
+            include_type_tag=include_type_tag,
+            reverse=reverse_mode,
+            train_frac=train_frac,
+            dev_frac=dev_frac,
+            test_frac=test_frac,
+            random_seed=sampling_random_seed,
+            split_mode=split_mode,
+            max_names_per_lang_train=max_names_per_lang_train,
+            max_names_per_lang_dev=max_names_per_lang_dev,
+            max_names_per_lang_test=max_names_per_lang_test,
+            workers=workers,
+            compression=compression,
+            sampling_mode=sampling_mode,
+        )
+
+        print("Parallel data statistics:")
+        print(stats_df)
+
+        if binarized_output_folder:
+            binarize_corpus(
+                output_folder,
+                resolve_output_folder(
+                    binarized_output_folder,
+                    normalization=normalization,
+                    filter_out_english=filter_out_english,
+                ),
+            )
+
+        if wikidata_id_splits_file:
+            with open(wikidata_id_splits_file, "w") as f_splits:
+                f_splits.write(orjson_dump(wikidata_id_splits))
+
+        if stats_file:
+            stats_df.to_csv(stats_file, sep="\t")
+
+        return
+
+    orig_n_names_per_lang = None
 
-    output_lines, stats_df = convert_dump_into_lines(
+    if chunksize:
+        dump, wikidata_id_splits, orig_n_names_per_lang = read_dump_low_memory(
+            dump_file,
+            language_column=language_column,
+            type_column=type_column,
+            src_column=src_column,
+            tgt_column=tgt_column,
+            wikidata_id_column=wikidata_id_column,
+            split_column=split_column,
+            train_frac=train_frac,
+            dev_frac=dev_frac,
+            test_frac=test_frac,
+            chunksize=chunksize,
+            filter_out_english=filter_out_english,
+            random_seed=sampling_random_seed,
+            split_mode=split_mode,
+            cache_dir=cache_dir,
+            max_names_thresholds=(
+                get_max_names_thresholds(
+                    max_names_per_lang_train=max_names_per_lang_train,
+                    max_names_per_lang_dev=max_names_per_lang_dev,
+                    max_names_per_lang_test=max_names_per_lang_test,
+                )
+                if sampling_mode == "priority"
+                else None
+            ),
+        )
+    else:
+        dump = read(dump_file, "tsv", cache_dir=cache_dir)
+        dump, wikidata_id_splits = (
+            add_hash_split_column if split_mode == "hash" else add_split_column
+        )(
+            dump,
+            wikidata_id_column=wikidata_id_column,
+            split_column=split_column,
+            train_frac=train_frac,
+            dev_frac=dev_frac,
+            test_frac=test_frac,
+            random_seed=sampling_random_seed,
+        )
+
+    if tag_conditions:
+        conditions = [tags.strip() for tags in tag_conditions.split(",")]
+        unknown_conditions = set(conditions) - set(TAG_CONDITIONS)
+
+        if unknown_conditions:
+            raise ValueError(f"Unknown tag conditions: {unknown_conditions}")
+
+        output_rows, stats_df = convert_dump_into_rows(
+            dump,
+            language_column,
+            type_column,
+            src_column,
+            tgt_column,
+            wikidata_id_column,
+            split_column=split_column,
+            filter_out_english=filter_out_english,
+            detect_script=any(parse_tag_condition(tags)[1] for tags in conditions),
+            reverse=reverse_mode,
+            max_names_per_lang_train=max_names_per_lang_train,
+            max_names_per_lang_dev=max_names_per_lang_dev,
+            max_names_per_lang_test=max_names_per_lang_test,
+            workers=workers,
+            sampling_mode=sampling_mode,
+            orig_n_names_per_lang=orig_n_names_per_lang,
+        )
+
+        print("Parallel data statistics:")
+        print(stats_df)
+
+        corpus_folders = write_tag_conditions(
+            output_rows,
+            tag_conditions=conditions,
+            output_folder=output_folder,
+            corpus_prefix=corpus_prefix,
+            normalization=normalization,
+            filter_out_english=filter_out_english,
+            reverse_corpus_prefix=reverse_corpus_prefix,
+            binarized_output_folder=binarized_output_folder,
+            compression=compression,
+        )
+
+        for corpus_folder in corpus_folders:
+            with open(f"{corpus_folder}/wikidata_id_splits.json", "w") as f_splits:
+                f_splits.write(orjson_dump(wikidata_id_splits))
+            stats_df.to_csv(f"{corpus_folder}/parallel_data_stats.tsv", sep="\t")
+
+        return
+
+    output_rows, stats_df = convert_dump_into_rows(
         dump,
         language_column,
         type_column,
@@ -311,45 +1731,41 @@ def main(
         tgt_column,
         wikidata_id_column,
         split_column=split_column,
-        include_language_tag=include_language_tag,
-        include_script_tag=include_script_tag,
-        include_type_tag=include_type_tag,
         filter_out_english=filter_out_english,
+        detect_script=include_script_tag,
         reverse=reverse_mode,
         max_names_per_lang_train=max_names_per_lang_train,
         max_names_per_lang_dev=max_names_per_lang_dev,
         max_names_per_lang_test=max_names_per_lang_test,
+        workers=workers,
+        sampling_mode=sampling_mode,
+        orig_n_names_per_lang=orig_n_names_per_lang,
     )
 
     print("Parallel data statistics:")
     print(stats_df)
 
-    # Resolve output folder and make sure it exists
-
-    if not output_folder:
-        output_folder = "data"
-        print(f'Parameter "output folder" not found. Defaulting to {output_folder}')
-
-    output_folder = f"{output_folder}/{normalization.lower()}_normalized"
-
-    if filter_out_english:
-        output_folder = f"{output_folder}_noeng"
+    # Resolve output folder, make sure it exists and finally write to disk
+    output_folder = resolve_output_folder(
+        output_folder, normalization=normalization, filter_out_english=filter_out_english
+    )
+    with ParallelCorpusWriter(
+        output_folder,
+        include_language_tag=include_language_tag,
+        include_script_tag=include_script_tag,
+        include_type_tag=include_type_tag,
+        compression=compression,
+    ) as writer:
+        write_corpora(output_rows, [writer])
 
-    if not os.path.exists(output_folder):
-        print(f"Folder {output_folder} not found. Creating...")
-        os.mkdir(output_folder)
-
-    # Finally write to disk
-
-    for split, lines in output_lines.items():
-        langs_filename = f"{output_folder}/{split}.languages"
-        src_filename = f"{output_folder}/{split}.src"
-        tgt_filename = f"{output_folder}/{split}.tgt"
-        write_parallel_lines(
-            lines,
-            src_path=src_filename,
-            tgt_path=tgt_filename,
-            langs_path=langs_filename,
+    if binarized_output_folder:
+        binarize_corpus(
+            output_folder,
+            resolve_output_folder(
+                binarized_output_folder,
+                normalization=normalization,
+                filter_out_english=filter_out_english,
+            ),
         )
 
     if wikidata_id_splits_file:
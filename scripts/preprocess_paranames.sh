@@ -5,7 +5,7 @@ set -euo pipefail
 # Preprocesses the ParaNames data
 
 [ $# -lt 2 ] \
-    && echo "Usage: preprocess_paranames.sh corpus_name dump_tsv [train_frac=0.8] [dev_frac=0.1] [test_frac=0.1] [n_workers=1] [include_lang_tag=yes] [include_type_tag=no] [include_script_tag=no] [max_names_per_lang_train=100000] [max_names_per_lang_dev=5000] [max_names_per_lang_test=5000] [reverse=no]" \
+    && echo "Usage: preprocess_paranames.sh corpus_name dump_tsv [train_frac=0.8] [dev_frac=0.1] [test_frac=0.1] [n_workers=1] [include_lang_tag=yes] [include_type_tag=no] [include_script_tag=no] [max_names_per_lang_train=100000] [max_names_per_lang_dev=5000] [max_names_per_lang_test=5000] [reverse=no] [previous_dump_tsv] [previous_corpus_name=corpus_name]" \
     && exit 1
 
 CORPUS_NAME=$1
@@ -26,6 +26,15 @@ MAX_NAMES_PER_LANG_TEST=${12:-5000}
 # Should src and tgt be reversed
 REVERSE=${13:-no}
 
+# If given, incrementally update the corpus built from this dump
+PREVIOUS_DUMP_TSV=${14:-}
+PREVIOUS_CORPUS_NAME=${15:-$CORPUS_NAME}
+
+# Binarize with fairseq-preprocess. Set to "no" to have prep_parallel_data.py
+# write the binarized data itself (see tests/test_binarize.py for the parity
+# test against fairseq-preprocess)
+BINARIZE_WITH_FAIRSEQ=${BINARIZE_WITH_FAIRSEQ:-yes}
+
 # Constants (change if needed)
 ID_COLUMN="wikidata_id"
 UNICODE_NORMALIZATION="none"
@@ -43,6 +52,8 @@ ID_SPLITS_RANDOM_SEED=1917
 mkdir -p "$OUTPUT"
 mkdir -p "$BIN_OUTPUT"
 
+PREVIOUS_OUTPUT_FOLDER="data/${PREVIOUS_CORPUS_NAME}/${UNICODE_NORMALIZATION}_normalized_noeng"
+
 # Step 1: Prepare parallel data from dump
 python scripts/prep_parallel_data.py \
     --dump-file $DUMP_TSV \
@@ -64,16 +75,22 @@ python scripts/prep_parallel_data.py \
     --max-names-per-lang-train $MAX_NAMES_PER_LANG_TRAIN \
     --max-names-per-lang-dev $MAX_NAMES_PER_LANG_DEV \
     --max-names-per-lang-test $MAX_NAMES_PER_LANG_TEST \
+    --workers $N_WORKERS \
+    $([ "$BINARIZE_WITH_FAIRSEQ" = "no" ] && echo "--binarized-output-folder $BIN_OUTPUT")\
+    $([ -n "$PREVIOUS_DUMP_TSV" ] && echo "--previous-dump-file $PREVIOUS_DUMP_TSV --previous-output-folder $PREVIOUS_OUTPUT_FOLDER")\
     --stats-file $DATA_STATS_FILE
  
-# Step 2: Binarize data
-FOLDER=$OUTPUT/${UNICODE_NORMALIZATION}_normalized_noeng
-BIN_FOLDER=$BIN_OUTPUT/$(basename $FOLDER)
-mkdir -p $BIN_FOLDER
-fairseq-preprocess \
-    --source-lang src --target-lang tgt \
-    --trainpref $FOLDER/train \
-    --validpref $FOLDER/dev \
-    --testpref $FOLDER/test \
-    --destdir $BIN_FOLDER \
-    --workers $N_WORKERS
+# Step 2: Binarize data (only needed with fairseq-preprocess)
+if [ "$BINARIZE_WITH_FAIRSEQ" = "yes" ]
+then
+    FOLDER=$OUTPUT/${UNICODE_NORMALIZATION}_normalized_noeng
+    BIN_FOLDER=$BIN_OUTPUT/$(basename $FOLDER)
+    mkdir -p $BIN_FOLDER
+    fairseq-preprocess \
+        --source-lang src --target-lang tgt \
+        --trainpref $FOLDER/train \
+        --validpref $FOLDER/dev \
+        --testpref $FOLDER/test \
+        --destdir $BIN_FOLDER \
+        --workers $N_WORKERS
+fi
@@ -1,10 +1,44 @@
 #!/usr/bin/env python
 
-from typing import Union
+from typing import Tuple, Union
 from pathlib import Path
 
 import click
-from tqdm import tqdm
+
+from util import parallel_map
+
+
+def swap_line(lines: Tuple[str, str]) -> Tuple[str, str]:
+    """Swaps the source and target sides of a line pair, keeping up to 3
+    tags on the source side."""
+
+    src_line, tgt_line = lines
+    n_tags_appended = 0
+    src_tokens = src_line.split(" ")
+
+    # Turn source -> target, keeping tags on source side
+    new_src_tokens = []
+    new_tgt_tokens = []
+    for src_tok in src_tokens:
+        if (
+            src_tok.startswith("<")
+            and src_tok.endswith(">")
+            and len(src_tok) >= 4
+            and n_tags_appended < 3
+        ):
+            new_src_tokens.append(src_tok)
+            n_tags_appended += 1
+        else:
+            new_tgt_tokens.append(src_tok)
+
+    # Turn target -> source
+    tgt_tokens = tgt_line.split(" ")
+    new_src_tokens.extend(tgt_tokens)
+
+    new_src_line = " ".join(new_src_tokens)
+    new_tgt_line = " ".join(new_tgt_tokens)
+
+    return new_src_line, new_tgt_line
 
 
 @click.command()
@@ -18,11 +52,13 @@ from tqdm import tqdm
 )
 @click.option("--src-output-file", type=click.Path(file_okay=True))
 @click.option("--tgt-output-file", type=click.Path(file_okay=True))
+@click.option("--workers", type=int, default=1)
 def main(
     src_input_file: Union[str, Path],
     tgt_input_file: Union[str, Path],
     src_output_file: Union[str, Path],
     tgt_output_file: Union[str, Path],
+    workers: int = 1,
 ) -> None:
 
     # Convert to Path
@@ -41,33 +77,9 @@ def main(
     ) as tgt_in, open(src_output_file, "w", encoding="utf-8") as src_out, open(
         tgt_output_file, "w", encoding="utf-8"
     ) as tgt_out:
-        for src_line, tgt_line in tqdm(zip(src_in, tgt_in)):
-            n_tags_appended = 0
-            src_tokens = src_line.split(" ")
-
-            # Turn source -> target, keeping tags on source side
-            new_src_tokens = []
-            new_tgt_tokens = []
-            for src_tok in src_tokens:
-                if (
-                    src_tok.startswith("<")
-                    and src_tok.endswith(">")
-                    and len(src_tok) >= 4
-                    and n_tags_appended < 3
-                ):
-                    new_src_tokens.append(src_tok)
-                    n_tags_appended += 1
-                else:
-                    new_tgt_tokens.append(src_tok)
-
-            # Turn target -> source
-            tgt_tokens = tgt_line.split(" ")
-            new_src_tokens.extend(tgt_tokens)
-
-            # Write to disk
-            new_src_line = " ".join(new_src_tokens)
-            new_tgt_line = " ".join(new_tgt_tokens)
-
+        for new_src_line, new_tgt_line in parallel_map(
+            swap_line, zip(src_in, tgt_in), workers=workers, max_pending=2 * workers
+        ):
             # No need to add \n since they already end in one
             src_out.write(f"{new_src_line}")
             tgt_out.write(f"{new_tgt_line}")
@@ -1,13 +1,59 @@
 import csv
+import glob
+import gzip
+import hashlib
 import itertools
 import json
+import math
+import os
+import queue
+from collections import deque
+from contextlib import nullcontext
+from functools import partial
+from multiprocessing import Pool
 from pathlib import Path
-from typing import Union, Optional, Dict, Any, Iterable, List
+from typing import (
+    Union,
+    Optional,
+    Dict,
+    Any,
+    Callable,
+    Iterable,
+    Iterator,
+    List,
+    TextIO,
+)
 
 import orjson
 import pandas as pd
+import pyarrow as pa
 from tqdm import tqdm
 
+CACHE_FORMAT_VERSION = 1
+CACHE_CATEGORICAL_COLUMNS_KEY = b"categorical_columns"
+
+COMPRESSION_SUFFIXES = {"none": "", "gzip": ".gz", "zstd": ".zst"}
+
+NA_VALUES = frozenset(
+    [
+        "#N/A",
+        "#N/A N/A",
+        "#NA",
+        "-1.#IND",
+        "-1.#QNAN",
+        "-NaN",
+        "1.#IND",
+        "1.#QNAN",
+        "<NA>",
+        "N/A",
+        "NA",
+        "NULL",
+        "NaN",
+        "n/a",
+        "null",
+    ]
+)
+
 
 def maybe_infer_io_format(file_path: str, io_format: Optional[str] = None) -> str:
     if io_format:
@@ -16,39 +62,240 @@ def maybe_infer_io_format(file_path: str, io_format: Optional[str] = None) -> st
         return Path(file_path).suffix.lstrip(".")
 
 
+def file_content_hash(input_file: str, block_size: int = 1 << 24) -> str:
+    """Hex digest of the contents of `input_file`"""
+    h = hashlib.blake2b(digest_size=16)
+
+    with open(input_file, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+
+    return h.hexdigest()
+
+
+def input_path_hash(input_file: str) -> str:
+    """Hex digest of the resolved absolute path of `input_file`"""
+    path = str(Path(input_file).resolve())
+
+    return hashlib.blake2b(path.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def read_options_hash(io_format: str, column_names: Optional[List[str]], **kwargs) -> str:
+    """Hex digest of the options that change what `read` returns"""
+    options = json.dumps(
+        {
+            "version": CACHE_FORMAT_VERSION,
+            "io_format": io_format,
+            "column_names": column_names,
+            "kwargs": kwargs,
+        },
+        sort_keys=True,
+        default=str,
+    )
+
+    return hashlib.blake2b(options.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def write_cached_table(
+    frames: Iterable[pd.DataFrame], cache_file: str
+) -> Iterator[pd.DataFrame]:
+    """Passes `frames` through while writing them to `cache_file` as an Arrow
+    IPC file. Categoricals are stored as plain columns, since the categories
+    of each chunk differ, and restored by `read_cached_table`.
+
+    The file only appears once all frames have been written, so an
+    interrupted read never leaves a partial cache behind.
+    """
+
+    tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+    writer = None
+
+    try:
+        for frame in frames:
+            batch = pa.RecordBatch.from_pandas(frame, preserve_index=False)
+
+            if writer is None:
+                categorical_columns = [
+                    field.name
+                    for field in batch.schema
+                    if pa.types.is_dictionary(field.type)
+                ]
+                schema = pa.schema(
+                    [
+                        pa.field(field.name, field.type.value_type)
+                        if field.name in categorical_columns
+                        else field
+                        for field in batch.schema
+                    ],
+                    metadata={
+                        CACHE_CATEGORICAL_COLUMNS_KEY: orjson.dumps(
+                            categorical_columns
+                        )
+                    },
+                )
+                writer = pa.ipc.new_file(tmp_file, schema)
+
+            batch = pa.RecordBatch.from_arrays(
+                [
+                    column.dictionary_decode()
+                    if pa.types.is_dictionary(column.type)
+                    else column
+                    for column in batch.columns
+                ],
+                names=batch.schema.names,
+            )
+            writer.write_batch(batch.cast(schema))
+
+            yield frame
+
+        if writer is not None:
+            writer.close()
+            writer = None
+            os.replace(tmp_file, cache_file)
+    finally:
+        if writer is not None:
+            writer.close()
+
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+
+
+def read_cached_table(
+    cache_file: str, chunksize: Union[int, None] = None
+) -> Union[pd.DataFrame, Iterator[pd.DataFrame]]:
+    """Memory-maps a cache written by `write_cached_table`. With `chunksize`,
+    yields frames of that many rows, indexed like `pd.read_csv` chunks."""
+
+    table = pa.ipc.open_file(pa.memory_map(cache_file)).read_all()
+    categorical_columns = orjson.loads(
+        table.schema.metadata[CACHE_CATEGORICAL_COLUMNS_KEY]
+    )
+
+    def to_pandas(table_slice: pa.Table, start: int) -> pd.DataFrame:
+        frame = table_slice.to_pandas()
+        frame.index = pd.RangeIndex(start, start + len(frame))
+
+        return frame.astype({column: "category" for column in categorical_columns})
+
+    if chunksize is None:
+        return to_pandas(table, 0)
+
+    return (
+        to_pandas(table.slice(start, chunksize), start)
+        for start in range(0, table.num_rows, chunksize)
+    )
+
+
+def read_with_cache(
+    input_file: str,
+    io_format: str,
+    cache_dir: str,
+    chunksize: Union[int, None] = None,
+    column_names: Optional[List[str]] = None,
+    **kwargs,
+) -> Union[pd.DataFrame, Iterator[pd.DataFrame]]:
+    """Reads a CSV/TSV file through an on-disk columnar cache.
+
+    Cache files are named after the input file, the hash of its absolute
+    path, the read options and the hash of the input file's contents, so a
+    changed file misses the cache. Stale caches for the same path and
+    options are removed on write, leaving those of files with the same name
+    in other folders.
+    """
+
+    os.makedirs(cache_dir, exist_ok=True)
+    cache_prefix = os.path.join(
+        cache_dir,
+        ".".join(
+            [
+                Path(input_file).name,
+                input_path_hash(input_file),
+                read_options_hash(io_format, column_names, **kwargs),
+            ]
+        ),
+    )
+    cache_file = f"{cache_prefix}.{file_content_hash(input_file)}.arrow"
+
+    if os.path.exists(cache_file):
+        return read_cached_table(cache_file, chunksize=chunksize)
+
+    for stale_file in Path(cache_dir).glob(
+        f"{glob.escape(Path(cache_prefix).name)}.*.arrow"
+    ):
+        stale_file.unlink()
+
+    frames = read(
+        input_file, io_format, chunksize=chunksize, column_names=column_names, **kwargs
+    )
+
+    if chunksize is None:
+        for _ in write_cached_table([frames], cache_file):
+            pass
+
+        return frames
+
+    return write_cached_table(frames, cache_file)
+
+
+def prune_cache(cache_dir: str, max_bytes: int, pattern: str = "*") -> None:
+    """Removes the least recently used files matching `pattern` from
+    `cache_dir` until they take at most `max_bytes`. Readers should touch
+    the files they use, since recency is taken from modification times."""
+
+    cache_files = []
+
+    for path in Path(cache_dir).glob(pattern):
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            # Pruned meanwhile by another process sharing the cache
+            continue
+
+        cache_files.append((stat.st_mtime, stat.st_size, path))
+
+    cache_files.sort()
+    total_bytes = sum(size for _, size, _ in cache_files)
+
+    for _, size, path in cache_files:
+        if total_bytes <= max_bytes:
+            break
+
+        path.unlink(missing_ok=True)
+        total_bytes -= size
+
+
 def read(
     input_file: str,
     io_format: str,
     typ: str = "frame",
     chunksize: Union[int, None] = None,
     column_names: Optional[List[str]] = None,
+    cache_dir: Optional[str] = None,
     **kwargs,
 ) -> pd.DataFrame:
+    """Reads a CSV/TSV/JSON(L) file with pandas.
+
+    With `cache_dir`, CSV/TSV files are read through a columnar cache that is
+    memory-mapped on later reads instead of parsing the file again.
+    """
+
+    if cache_dir and io_format in ["csv", "tsv"]:
+        return read_with_cache(
+            input_file,
+            io_format,
+            cache_dir,
+            chunksize=chunksize,
+            column_names=column_names,
+            **kwargs,
+        )
+
     if io_format in ["csv", "tsv"]:
         return pd.read_csv(
             input_file,
             encoding="utf-8",
             delimiter="\t" if io_format == "tsv" else ",",
             chunksize=chunksize,
-            na_values=set(
-                [
-                    "#N/A",
-                    "#N/A N/A",
-                    "#NA",
-                    "-1.#IND",
-                    "-1.#QNAN",
-                    "-NaN",
-                    "1.#IND",
-                    "1.#QNAN",
-                    "<NA>",
-                    "N/A",
-                    "NA",
-                    "NULL",
-                    "NaN",
-                    "n/a",
-                    "null",
-                ]
-            ),
+            na_values=set(NA_VALUES),
             keep_default_na=False,
             names=column_names,
             **kwargs,
@@ -56,7 +303,7 @@ def read(
     elif io_format == "jsonl":
         return pd.read_json(
             input_file,
-            "records",
+            orient="records",
             encoding="utf-8",
             typ=typ,
             lines=True,
@@ -69,6 +316,67 @@ def read(
         )
 
 
+def iter_records(
+    input_file: str,
+    io_format: Optional[str] = None,
+    columns: Optional[List[str]] = None,
+    column_names: Optional[List[str]] = None,
+    as_tuples: bool = False,
+    na_values: Iterable[str] = NA_VALUES,
+    quoting: int = csv.QUOTE_MINIMAL,
+) -> Iterator[Union[Dict[str, Any], tuple]]:
+    """Streams the records of a CSV/TSV/JSONL file one at a time, without
+    building a DataFrame.
+
+    Records are dicts, or tuples if `as_tuples`, restricted to and ordered
+    like `columns` if given. `column_names` names the columns of a file
+    without a header row. CSV/TSV values are kept as strings, except for
+    `na_values`, which become `None` (where `read` would give NaN).
+    """
+
+    io_format = maybe_infer_io_format(input_file, io_format)
+
+    if io_format in ["csv", "tsv"]:
+        na_values = frozenset(na_values)
+
+        with open(input_file, encoding="utf-8", newline="") as f:
+            reader = csv.reader(
+                f, delimiter="\t" if io_format == "tsv" else ",", quoting=quoting
+            )
+            header = column_names or next(reader)
+            columns = columns or header
+            indices = [header.index(column) for column in columns]
+            n_fields = len(header)
+
+            for values in reader:
+                # Skip blank lines and pad short rows, like pd.read_csv
+                if not values:
+                    continue
+
+                if len(values) < n_fields:
+                    values.extend([None] * (n_fields - len(values)))
+
+                record = tuple(
+                    None if values[ix] in na_values else values[ix] for ix in indices
+                )
+
+                yield record if as_tuples else dict(zip(columns, record))
+    elif io_format == "jsonl":
+        with open(input_file, "rb") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+
+                record = orjson.loads(line)
+
+                if columns:
+                    record = {column: record.get(column) for column in columns}
+
+                yield tuple(record.values()) if as_tuples else record
+    else:
+        raise ValueError(f"[iter_records] Format {io_format} not supported!")
+
+
 def write_csv_writer(
     data: Union[Iterable[Dict[str, Any]], pd.DataFrame],
     output_file: str,
@@ -150,6 +458,42 @@ def json_dump(d: dict) -> str:
     return json.dumps(d, ensure_ascii=False)
 
 
+def open_text(path: str, mode: str = "r", buffer_size: int = 1 << 20) -> TextIO:
+    """Opens a UTF-8 text file, compressed with gzip or zstd if `path` ends
+    in `.gz` or `.zst`. zstd needs the optional `zstandard` package."""
+
+    if path.endswith(".gz"):
+        return gzip.open(path, f"{mode}t", compresslevel=6, encoding="utf-8")
+    elif path.endswith(".zst"):
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError(f"Install zstandard to read or write {path}")
+
+        return zstandard.open(path, f"{mode}t", encoding="utf-8")
+    else:
+        return open(path, mode, encoding="utf-8", buffering=buffer_size)
+
+
+def find_text_file(path: str) -> str:
+    """Returns `path`, or its compressed version if only that one exists"""
+
+    for suffix in COMPRESSION_SUFFIXES.values():
+        if os.path.exists(f"{path}{suffix}"):
+            return f"{path}{suffix}"
+
+    return path
+
+
+def remove_other_compressions(path: str, suffix: str) -> None:
+    """Removes the versions of `path` with a compression suffix other than
+    `suffix`, so that `find_text_file` cannot pick up a stale file."""
+
+    for other_suffix in COMPRESSION_SUFFIXES.values():
+        if other_suffix != suffix and os.path.exists(f"{path}{other_suffix}"):
+            os.remove(f"{path}{other_suffix}")
+
+
 def chunks(iterable, size, should_enumerate=False):
     """Source: https://alexwlchan.net/2018/12/iterating-in-fixed-size-chunks/"""
     it = iter(iterable)
@@ -162,3 +506,107 @@ def chunks(iterable, size, should_enumerate=False):
             break
         yield (ix, chunk) if should_enumerate else chunk
         ix += 1
+
+
+def map_chunk(fn: Callable, chunk: tuple, batched: bool = False) -> list:
+    """Worker for `parallel_map`"""
+    return list(fn(chunk)) if batched else [fn(item) for item in chunk]
+
+
+def bounded_imap(
+    pool: Pool,
+    fn: Callable,
+    iterable: Iterable,
+    max_pending: int,
+    ordered: bool = True,
+) -> Iterator:
+    """Like `pool.imap` (or `pool.imap_unordered`), but submits items from
+    the consuming thread, so that at most `max_pending` of them are sent to
+    the workers and not yet yielded. The pool's own threads never wait on
+    the caller, so an exception in a worker, or closing this generator,
+    can always stop the pool."""
+
+    items = iter(iterable)
+    pending = deque()
+    finished = queue.SimpleQueue()
+
+    while True:
+        for item in itertools.islice(items, max_pending - len(pending)):
+            if ordered:
+                pending.append(pool.apply_async(fn, (item,)))
+            else:
+                pending.append(
+                    pool.apply_async(
+                        fn,
+                        (item,),
+                        callback=lambda result: finished.put((True, result)),
+                        error_callback=lambda error: finished.put((False, error)),
+                    )
+                )
+
+        if not pending:
+            return
+
+        if ordered:
+            yield pending.popleft().get()
+        else:
+            ok, result = finished.get()
+            pending.pop()
+
+            if not ok:
+                raise result
+
+            yield result
+
+
+def parallel_map(
+    fn: Callable,
+    iterable: Iterable,
+    chunk_size: int = 10000,
+    workers: int = 1,
+    ordered: bool = True,
+    batched: bool = False,
+    description: Optional[str] = None,
+    total: Optional[int] = None,
+    max_pending: Optional[int] = None,
+) -> Iterator:
+    """Applies `fn` to every item, sending `chunk_size` items at a time to a
+    pool of `workers` processes (or running in this process if `workers`
+    is 1), and yields the results.
+
+    Results come in input order unless `ordered=False`. With `batched`, `fn`
+    takes a whole chunk and returns one result per item. Progress is shown
+    once per chunk. `fn` must be picklable, e.g. a module-level function or
+    a `functools.partial` of one. An exception in a worker stops the pool
+    and is raised here.
+
+    The pool reads `iterable` as fast as it can, so a lazy iterable is held
+    in memory anyway unless `max_pending` bounds the number of chunks sent
+    to the workers but not yet yielded.
+    """
+
+    if total is None and hasattr(iterable, "__len__"):
+        total = len(iterable)
+
+    chunk_fn = partial(map_chunk, fn, batched=batched)
+    batches = chunks(iterable, chunk_size)
+
+    with (Pool(workers) if workers > 1 else nullcontext()) as pool:
+        if pool is None:
+            results = map(chunk_fn, batches)
+        elif max_pending:
+            results = bounded_imap(
+                pool, chunk_fn, batches, max_pending=max_pending, ordered=ordered
+            )
+        elif ordered:
+            results = pool.imap(chunk_fn, batches)
+        else:
+            results = pool.imap_unordered(chunk_fn, batches)
+
+        for result in tqdm(
+            results,
+            total=None if total is None else math.ceil(total / chunk_size),
+            desc=description,
+            unit="chunk",
+        ):
+            yield from result
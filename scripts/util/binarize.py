@@ -0,0 +1,217 @@
+import os
+import re
+import struct
+from collections import Counter
+from typing import Iterable, Iterator, List, Tuple
+
+import numpy as np
+from rich.progress import track
+
+from util import open_text, find_text_file
+
+"""Writes fairseq binarized datasets without calling fairseq-preprocess.
+
+Mirrors what `fairseq-preprocess --source-lang src --target-lang tgt`
+produces with default settings (fairseq 0.12):
+    - dict.{src,tgt}.txt built from the training data
+    - {train,valid,test}.src-tgt.{src,tgt}.{bin,idx} in the `mmap` format
+"""
+
+SPACE_NORMALIZER = re.compile(r"\s+")
+
+# Header of fairseq's MMapIndexedDataset index files
+MMAP_INDEX_MAGIC = b"MMIDIDX\x00\x00"
+MMAP_INDEX_VERSION = 1
+MMAP_DTYPE_CODES = {np.uint16: 8, np.uint32: 9, np.int64: 5}
+
+# fairseq calls the dev set "valid"
+FAIRSEQ_SPLIT_NAMES = {"train": "train", "dev": "valid", "test": "test"}
+
+
+def tokenize_line(line: str) -> List[str]:
+    """Same as `fairseq.tokenizer.tokenize_line`"""
+    line = SPACE_NORMALIZER.sub(" ", line)
+    line = line.strip()
+
+    return line.split()
+
+
+def best_fitting_int_dtype(vocab_size: int) -> type:
+    """Same as `fairseq.data.indexed_dataset.best_fitting_int_dtype`"""
+
+    if vocab_size < 65500:
+        return np.uint16
+    elif vocab_size < 4294967295:
+        return np.uint32
+    else:
+        return np.int64
+
+
+class Dictionary:
+    """Minimal counterpart to `fairseq.data.Dictionary`, enough to build
+    and save a dictionary and encode lines with it."""
+
+    def __init__(
+        self,
+        bos: str = "<s>",
+        pad: str = "<pad>",
+        eos: str = "</s>",
+        unk: str = "<unk>",
+    ) -> None:
+        self.eos_word = eos
+        self.symbols = [bos, pad, eos, unk]
+        self.count = [1, 1, 1, 1]
+        self.indices = {symbol: ix for ix, symbol in enumerate(self.symbols)}
+        self.nspecial = len(self.symbols)
+        self.eos_index = self.indices[eos]
+        self.unk_index = self.indices[unk]
+
+    def __len__(self) -> int:
+        return len(self.symbols)
+
+    def add_symbol(self, symbol: str, n: int = 1) -> int:
+        if symbol in self.indices:
+            ix = self.indices[symbol]
+            self.count[ix] += n
+        else:
+            ix = len(self.symbols)
+            self.indices[symbol] = ix
+            self.symbols.append(symbol)
+            self.count.append(n)
+
+        return ix
+
+    @classmethod
+    def build(cls, lines: Iterable[str], padding_factor: int = 8) -> "Dictionary":
+        """Same as `fairseq.tasks.FairseqTask.build_dictionary` with the
+        default threshold and number of words."""
+
+        counter = Counter()
+        n_lines = 0
+
+        for line in lines:
+            counter.update(tokenize_line(line))
+            n_lines += 1
+
+        d = cls()
+        counter[d.eos_word] += n_lines
+
+        for symbol, count in sorted(counter.items()):
+            d.add_symbol(symbol, count)
+
+        d.finalize(padding_factor=padding_factor)
+
+        return d
+
+    def finalize(self, padding_factor: int = 8) -> None:
+        """Sorts non-special symbols by count (ties alphabetically) and pads
+        the dictionary to a multiple of `padding_factor`."""
+
+        symbols = self.symbols[: self.nspecial]
+        count = self.count[: self.nspecial]
+        by_count = Counter(
+            dict(
+                sorted(zip(self.symbols[self.nspecial :], self.count[self.nspecial :]))
+            )
+        )
+
+        for symbol, symbol_count in by_count.most_common():
+            symbols.append(symbol)
+            count.append(symbol_count)
+
+        self.symbols = symbols
+        self.count = count
+        self.indices = {symbol: ix for ix, symbol in enumerate(self.symbols)}
+
+        i = 0
+        while padding_factor > 1 and len(self) % padding_factor != 0:
+            self.add_symbol(f"madeupword{i:04d}", n=0)
+            i += 1
+
+    def encode_line(self, line: str) -> List[int]:
+        """Token indices of `line` followed by end-of-sentence"""
+        ids = [self.indices.get(word, self.unk_index) for word in tokenize_line(line)]
+        ids.append(self.eos_index)
+
+        return ids
+
+    def save(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            for symbol, count in zip(
+                self.symbols[self.nspecial :], self.count[self.nspecial :]
+            ):
+                f.write(f"{symbol} {count}\n")
+
+
+def write_mmap_dataset(
+    lines: Iterable[str], dictionary: Dictionary, output_prefix: str
+) -> None:
+    """Encodes `lines` and writes `{output_prefix}.bin` and `.idx` in the
+    format of fairseq's `MMapIndexedDatasetBuilder`."""
+
+    dtype = best_fitting_int_dtype(len(dictionary))
+    sizes = []
+
+    with open(f"{output_prefix}.bin", "wb") as f_bin:
+        for line in lines:
+            ids = np.array(dictionary.encode_line(line), dtype=dtype)
+            f_bin.write(ids.tobytes(order="C"))
+            sizes.append(ids.size)
+
+    sizes = np.array(sizes, dtype=np.int32)
+    pointers = np.zeros(len(sizes), dtype=np.int64)
+    np.cumsum(sizes[:-1] * np.dtype(dtype).itemsize, out=pointers[1:])
+
+    with open(f"{output_prefix}.idx", "wb") as f_idx:
+        f_idx.write(MMAP_INDEX_MAGIC)
+        f_idx.write(struct.pack("<Q", MMAP_INDEX_VERSION))
+        f_idx.write(struct.pack("<B", MMAP_DTYPE_CODES[dtype]))
+        f_idx.write(struct.pack("<Q", len(sizes)))
+        f_idx.write(sizes.tobytes(order="C"))
+        f_idx.write(pointers.tobytes(order="C"))
+
+
+def read_corpus_lines(folder: str, split: str, ext: str) -> Iterator[str]:
+    """Streams the lines of `{folder}/{split}.{ext}`, compressed or not"""
+
+    with open_text(find_text_file(f"{folder}/{split}.{ext}")) as f:
+        for line in f:
+            yield line.rstrip("\n")
+
+
+def binarize_corpus(
+    input_folder: str,
+    output_folder: str,
+    splits: Iterable[str] = ("train", "dev", "test"),
+    source_lang: str = "src",
+    target_lang: str = "tgt",
+) -> Tuple[Dictionary, Dictionary]:
+    """Binarizes the `{split}.{src,tgt}` files in `input_folder` into a
+    fairseq data-bin folder, streaming the lines from disk. Dictionaries are
+    built from the train split and missing splits are skipped.
+
+    Returns the source and target dictionaries.
+    """
+
+    src_dict = Dictionary.build(read_corpus_lines(input_folder, "train", source_lang))
+    tgt_dict = Dictionary.build(read_corpus_lines(input_folder, "train", target_lang))
+    src_dict.save(f"{output_folder}/dict.{source_lang}.txt")
+    tgt_dict.save(f"{output_folder}/dict.{target_lang}.txt")
+
+    for split in splits:
+        if not os.path.exists(find_text_file(f"{input_folder}/{split}.{source_lang}")):
+            continue
+
+        prefix = f"{output_folder}/{FAIRSEQ_SPLIT_NAMES[split]}.{source_lang}-{target_lang}"
+
+        for lang, dictionary in [(source_lang, src_dict), (target_lang, tgt_dict)]:
+            write_mmap_dataset(
+                track(
+                    read_corpus_lines(input_folder, split, lang),
+                    description=f"Binarizing {split}.{lang}...",
+                ),
+                dictionary,
+                f"{prefix}.{lang}",
+            )
+
+    return src_dict, tgt_dict
@@ -19,12 +19,33 @@ from typing import (
 )
 
 import icu
+import numpy as np
 import pandas as pd
 from tqdm import tqdm
 from unicodeblock import blocks
 
+# Number of Unicode code points, i.e. size of the lookup tables
+N_CODEPOINTS = 0x110000
+
+# Category flags stored in `UnicodeAnalyzer.icu_script_table`
+PUNCTUATION_FLAG = 1  # P* and S* categories
+NUMBER_FLAG = 2  # N* categories
+
 
 class UnicodeAnalyzer:
+
+    # Code point lookup tables shared by all instances, built on first use.
+    # See `category_flag_table`, `icu_script_table` and `unicode_block_table`.
+    _script_codes: Optional[np.ndarray] = None
+    _category_flags: Optional[np.ndarray] = None
+    _script_names: Dict[int, str] = {}
+    _script_code_list: List[int] = []
+    _category_flag_list: List[int] = []
+    _block_starts: Optional[np.ndarray] = None
+    _block_range_codes: Optional[np.ndarray] = None
+    _block_names: List[str] = []
+    _block_code_list: List[int] = []
+
     def __init__(
         self,
         strip: bool = False,
@@ -50,6 +71,11 @@ class UnicodeAnalyzer:
             lambda w: not self.is_number(str(w)) if self.ignore_numbers else True
         )
 
+        # Same conditions as above, as a bit mask over category flags
+        self.skip_flags = (PUNCTUATION_FLAG if self.ignore_punctuation else 0) | (
+            NUMBER_FLAG if self.ignore_numbers else 0
+        )
+
     def is_punctuation(self, s: str) -> bool:
         is_punc = ud.category(s).startswith("P")
         is_symb = ud.category(s).startswith("S")
@@ -74,14 +100,94 @@ class UnicodeAnalyzer:
         return histogram
 
     def unicode_blocks(self, word: str) -> Counter:
+        self.unicode_block_table()
+        block_codes = self._block_code_list
+        block_names = self._block_names
+        category_flags = self._category_flag_list
+        skip_flags = self.skip_flags
 
         return Counter(
-            blocks.of(c)
+            block_names[block_codes[codepoint]]
+            for codepoint in map(ord, self.maybe_strip(word))
+            if block_codes[codepoint] >= 0
+            and not category_flags[codepoint] & skip_flags
+        )
 
-            for c in self.maybe_strip(word)
+    def block_histograms(
+        self,
+        words: Iterable[str],
+        normalize: Optional[bool] = None,
+        sparse: bool = False,
+    ):
+        """Unicode block histograms of many words at once, as an
+        (n_words x n_blocks) matrix whose columns follow `block_names`.
+
+        Row i counts the same characters as `unicode_blocks(words[i])`. With
+        `normalize` (defaults to `normalize_histogram`), rows sum to 1, except
+        for words without any counted character. With `sparse`, returns a
+        `scipy.sparse.csr_matrix`, which needs scipy.
+        """
+
+        if normalize is None:
+            normalize = self.normalize_histogram
+
+        block_starts, block_range_codes, block_names = self.unicode_block_table()
+        category_flags = self.category_flag_table()
 
-            if blocks.of(c) and self.punctuation_cond(c) and self.digit_cond(c)
+        words = [self.maybe_strip(word) for word in words]
+        codepoints = np.frombuffer(
+            "".join(words).encode("utf-32-le", "surrogatepass"), dtype=np.uint32
+        ).astype(np.int64)
+        word_ixs = np.repeat(np.arange(len(words)), [len(word) for word in words])
+
+        # Range table lookup, then drop unassigned and skipped characters
+        block_codes = block_range_codes[
+            np.searchsorted(block_starts, codepoints, side="right") - 1
+        ]
+        keep = (block_codes >= 0) & (
+            (category_flags[codepoints] & self.skip_flags) == 0
         )
+        block_codes = block_codes[keep]
+        word_ixs = word_ixs[keep]
+        shape = (len(words), len(block_names))
+
+        if sparse:
+            try:
+                from scipy.sparse import csr_matrix
+            except ImportError:
+                raise ImportError("block_histograms(sparse=True) needs scipy")
+
+            counts = csr_matrix(
+                (np.ones(len(block_codes), dtype=np.int64), (word_ixs, block_codes)),
+                shape=shape,
+            )
+            counts.sum_duplicates()
+
+            if normalize:
+                totals = np.asarray(counts.sum(axis=1)).ravel()
+                counts = counts.multiply(
+                    1 / np.maximum(totals, 1)[:, np.newaxis]
+                ).tocsr()
+
+            return counts
+
+        cells, cell_counts = np.unique(
+            word_ixs * len(block_names) + block_codes, return_counts=True
+        )
+        counts = np.zeros(shape, dtype=np.int32)
+        counts.flat[cells] = cell_counts
+
+        if normalize:
+            totals = counts.sum(axis=1, keepdims=True)
+
+            return counts / np.maximum(totals, 1)
+
+        return counts
+
+    @property
+    def block_names(self) -> List[str]:
+        """Column names of `block_histograms`"""
+        return self.unicode_block_table()[2]
 
     def most_common_unicode_block(self, word: str) -> str:
         try:
@@ -98,24 +204,126 @@ class UnicodeAnalyzer:
     def get_icu_script(self, c: str) -> str:
         return icu.Script.getScript(c).getName()
 
-    def icu_scripts(self, word: str) -> Counter:
+    @classmethod
+    def category_flag_table(cls) -> np.ndarray:
+        """Returns the `PUNCTUATION_FLAG`/`NUMBER_FLAG` bits of every code
+        point, building the table on first use."""
+
+        if cls._category_flags is None:
+            category_flags = np.zeros(N_CODEPOINTS, dtype=np.uint8)
+
+            for codepoint in range(N_CODEPOINTS):
+                category = ud.category(chr(codepoint))
+                category_flags[codepoint] = (
+                    PUNCTUATION_FLAG if category[0] in "PS" else 0
+                ) | (NUMBER_FLAG if category[0] == "N" else 0)
+
+            UnicodeAnalyzer._category_flags = category_flags
+
+            # Plain lists are much faster to index one character at a time
+            UnicodeAnalyzer._category_flag_list = category_flags.tolist()
+
+        return cls._category_flags
+
+    @classmethod
+    def unicode_block_table(cls) -> Tuple[np.ndarray, np.ndarray, List[str]]:
+        """Returns the Unicode blocks as a range table: (range starts, block
+        code of each range, block names), building it on first use.
+
+        Block codes index into the block names, with -1 for code points that
+        `unicodeblock` does not assign to a block.
+        """
+
+        if cls._block_starts is None:
+            cls.category_flag_table()
+            block_names = []
+            name_to_code = {None: -1}
+            block_codes = np.empty(N_CODEPOINTS, dtype=np.int16)
+
+            for codepoint in range(N_CODEPOINTS):
+                name = blocks.of(chr(codepoint))
+
+                if name not in name_to_code:
+                    name_to_code[name] = len(block_names)
+                    block_names.append(name)
+
+                block_codes[codepoint] = name_to_code[name]
+
+            block_starts = np.flatnonzero(np.diff(block_codes, prepend=np.int16(-2)))
+
+            UnicodeAnalyzer._block_starts = block_starts
+            UnicodeAnalyzer._block_range_codes = block_codes[block_starts]
+            UnicodeAnalyzer._block_names = block_names
+            UnicodeAnalyzer._block_code_list = block_codes.tolist()
+
+        return cls._block_starts, cls._block_range_codes, cls._block_names
+
+    @classmethod
+    def icu_script_table(cls) -> Tuple[np.ndarray, np.ndarray, Dict[int, str]]:
+        """Returns (script codes, category flags, script names) for every
+        code point, building the tables on first use.
+
+        Script codes are ICU `UScriptCode`s and `script_names` maps them
+        to the names returned by `get_icu_script`.
+        """
+
+        if cls._script_codes is None:
+            cls.category_flag_table()
+            script_codes = np.zeros(N_CODEPOINTS, dtype=np.uint16)
+            script_names = {}
+
+            for codepoint in range(N_CODEPOINTS):
+                script = icu.Script.getScript(chr(codepoint))
+                script_code = script.getScriptCode()
+
+                if script_code not in script_names:
+                    script_names[script_code] = script.getName()
+
+                script_codes[codepoint] = script_code
+
+            UnicodeAnalyzer._script_codes = script_codes
+            UnicodeAnalyzer._script_names = script_names
+
+            # Plain lists are much faster to index one character at a time
+            UnicodeAnalyzer._script_code_list = script_codes.tolist()
+
+        return cls._script_codes, cls._category_flags, cls._script_names
+
+    def icu_script_codes(self, word: str) -> Counter:
+        """Like `icu_scripts`, but counts ICU script codes using the lookup
+        table instead of calling ICU for every character."""
+
+        self.icu_script_table()
+        script_codes = self._script_code_list
+        category_flags = self._category_flag_list
+        skip_flags = self.skip_flags
 
         return Counter(
-            self.get_icu_script(c)
+            script_codes[codepoint]
 
-            for c in self.maybe_strip(word)
+            for codepoint in map(ord, self.maybe_strip(word))
 
-            if self.get_icu_script(c)
-            and self.punctuation_cond(c)
-            and self.digit_cond(c)
+            if not category_flags[codepoint] & skip_flags
+        )
+
+    def icu_scripts(self, word: str) -> Counter:
+        script_names = self.icu_script_table()[2]
+
+        return Counter(
+            {
+                script_names[script_code]: count
+                for script_code, count in self.icu_script_codes(word).items()
+            }
         )
 
     def most_common_icu_script(self, word: str) -> str:
         try:
-            return self.icu_scripts(word).most_common(1)[0][0]
+            script_code = self.icu_script_codes(word).most_common(1)[0][0]
         except IndexError:
             return ""
 
+        return self._script_names[script_code]
+
     def icu_script_histogram(
         self,
         word: str,
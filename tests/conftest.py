@@ -0,0 +1,6 @@
+import sys
+from pathlib import Path
+
+# The scripts import each other as top-level modules, e.g. `from util import
+# read`, because they are run as `python scripts/...`
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "scripts"))
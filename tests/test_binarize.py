@@ -0,0 +1,103 @@
+import filecmp
+import os
+import random
+import struct
+import subprocess
+import sys
+
+import pytest
+
+from util.binarize import MMAP_INDEX_MAGIC, binarize_corpus
+
+SPLIT_SIZES = {"train": 200, "dev": 20, "test": 20}
+
+
+def write_corpus(folder, n_symbols: int, seed: int = 1917) -> None:
+    """Writes {train,dev,test}.{src,tgt} with about `n_symbols` distinct
+    tokens on each side. Token counts are skewed so that the dictionary
+    ordering has both count differences and ties, dev/test contain unknown
+    tokens and some lines have irregular whitespace or are empty."""
+
+    rng = random.Random(seed)
+    folder.mkdir(parents=True, exist_ok=True)
+    vocab = [f"w{i}" for i in range(n_symbols)]
+
+    for lang in ["src", "tgt"]:
+        train_tokens = vocab + rng.choices(vocab[:50], k=2000)
+        rng.shuffle(train_tokens)
+        n_lines = SPLIT_SIZES["train"]
+        lines = [train_tokens[i::n_lines] for i in range(n_lines)]
+
+        with open(folder / f"train.{lang}", "w", encoding="utf-8") as f:
+            for i, tokens in enumerate(lines):
+                sep = "  " if i % 7 == 0 else " "
+                f.write(sep.join(tokens) + ("\t\n" if i % 11 == 0 else "\n"))
+
+        for split in ["dev", "test"]:
+            with open(folder / f"{split}.{lang}", "w", encoding="utf-8") as f:
+                for i in range(SPLIT_SIZES[split]):
+                    tokens = rng.choices(vocab, k=rng.randint(0, 8))
+                    if i % 5 == 0:
+                        tokens.append(f"unseen{i}")
+                    f.write(" ".join(tokens) + "\n")
+
+
+def index_dtype_code(path) -> int:
+    with open(path, "rb") as f:
+        assert f.read(len(MMAP_INDEX_MAGIC)) == MMAP_INDEX_MAGIC
+        f.read(8)
+        (code,) = struct.unpack("<B", f.read(1))
+
+    return code
+
+
+@pytest.mark.parametrize("n_symbols", [100, 70000])
+def test_binarize_corpus_matches_fairseq_preprocess(tmp_path, n_symbols):
+    pytest.importorskip("fairseq")
+
+    text_folder = tmp_path / "text"
+    fairseq_folder = tmp_path / "fairseq"
+    our_folder = tmp_path / "ours"
+    write_corpus(text_folder, n_symbols)
+    our_folder.mkdir()
+
+    subprocess.run(
+        [
+            sys.executable,
+            "-m",
+            "fairseq_cli.preprocess",
+            "--source-lang",
+            "src",
+            "--target-lang",
+            "tgt",
+            "--trainpref",
+            str(text_folder / "train"),
+            "--validpref",
+            str(text_folder / "dev"),
+            "--testpref",
+            str(text_folder / "test"),
+            "--destdir",
+            str(fairseq_folder),
+        ],
+        check=True,
+        capture_output=True,
+    )
+    binarize_corpus(str(text_folder), str(our_folder))
+
+    expected = sorted(set(os.listdir(fairseq_folder)) - {"preprocess.log"})
+    assert sorted(os.listdir(our_folder)) == expected
+
+    _, mismatch, errors = filecmp.cmpfiles(
+        fairseq_folder, our_folder, expected, shallow=False
+    )
+    assert mismatch == [] and errors == []
+
+
+def test_binarize_corpus_large_vocab_uses_uint32(tmp_path):
+    text_folder = tmp_path / "text"
+    write_corpus(text_folder, 70000)
+    binarize_corpus(str(text_folder), str(tmp_path))
+
+    for split in ["train", "valid", "test"]:
+        for lang in ["src", "tgt"]:
+            assert index_dtype_code(tmp_path / f"{split}.src-tgt.{lang}.idx") == 9
@@ -0,0 +1,242 @@
+import json
+import os
+import random
+
+import pytest
+import sacrebleu
+from click.testing import CliRunner
+
+import evaluate
+from evaluate import (
+    BOOTSTRAP_METRICS,
+    UNKNOWN_LANGUAGE,
+    CachedExperimentResults,
+    ExperimentResults,
+    SentenceStatistics,
+    SufficientStatistics,
+    compare_systems,
+    paired_bootstrap,
+    records_from_fairseq_generate,
+    score_with_cache,
+)
+
+GENERATE_OUTPUT = """\
+2026-01-01 | INFO | fairseq_cli.generate | loading model
+S-1\tK i e v
+T-1\tK y i v
+H-1\t-0.25\tK i e v
+S-0\t<de> K ö l n
+T-0\tC o l o g n e
+H-0\t-0.10\tC o l o g n e
+S-2\t<Latin> L y o n
+T-2\tL y o n
+H-2\t-0.05\tL y o n
+"""
+
+
+def test_records_from_fairseq_generate_untagged_sources(tmp_path, capsys):
+    generate_path = tmp_path / "test.out"
+    generate_path.write_text(GENERATE_OUTPUT, encoding="utf-8")
+
+    records = list(records_from_fairseq_generate(str(generate_path)))
+
+    assert [lang for *_, lang in records] == ["de", UNKNOWN_LANGUAGE, "Latin"]
+    assert records[1] == ("K i e v", "K y i v", "K i e v", UNKNOWN_LANGUAGE)
+    assert "1 of 3 sources have no language tag" in capsys.readouterr().err
+
+
+def random_names(rng: random.Random, n: int) -> list:
+    return [" ".join(rng.choices("abcdeéαβ.,", k=rng.randint(0, 12))) for _ in range(n)]
+
+
+def test_bleu_from_statistics_matches_corpus_bleu():
+    rng = random.Random(1917)
+    references = random_names(rng, 500)
+    hypotheses = [
+        ref if rng.random() < 0.3 else hyp
+        for ref, hyp in zip(references, random_names(rng, 500))
+    ]
+    expected = sacrebleu.corpus_bleu(hypotheses, [references], force=True).score
+
+    statistics = SentenceStatistics.from_pairs(references, hypotheses)
+    assert 100 * statistics.sum().bleu_score() == pytest.approx(expected, abs=1e-9)
+
+    # Statistics of chunks add up to those of the whole corpus
+    merged = SufficientStatistics()
+
+    for start in range(0, 500, 128):
+        merged.merge(statistics.take(list(range(start, min(start + 128, 500)))).sum())
+
+    assert 100 * merged.bleu_score() == pytest.approx(expected, abs=1e-9)
+
+
+def noisy_copies(rng: random.Random, references: list, error_rate: float) -> list:
+    return [
+        " ".join(
+            rng.choice("abcdeéαβ.,") if rng.random() < error_rate else char
+            for char in ref.split()
+        )
+        for ref in references
+    ]
+
+
+def test_paired_bootstrap_identical_systems():
+    rng = random.Random(1917)
+    references = random_names(rng, 300)
+    statistics = SentenceStatistics.from_pairs(
+        references, noisy_copies(rng, references, 0.2)
+    )
+
+    comparison = compare_systems(
+        ["baseline", "same"], [statistics, statistics], groups={}, n_samples=200
+    )
+
+    assert list(comparison.Metric) == BOOTSTRAP_METRICS
+    assert (comparison.Difference == 0).all()
+    assert (comparison.CILow == 0).all() and (comparison.CIHigh == 0).all()
+    assert (comparison.PValue > 0.99).all()
+
+
+def test_paired_bootstrap_clear_gap():
+    rng = random.Random(1917)
+    references = [name for name in random_names(rng, 600) if name]
+    statistics = [
+        SentenceStatistics.from_pairs(
+            references, noisy_copies(rng, references, error_rate)
+        )
+        for error_rate in [0.02, 0.3]
+    ]
+    baseline, system = [s.sum().metrics("global") for s in statistics]
+    expected = {
+        "Accuracy": system.word_acc - baseline.word_acc,
+        "CER": system.character_error_rate - baseline.character_error_rate,
+        "F1": system.mean_f1 - baseline.mean_f1,
+    }
+
+    observed, resampled = paired_bootstrap(statistics, n_samples=500)
+
+    assert all(resampled[metric].shape == (500, 2) for metric in BOOTSTRAP_METRICS)
+
+    for metric in BOOTSTRAP_METRICS:
+        difference = observed[metric][1] - observed[metric][0]
+        assert difference == pytest.approx(expected[metric], abs=1e-4)
+
+    comparison = compare_systems(
+        ["baseline", "system"], statistics, groups={}, n_samples=500
+    ).set_index("Metric")
+
+    for metric in BOOTSTRAP_METRICS:
+        row = comparison.loc[metric]
+        assert row.Difference == pytest.approx(expected[metric], abs=1e-3)
+        assert row.CILow <= row.Difference <= row.CIHigh
+        assert not row.CILow <= 0 <= row.CIHigh
+        assert row.PValue < 0.01
+
+
+def write_experiment(folder, hypotheses: list) -> list:
+    paths = [folder / name for name in ["gold", "hyps", "source", "languages"]]
+    columns = [
+        ["K y i v", "C o l o g n e", "L y o n"],
+        hypotheses,
+        ["К и е в", "K ö l n", "L y o n"],
+        ["ru", "de", "fr"],
+    ]
+
+    for path, lines in zip(paths, columns):
+        path.write_text("".join(f"{line}\n" for line in lines), encoding="utf-8")
+
+    return [str(path) for path in paths]
+
+
+def test_score_with_cache(tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    references, hypotheses, source, languages = write_experiment(
+        tmp_path, ["K i e v", "C o l o g n e", "L y o n"]
+    )
+    input_paths = [references, hypotheses, languages]
+    scored = []
+
+    def score():
+        results = ExperimentResults.from_paths(
+            references_path=references,
+            hypotheses_path=hypotheses,
+            source_path=source,
+            languages_path=languages,
+        )
+        scored.append(results)
+
+        return results
+
+    def score_cached():
+        return score_with_cache(
+            score, input_paths, cache_dir=cache_dir, max_cache_bytes=1 << 20
+        )
+
+    miss = score_cached()
+    (cache_file,) = (tmp_path / "cache").glob("*.json")
+    os.utime(cache_file, (1000, 1000))
+    hit = score_cached()
+
+    # A hit touches the entry, so that `prune_cache` evicts it last
+    assert len(scored) == 1
+    assert cache_file.stat().st_mtime > 1000
+    assert isinstance(hit, CachedExperimentResults)
+    assert hit.languages == list(miss.languages)
+
+    for lang in [*miss.languages, "global"]:
+        assert hit.metrics(lang) == miss.metrics(lang)
+
+    # Editing the hypotheses invalidates the entry
+    write_experiment(tmp_path, ["K y i v", "C o l o g n e", "L y o n"])
+    edited = score_cached()
+
+    assert len(scored) == 2
+    assert edited.metrics("global").word_acc == 100.0
+    assert edited.metrics("global") != miss.metrics("global")
+    assert len(list((tmp_path / "cache").glob("*.json"))) == 2
+
+
+def test_no_cache_skips_reading_and_writing_the_cache(tmp_path):
+    cache_dir = tmp_path / "cache"
+    references, hypotheses, source, languages = write_experiment(
+        tmp_path, ["K i e v", "C o l o g n e", "L y o n"]
+    )
+
+    def run(*args):
+        result = CliRunner().invoke(
+            evaluate.main,
+            [
+                "--ref",
+                references,
+                "--hyp",
+                hypotheses,
+                "--src",
+                source,
+                "--langs",
+                languages,
+                "--cache-dir",
+                str(cache_dir),
+                "--output-as-json",
+                "--score",
+                str(tmp_path / "scores.json"),
+                *args,
+            ],
+        )
+        assert result.exit_code == 0, result.output
+
+        with open(tmp_path / "scores.json", encoding="utf-8") as f:
+            return json.load(f)
+
+    run("--no-cache")
+    assert not cache_dir.exists()
+
+    # Tamper with the cached scores, which only a cache read would return
+    scores = run()
+    (cache_file,) = cache_dir.glob("*.json")
+    entry = json.loads(cache_file.read_text(encoding="utf-8"))
+    entry["metrics"]["global"]["word_acc"] = -1.0
+    cache_file.write_text(json.dumps(entry), encoding="utf-8")
+
+    assert run()["global"]["Accuracy"] == -1.0
+    assert run("--no-cache") == scores
+    assert json.loads(cache_file.read_text(encoding="utf-8")) == entry
@@ -0,0 +1,335 @@
+import random
+
+import numpy as np
+import pandas as pd
+import pytest
+from click.testing import CliRunner
+
+import prep_parallel_data
+import swap_src_tgt
+from prep_parallel_data import (
+    TAG_CONDITIONS,
+    add_hash_split_column,
+    convert_dump_into_rows,
+    count_names_per_lang,
+    filter_dump,
+    get_hash_splits,
+    get_sampling_priorities,
+    read_dump_low_memory,
+    sample_by_priority,
+    segment_characters,
+    write_tag_conditions,
+)
+
+# The second row has no detectable script (only digits and punctuation), so
+# its script tag is the empty `<>`, which swap_src_tgt.py moves to the target
+ROWS = {
+    "train": [
+        ("ru", "PER", "Cyrillic", "К и е в", "K y i v", "Q1899"),
+        ("de", "ORG", "", "1 8 6 0 .", "1 8 6 0 .", "Q2"),
+        ("ja", "LOC", "Han", "東 京", "T o k y o", "Q1490"),
+    ],
+    "dev": [("el", "LOC", "Greek", "Α θ ή ν α", "A t h e n s", "Q1524")],
+}
+
+
+def read_lines(path) -> list:
+    with open(path, encoding="utf-8") as f:
+        return f.read().splitlines()
+
+
+@pytest.mark.parametrize("tags", TAG_CONDITIONS)
+def test_write_tag_conditions_reverse_matches_swap_src_tgt(tmp_path, tags):
+    write_tag_conditions(
+        ROWS,
+        [tags],
+        output_folder=str(tmp_path),
+        corpus_prefix="fwd",
+        normalization="none",
+        filter_out_english=True,
+        reverse_corpus_prefix="rev",
+    )
+
+    for split in ROWS:
+        forward = tmp_path / f"fwd-{tags}" / "none_normalized_noeng" / split
+        reverse = tmp_path / f"rev-{tags}" / "none_normalized_noeng" / split
+        swapped = tmp_path / "swapped" / split
+
+        result = CliRunner().invoke(
+            swap_src_tgt.main,
+            [
+                "--src-input-file",
+                f"{forward}.src",
+                "--tgt-input-file",
+                f"{forward}.tgt",
+                "--src-output-file",
+                f"{swapped}.src",
+                "--tgt-output-file",
+                f"{swapped}.tgt",
+            ],
+        )
+        assert result.exit_code == 0, result.output
+
+        for ext in ["src", "tgt"]:
+            assert read_lines(f"{reverse}.{ext}") == read_lines(f"{swapped}.{ext}")
+
+
+def test_convert_dump_into_rows_segments_each_row_once(monkeypatch):
+    # Names ending in "!" fail to segment, so their slots under the cap go to
+    # later rows, which takes several rounds for "fr"
+    names = {
+        "de": ["Köln", "Bonn!", "Mainz"],
+        "fr": ["Lyon!", "Nice!", "Lille!", "Metz", "Caen"],
+    }
+    dump = pd.DataFrame(
+        [
+            (lang, "LOC", label, f"{label}-en", f"Q{lang}{i}", "train")
+            for lang, labels in names.items()
+            for i, label in enumerate(labels)
+        ],
+        columns=["language", "type", "label", "eng", "wikidata_id", "split"],
+    )
+
+    def failing_segment_characters(words):
+        if any(word.endswith("!") for word in words):
+            raise ValueError(words)
+
+        return segment_characters(words)
+
+    segmented_ids = []
+    real_segment_dump = prep_parallel_data.segment_dump
+
+    def recording_segment_dump(dump, **kwargs):
+        segmented_ids.extend(dump["wikidata_id"])
+
+        return real_segment_dump(dump, **kwargs)
+
+    monkeypatch.setattr(
+        prep_parallel_data, "segment_characters", failing_segment_characters
+    )
+    monkeypatch.setattr(prep_parallel_data, "segment_dump", recording_segment_dump)
+
+    output_rows, _ = convert_dump_into_rows(
+        dump,
+        "language",
+        "type",
+        "label",
+        "eng",
+        "wikidata_id",
+        detect_script=False,
+        max_names_per_lang_train=2,
+    )
+
+    kept = sorted((row[0], row[-1]) for row in output_rows["train"])
+    assert kept == [("de", "Qde0"), ("de", "Qde2"), ("fr", "Qfr3"), ("fr", "Qfr4")]
+    assert len(segmented_ids) == len(set(segmented_ids))
+
+
+def write_dump(path, rows) -> None:
+    pd.DataFrame(
+        rows, columns=["language", "type", "label", "eng", "wikidata_id"]
+    ).to_csv(path, sep="\t", index=False)
+
+
+def read_corpus(folder) -> dict:
+    return {
+        split: sorted(
+            zip(
+                *(
+                    read_lines(folder / f"{split}.{ext}")
+                    for ext in ["languages", "src", "tgt", "ids"]
+                )
+            )
+        )
+        for split in ["train", "dev", "test"]
+    }
+
+
+@pytest.mark.parametrize(
+    "sampling_mode,caps",
+    [("shuffle", [0, 0, 0]), ("priority", [0, 0, 0]), ("priority", [12, 3, 3])],
+)
+def test_update_corpus_incrementally_matches_full_rebuild(
+    tmp_path, sampling_mode, caps
+):
+    rng = random.Random(1917)
+    languages = ["de", "fr", "ru", "en"]
+
+    def names(label):
+        return [
+            (lang, rng.choice(["PER", "LOC", "ORG"]), f"{label}{lang}")
+            for lang in rng.sample(languages, rng.randint(1, 3))
+        ]
+
+    # Every tenth ID is removed, 30 are added and 25 are changed
+    previous = {f"Q{i}": names(f"Q{i}") for i in range(150)}
+    dump = {wid: rows for wid, rows in previous.items() if int(wid[1:]) % 10 != 0}
+
+    for i in range(150, 180):
+        dump[f"Q{i}"] = names(f"Q{i}")
+
+    for wid in rng.sample([wid for wid in dump if wid in previous], 25):
+        dump[wid] = names(f"{wid}x")
+
+    previous_dump = tmp_path / "previous.tsv"
+    dump_file = tmp_path / "dump.tsv"
+    write_dump(
+        previous_dump,
+        [(*row, f"{row[2]}-en", wid) for wid, rows in previous.items() for row in rows],
+    )
+    write_dump(
+        dump_file,
+        [(*row, f"{row[2]}-en", wid) for wid, rows in dump.items() for row in rows],
+    )
+
+    def build(dump_path, output_folder, *args):
+        result = CliRunner().invoke(
+            prep_parallel_data.main,
+            [
+                "--dump-file",
+                str(dump_path),
+                "--output-folder",
+                str(output_folder),
+                "--stats-file",
+                str(output_folder / "parallel_data_stats.tsv"),
+                "--wikidata-id-splits-file",
+                str(output_folder / "wikidata_id_splits.json"),
+                "--normalization",
+                "none",
+                "--filter-out-english",
+                "--include-language-tag",
+                "--include-type-tag",
+                "--split-mode",
+                "hash",
+                "--sampling-mode",
+                sampling_mode,
+                "--max-names-per-lang-train",
+                str(caps[0]),
+                "--max-names-per-lang-dev",
+                str(caps[1]),
+                "--max-names-per-lang-test",
+                str(caps[2]),
+                *args,
+            ],
+        )
+        assert result.exit_code == 0, result.output
+
+        return output_folder / "none_normalized_noeng"
+
+    previous_folder = build(previous_dump, tmp_path / "previous")
+    incremental_folder = build(
+        dump_file,
+        tmp_path / "incremental",
+        "--previous-dump-file",
+        str(previous_dump),
+        "--previous-output-folder",
+        str(previous_folder),
+        "--previous-wikidata-id-splits-file",
+        str(tmp_path / "previous" / "wikidata_id_splits.json"),
+    )
+    full_folder = build(dump_file, tmp_path / "full")
+
+    assert read_corpus(incremental_folder) == read_corpus(full_folder)
+    assert read_lines(tmp_path / "incremental" / "parallel_data_stats.tsv") == (
+        read_lines(tmp_path / "full" / "parallel_data_stats.tsv")
+    )
+
+    if any(caps):
+        # Names were left out by the caps, so the update has to reconsider them
+        stats = pd.read_csv(tmp_path / "full" / "parallel_data_stats.tsv", sep="\t")
+        assert (stats.new_count < stats.orig_count).any()
+
+
+@pytest.mark.parametrize("chunksize", [37, 10000])
+def test_read_dump_low_memory_matches_priority_sampling(tmp_path, chunksize):
+    rng = random.Random(1917)
+    rows = []
+
+    for i in range(300):
+        for lang in rng.sample(["de", "fr", "ru", "en", "ja"], rng.randint(1, 3)):
+            eng = rng.choice([f"Q{i}{lang}-en", f"Q{i}{lang}-en", f"Q{i}"])
+            rows.append((lang, rng.choice(["PER", "LOC"]), f"Q{i}{lang}", eng, f"Q{i}"))
+
+    dump_file = tmp_path / "dump.tsv"
+    write_dump(dump_file, rows)
+    columns = ["language", "type", "label", "eng", "wikidata_id"]
+    thresholds = {"train": 40, "dev": 5, "test": 5}
+
+    sampled, id_to_split, orig_n_names_per_lang = read_dump_low_memory(
+        str(dump_file),
+        *columns,
+        split_column="split",
+        train_frac=0.8,
+        dev_frac=0.1,
+        test_frac=0.1,
+        chunksize=chunksize,
+        split_mode="hash",
+        max_names_thresholds=thresholds,
+    )
+
+    dump, expected_id_to_split = add_hash_split_column(
+        pd.read_csv(dump_file, sep="\t"),
+        wikidata_id_column="wikidata_id",
+        split_column="split",
+        train_frac=0.8,
+        dev_frac=0.1,
+        test_frac=0.1,
+    )
+    dump = filter_dump(
+        dump,
+        language_column="language",
+        tgt_column="eng",
+        wikidata_id_column="wikidata_id",
+    )
+    expected, _ = sample_by_priority(
+        dump,
+        get_sampling_priorities(dump, columns),
+        language_column="language",
+        split_column="split",
+        max_names_thresholds=thresholds,
+    )
+
+    assert len(expected) < len(dump)
+    assert sampled.astype(str).values.tolist() == (
+        expected[sampled.columns].astype(str).values.tolist()
+    )
+    assert id_to_split == expected_id_to_split
+    assert orig_n_names_per_lang == count_names_per_lang(
+        dump, language_column="language", split_column="split"
+    )
+
+
+@pytest.mark.parametrize("fracs", [(0.8, 0.1, 0.1), (0.6, 0.3, 0.1)])
+def test_get_hash_splits(fracs):
+    rng = random.Random(1917)
+    wikidata_ids = [f"Q{i}" for i in rng.sample(range(10**7), 5000)]
+    train_frac, dev_frac, test_frac = fracs
+
+    def splits(ids, random_seed=1917):
+        codes = get_hash_splits(
+            ids,
+            train_frac=train_frac,
+            dev_frac=dev_frac,
+            test_frac=test_frac,
+            random_seed=random_seed,
+        )
+
+        return dict(zip(ids, codes.tolist()))
+
+    expected = splits(wikidata_ids)
+
+    # A row's split depends neither on the order of the IDs nor on the others
+    shuffled = rng.sample(wikidata_ids, len(wikidata_ids))
+    subset = rng.sample(wikidata_ids, 100) + [f"P{i}" for i in range(500)]
+    assert splits(shuffled) == expected
+    assert {wid: split for wid, split in splits(subset).items() if wid in expected} == {
+        wid: expected[wid] for wid in subset[:100]
+    }
+
+    codes = np.array(list(expected.values()))
+    assert np.bincount(codes, minlength=3) / len(codes) == pytest.approx(
+        fracs, abs=0.02
+    )
+
+    # Another seed gives another assignment
+    assert splits(wikidata_ids, random_seed=1918) != expected
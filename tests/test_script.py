@@ -0,0 +1,79 @@
+import random
+from collections import Counter
+
+import pytest
+
+pytest.importorskip("icu")
+
+from util.script import UnicodeAnalyzer  # noqa: E402
+
+BMP = range(0x10000)
+
+SETTINGS = [
+    dict(strip=strip, ignore_punctuation=punctuation, ignore_numbers=numbers)
+    for strip, punctuation, numbers in [
+        (False, False, False),
+        (True, True, False),
+        (False, False, True),
+        (True, True, True),
+    ]
+]
+
+WORDS = [
+    "",
+    "  ",
+    "Kyiv",
+    "  Київ 2024!  ",
+    "東京タワー",
+    "Москва-Сити",
+    "محمد ١٢٣",
+    "Ελλάδα (GR)",
+    "서울특별시",
+    "ab-αβ",
+    "...",
+]
+
+
+def per_character_scripts(ua: UnicodeAnalyzer, word: str) -> Counter:
+    """`UnicodeAnalyzer.icu_scripts` as it was before the lookup table, one
+    ICU call per character"""
+
+    return Counter(
+        ua.get_icu_script(c)
+        for c in ua.maybe_strip(word)
+        if ua.get_icu_script(c) and ua.punctuation_cond(c) and ua.digit_cond(c)
+    )
+
+
+def per_character_most_common(ua: UnicodeAnalyzer, word: str) -> str:
+    try:
+        return per_character_scripts(ua, word).most_common(1)[0][0]
+    except IndexError:
+        return ""
+
+
+@pytest.mark.parametrize("settings", SETTINGS)
+def test_icu_scripts_match_icu_across_bmp(settings):
+    ua = UnicodeAnalyzer(**settings)
+
+    mismatches = [
+        codepoint
+        for codepoint in BMP
+        if ua.icu_scripts(chr(codepoint)) != per_character_scripts(ua, chr(codepoint))
+    ]
+
+    assert mismatches == []
+
+
+@pytest.mark.parametrize("settings", SETTINGS)
+def test_icu_scripts_match_icu_on_strings(settings):
+    ua = UnicodeAnalyzer(**settings)
+    rng = random.Random(1917)
+    words = WORDS + [
+        "".join(chr(rng.choice(BMP)) for _ in range(rng.randint(1, 12)))
+        for _ in range(2000)
+    ]
+
+    for word in words:
+        assert ua.icu_scripts(word) == per_character_scripts(ua, word)
+        assert ua.most_common_icu_script(word) == per_character_most_common(ua, word)
@@ -0,0 +1,188 @@
+import os
+import threading
+
+import pytest
+
+from util import parallel_map, prune_cache, read
+
+
+def fail_on_seven(x: int) -> int:
+    if x == 7:
+        raise ValueError("seven")
+
+    return x
+
+
+def square(x: int) -> int:
+    return x * x
+
+
+def square_all(xs: list) -> list:
+    return [x * x for x in xs]
+
+
+def run_with_timeout(func, timeout: float = 60) -> dict:
+    """Runs `func` in a daemon thread, so that a deadlock fails the test
+    instead of hanging it"""
+
+    outcome = {}
+
+    def target():
+        try:
+            outcome["result"] = func()
+        except Exception as e:
+            outcome["error"] = e
+
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), "parallel_map deadlocked"
+
+    return outcome
+
+
+@pytest.mark.parametrize("ordered", [True, False])
+def test_parallel_map_worker_error_with_max_pending(ordered):
+    outcome = run_with_timeout(
+        lambda: list(
+            parallel_map(
+                fail_on_seven,
+                range(100),
+                chunk_size=1,
+                workers=2,
+                ordered=ordered,
+                max_pending=4,
+            )
+        )
+    )
+
+    assert isinstance(outcome.get("error"), ValueError)
+
+
+def test_parallel_map_closed_early_with_max_pending():
+    def take_some():
+        results = parallel_map(
+            fail_on_seven, range(5), chunk_size=1, workers=2, max_pending=2
+        )
+        first = next(results)
+        results.close()
+
+        return first
+
+    assert run_with_timeout(take_some) == {"result": 0}
+
+
+@pytest.mark.parametrize("max_pending", [None, 3])
+@pytest.mark.parametrize("workers", [1, 3])
+def test_parallel_map_ordered(workers, max_pending):
+    results = parallel_map(
+        square,
+        iter(range(1000)),
+        chunk_size=7,
+        workers=workers,
+        max_pending=max_pending,
+    )
+
+    assert list(results) == [x * x for x in range(1000)]
+
+
+@pytest.mark.parametrize("max_pending", [None, 3])
+def test_parallel_map_unordered(max_pending):
+    results = parallel_map(
+        square,
+        range(1000),
+        chunk_size=7,
+        workers=3,
+        ordered=False,
+        max_pending=max_pending,
+    )
+
+    assert sorted(results) == [x * x for x in range(1000)]
+
+
+@pytest.mark.parametrize("workers", [1, 3])
+def test_parallel_map_batched(workers):
+    results = parallel_map(
+        square_all, range(1000), chunk_size=7, workers=workers, batched=True
+    )
+
+    assert list(results) == [x * x for x in range(1000)]
+
+
+@pytest.mark.parametrize("batched", [False, True])
+def test_parallel_map_workers_equivalent(batched):
+    fn = square_all if batched else square
+    single = list(parallel_map(fn, range(1000), chunk_size=7, batched=batched))
+    pooled = list(
+        parallel_map(fn, range(1000), chunk_size=7, workers=4, batched=batched)
+    )
+
+    assert single == pooled
+
+
+@pytest.mark.parametrize("ordered", [True, False])
+@pytest.mark.parametrize("workers", [1, 2])
+def test_parallel_map_worker_error(workers, ordered):
+    with pytest.raises(ValueError, match="seven"):
+        list(
+            parallel_map(
+                fail_on_seven,
+                range(100),
+                chunk_size=3,
+                workers=workers,
+                ordered=ordered,
+            )
+        )
+
+
+def test_read_with_cache_keeps_files_with_the_same_name_apart(tmp_path):
+    cache_dir = tmp_path / "cache"
+    inputs = [tmp_path / "a" / "dump.tsv", tmp_path / "b" / "dump.tsv"]
+
+    def cached_labels(input_file) -> list:
+        return read(str(input_file), "tsv", cache_dir=str(cache_dir))["label"].tolist()
+
+    for ix, input_file in enumerate(inputs):
+        input_file.parent.mkdir()
+        input_file.write_text(f"label\tlanguage\nname{ix}\tde\n", encoding="utf-8")
+        cached_labels(input_file)
+
+    assert len(list(cache_dir.glob("*.arrow"))) == 2
+    assert [cached_labels(input_file) for input_file in inputs] == [
+        ["name0"],
+        ["name1"],
+    ]
+
+    # Changing one file only replaces its own cache
+    inputs[0].write_text("label\tlanguage\nchanged\tde\n", encoding="utf-8")
+    cache_before = set(cache_dir.glob("*.arrow"))
+    assert cached_labels(inputs[0]) == ["changed"]
+    cache_after = set(cache_dir.glob("*.arrow"))
+
+    assert len(cache_before - cache_after) == 1
+    assert len(cache_after) == 2
+    assert cached_labels(inputs[1]) == ["name1"]
+
+
+def test_prune_cache_evicts_least_recently_used_first(tmp_path):
+    # Written in this order, each a second apart, then "b" is used again
+    for mtime, name in enumerate(["a", "b", "c", "d"]):
+        path = tmp_path / f"{name}.json"
+        path.write_bytes(b"x" * 100)
+        os.utime(path, (1000 + mtime, 1000 + mtime))
+
+    os.utime(tmp_path / "b.json", (2000, 2000))
+    (tmp_path / "other.arrow").write_bytes(b"x" * 1000)
+
+    prune_cache(str(tmp_path), max_bytes=400, pattern="*.json")
+    assert len(list(tmp_path.glob("*.json"))) == 4
+
+    prune_cache(str(tmp_path), max_bytes=250, pattern="*.json")
+    assert sorted(path.name for path in tmp_path.glob("*")) == [
+        "b.json",
+        "d.json",
+        "other.arrow",
+    ]
+
+    prune_cache(str(tmp_path), max_bytes=100, pattern="*.json")
+    assert sorted(path.name for path in tmp_path.glob("*.json")) == ["b.json"]